@@ -0,0 +1,261 @@
+"""Recommends indexes for the queries the app has run, from the query log.
+
+    python advisor.py --log query_log.jsonl --top 5
+    python advisor.py --log query_log.jsonl --top 3 --apply     # creates the recommended indexes
+
+The log is written when QUERY_LOG_PATH is set. Without --apply nothing is changed.
+"""
+import argparse
+import os
+
+from sqlalchemy import text
+
+import sql
+from guard import estimate_rows_scanned
+from querylog import QueryLog, get_query_log
+from sqltext import predicate_columns, referenced_tables
+
+RANGE_SELECTIVITY = 0.3  # Share of rows a range predicate is assumed to keep without histograms
+
+
+def serves(index_columns, candidate, equality_count):
+    """Whether an index on index_columns serves a candidate whose first equality_count columns are equalities."""
+    index_columns = [name.lower() for name in index_columns]
+    candidate = [name.lower() for name in candidate]
+    if len(index_columns) < len(candidate):
+        return False
+    # Equality columns can come in any order; what follows them must match in order
+    return (set(index_columns[:equality_count]) == set(candidate[:equality_count])
+            and index_columns[equality_count:len(candidate)] == candidate[equality_count:])
+
+
+class IndexAdvisor:
+    """Turns logged queries into ranked CREATE INDEX recommendations.
+
+    Each query's filter and grouping columns give one candidate per table: equality columns first,
+    then one range column (or the GROUP BY columns when there is none), the usual order for a
+    B-tree index. Candidates an existing index already serves are dropped. The rest are scored by
+    the logged time of the queries they serve, times the share of scanned rows they would save:
+    rows scanned now come from EXPLAIN, rows scanned with the index from column cardinalities.
+    """
+
+    def __init__(self, db, query_log, max_columns=3):
+        self.db = db
+        self.engine = db._engine
+        self.query_log = query_log
+        self.max_columns = max_columns
+        self._distinct = {}  # (table, column) -> distinct count
+        self._table_rows = {}
+
+    @classmethod
+    def from_env(cls, db, query_log=None):
+        """Builds an advisor from ADVISOR_* environment variables, reading the process-wide query log by default."""
+        return cls(
+            db,
+            query_log or get_query_log(),
+            max_columns=int(os.environ.get("ADVISOR_MAX_COLUMNS", 3)),
+        )
+
+    def _quote(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def table_rows(self, table):
+        if table not in self._table_rows:
+            snapshot = self.db.stats.snapshot(wait=5)
+            stats = snapshot["tables"].get(table) if snapshot else None
+            if stats and stats["rows"]:
+                self._table_rows[table] = stats["rows"]
+            else:
+                with self.engine.connect() as connection:
+                    self._table_rows[table] = connection.execute(
+                        text(f"SELECT COUNT(*) FROM {self._quote(table)}")
+                    ).scalar()
+        return self._table_rows[table]
+
+    def distinct_values(self, table, column):
+        """Counts a column's distinct values once per run."""
+        key = (table, column)
+        if key not in self._distinct:
+            # A LIMIT sample would follow whatever index the planner scans and see only a few values
+            with self.engine.connect() as connection:
+                self._distinct[key] = connection.execute(
+                    text(f"SELECT COUNT(DISTINCT {self._quote(column)}) FROM {self._quote(table)}")
+                ).scalar() or 1
+        return self._distinct[key]
+
+    def estimate_rows(self, table, columns, equality_count):
+        """Rows an index on columns leaves to read, assuming independent columns."""
+        rows = float(self.table_rows(table))
+        for column in columns[:equality_count]:
+            rows /= self.distinct_values(table, column)
+        if len(columns) > equality_count:
+            rows *= RANGE_SELECTIVITY
+        return max(rows, 1.0)
+
+    def existing_indexes(self, table):
+        """Column lists of the table's indexes and primary key, as reflected by the schema cache."""
+        schema_cache = self.db.schema_cache
+        indexes = [index["columns"] for index in schema_cache.indexes(table)]
+        primary_key = schema_cache.primary_key(table)
+        if primary_key:
+            indexes.append(primary_key)
+        return indexes
+
+    def candidates(self, sql_query):
+        """Returns [(table, columns, equality_count)] for one query."""
+        tables = referenced_tables(sql_query)
+        columns_by_table = {}
+        for table in tables:
+            try:
+                columns_by_table[table] = {name.lower(): name for name in self.db.schema_cache.column_names(table)}
+            except Exception:
+                continue  # A CTE name or a table that no longer exists
+        roles = {}
+        for table, column, role in predicate_columns(sql_query):
+            if table is None:
+                owners = [name for name, columns in columns_by_table.items() if column.lower() in columns]
+                table = owners[0] if len(owners) == 1 else None
+            if table not in columns_by_table or column.lower() not in columns_by_table[table]:
+                continue
+            column = columns_by_table[table][column.lower()]
+            roles.setdefault(table, {"equality": [], "range": [], "group": [], "order": []})
+            if column not in roles[table][role]:
+                roles[table][role].append(column)
+
+        candidates = []
+        for table, columns in roles.items():
+            equality = columns["equality"][:self.max_columns]
+            if not equality and not columns["range"]:
+                continue  # Grouping or ordering alone still reads every row
+            rest = [name for name in columns["range"] if name not in equality][:1]
+            if not rest:
+                rest = [name for name in columns["group"] if name not in equality]
+            candidates.append((table, (equality + rest)[:self.max_columns], len(equality)))
+        return candidates
+
+    def rows_scanned_now(self, sql_query, table):
+        """Rows the current plan reads, from EXPLAIN; SQLite only says whether it scans the whole table."""
+        if self.engine.dialect.name == "sqlite":
+            with self.engine.connect() as connection:
+                plan = [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql_query}"))]
+            for detail in plan:
+                words = [word for word in detail.split() if word != "TABLE"]  # Older SQLite says "SCAN TABLE t"
+                if words[:1] == ["SCAN"] and len(words) > 1 and words[1].strip('"`') == table and "INDEX" not in words:
+                    return self.table_rows(table)
+            # SEARCH through an existing index: estimate what the best existing index leaves to read
+            return None
+        return estimate_rows_scanned(self.engine, sql_query)
+
+    def recommend(self, top=5):
+        """Returns recommendations ranked by estimated seconds saved over the logged history."""
+        recommendations = {}
+        for entry in self.query_log.entries(source="database"):
+            if entry["errors"] == entry["count"]:
+                continue
+            for table, columns, equality_count in self.candidates(entry["sql"]):
+                existing = self.existing_indexes(table)
+                if any(serves(index, columns, equality_count) for index in existing):
+                    continue
+                try:
+                    before = self.rows_scanned_now(entry["sample"], table)
+                    if before is None:
+                        before = min(
+                            [self.estimate_rows(table, index, self._equality_prefix(index, columns, equality_count))
+                             for index in existing] + [float(self.table_rows(table))]
+                        )
+                    after = self.estimate_rows(table, columns, equality_count)
+                except Exception as e:
+                    print(f"Error estimating index benefit: {e}")
+                    continue
+                if not before or after >= before:
+                    continue
+                saved = entry["total_seconds"] * (1 - after / before)
+                key = (table, tuple(columns))
+                recommendation = recommendations.setdefault(key, {
+                    "table": table,
+                    "columns": list(columns),
+                    "statement": self.create_statement(table, columns),
+                    "queries": 0,
+                    "executions": 0,
+                    "logged_seconds": 0.0,
+                    "estimated_seconds_saved": 0.0,
+                    "rows_before": before,
+                    "rows_after": after,
+                    "example": entry["sample"],
+                })
+                recommendation["queries"] += 1
+                recommendation["executions"] += entry["count"]
+                recommendation["logged_seconds"] += entry["total_seconds"]
+                recommendation["estimated_seconds_saved"] += saved
+
+        ranked = sorted(recommendations.values(), key=lambda item: item["estimated_seconds_saved"], reverse=True)
+        # A recommended index also serves any candidate that is its own leading prefix
+        kept = []
+        for recommendation in ranked:
+            covering = next((other for other in kept if other["table"] == recommendation["table"]
+                             and other["columns"][:len(recommendation["columns"])] == recommendation["columns"]), None)
+            if covering is None:
+                kept.append(recommendation)
+                continue
+            for field in ("queries", "executions", "logged_seconds", "estimated_seconds_saved"):
+                covering[field] += recommendation[field]
+        return kept[:top]
+
+    @staticmethod
+    def _equality_prefix(index, columns, equality_count):
+        """How many leading index columns are equality columns of the candidate, i.e. usable for lookups."""
+        equality = {name.lower() for name in columns[:equality_count]}
+        count = 0
+        for name in index:
+            if name.lower() not in equality:
+                break
+            count += 1
+        return count
+
+    def create_statement(self, table, columns):
+        name = f"ix_{table}_{'_'.join(columns)}"[:64]  # MySQL's identifier limit
+        quoted = ", ".join(self._quote(column) for column in columns)
+        return f"CREATE INDEX {self._quote(name)} ON {self._quote(table)} ({quoted})"
+
+    def apply(self, recommendations):
+        """Creates the recommended indexes; returns the statements that succeeded."""
+        applied = []
+        for recommendation in recommendations:
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(text(recommendation["statement"]))
+                applied.append(recommendation["statement"])
+            except Exception as e:
+                print(f"Error creating index: {e}")
+        if applied:
+            self.db.schema_cache.invalidate()
+        return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=os.environ.get("QUERY_LOG_PATH"), help="Query log written via QUERY_LOG_PATH")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--apply", action="store_true", help="Create the recommended indexes")
+    args = parser.parse_args()
+    if not args.log:
+        parser.error("No query log; pass --log or set QUERY_LOG_PATH.")
+
+    _, db_uri = sql.load_environment_variables()
+    advisor = IndexAdvisor.from_env(sql.get_db(db_uri), QueryLog.load(args.log))
+    recommendations = advisor.recommend(args.top)
+    if not recommendations:
+        print("No index recommendations.")
+        return
+    for rank, recommendation in enumerate(recommendations, 1):
+        print(f"{rank}. {recommendation['statement']};")
+        print(f"   {recommendation['queries']} queries, {recommendation['executions']} executions, "
+              f"{recommendation['logged_seconds']:.2f}s logged, ~{recommendation['estimated_seconds_saved']:.2f}s saved; "
+              f"rows read {recommendation['rows_before']:,.0f} -> {recommendation['rows_after']:,.0f}")
+    if args.apply:
+        for statement in advisor.apply(recommendations):
+            print(f"Applied: {statement}")
+
+
+if __name__ == "__main__":
+    main()
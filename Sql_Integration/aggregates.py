@@ -0,0 +1,354 @@
+import os
+import threading
+import time
+import unicodedata
+from decimal import ROUND_HALF_UP, Decimal
+
+from sqlalchemy import text
+
+from schema import get_schema_cache, get_table_versions
+from sqltext import parse_simple_select
+
+
+def mysql_fold(value):
+    """Approximates MySQL 8's default collation, utf8mb4_0900_ai_ci: case- and accent-insensitive.
+
+    It is a NO PAD collation, so unlike the older PAD SPACE ones, trailing spaces still count.
+    """
+    if not isinstance(value, str):
+        return value
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def mysql_average(total, count):
+    """AVG as MySQL returns it for exact numbers: the sum's scale plus div_precision_increment (4) digits.
+
+    MySQL rounds half away from zero. FLOAT and DOUBLE sums come back as floats and are divided as is.
+    """
+    if isinstance(total, float):
+        return total / count
+    total = Decimal(total)
+    scale = max(-total.as_tuple().exponent, 0) + 4
+    return (total / count).quantize(Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP)
+
+
+def _sort_key(value):
+    # NULLs sort first, as in MySQL and SQLite
+    return (value is not None, value)
+
+
+class AggregateCube:
+    """Keeps COUNT/SUM/MIN/MAX per combination of dimension values of one table, in memory.
+
+    The cube is built with one GROUP BY at the finest grain (every dimension); coarser
+    combinations are rolled up from it per query. Every check_interval seconds it is brought up to
+    date: rows appended past the highest key seen are merged in incrementally, and any other
+    change (a new MySQL UPDATE_TIME, or a row count that does not add up) rebuilds it. On every
+    dialect it is also rebuilt once it is older than ttl, so in-place updates the checks cannot see
+    are picked up. Refreshes are built on the side and swapped in whole, so queries keep being
+    answered from the previous cells while the database is read.
+    """
+
+    def __init__(self, engine, table, dimensions, measures, key=None, ttl=300, check_interval=10):
+        self.engine = engine
+        self.table = table
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+        self.key = key
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.incremental_updates = 0
+        # (dimension values) -> {"count": n, measure: [non_null, sum, min, max]}; replaced, never changed in place
+        self._cells = None
+        self._row_count = 0
+        self._max_key = None
+        self._version = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()  # Held by the one thread refreshing the cube
+        self._fold = mysql_fold if engine.dialect.name == "mysql" else (lambda value: value)
+        self._average = mysql_average if engine.dialect.name == "mysql" else (lambda total, count: total / count)
+
+    @classmethod
+    def from_env(cls, engine):
+        """Builds a cube from AGGREGATE_* environment variables, or returns None if disabled or the table is missing."""
+        table = os.environ.get("AGGREGATE_TABLE", "t_shirts")
+        if not table:
+            return None
+        dimensions = [name.strip() for name in os.environ.get("AGGREGATE_DIMENSIONS", "brand,color,size").split(",") if name.strip()]
+        measures = [name.strip() for name in os.environ.get("AGGREGATE_MEASURES", "stock_quantity,price").split(",") if name.strip()]
+        key = os.environ.get("AGGREGATE_KEY", "t_shirt_id") or None
+        try:
+            columns = set(get_schema_cache(engine).column_names(table))
+        except Exception:
+            return None
+        if not set(dimensions + measures) <= columns:
+            return None
+        return cls(
+            engine, table, dimensions, measures,
+            key=key if key in columns else None,
+            ttl=float(os.environ.get("AGGREGATE_TTL", 300)),
+            check_interval=float(os.environ.get("AGGREGATE_CHECK_INTERVAL", 10)),
+        )
+
+    # --- Maintenance ---
+
+    def _quote(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def _load_cells(self, connection, lower_key=None, upper_key=None):
+        """Aggregates the table (or the rows with lower_key < key <= upper_key) at the finest grain."""
+        dimensions = ", ".join(self._quote(name) for name in self.dimensions)
+        measures = "".join(
+            f", COUNT({column}), SUM({column}), MIN({column}), MAX({column})"
+            for column in map(self._quote, self.measures)
+        )
+        query = f"SELECT {dimensions}, COUNT(*){measures} FROM {self._quote(self.table)}"
+        parameters = {}
+        if lower_key is not None:
+            query += f" WHERE {self._quote(self.key)} > :lower AND {self._quote(self.key)} <= :upper"
+            parameters = {"lower": lower_key, "upper": upper_key}
+        cells = {}
+        width = len(self.dimensions)
+        for row in connection.execute(text(f"{query} GROUP BY {dimensions}"), parameters):
+            cell = {"count": row[width]}
+            for index, measure in enumerate(self.measures):
+                cell[measure] = list(row[width + 1 + 4 * index:width + 5 + 4 * index])
+            cells[tuple(row[:width])] = cell
+        return cells
+
+    def _merged(self, cells):
+        """Returns the current cells with cells added, copying the ones that change."""
+        merged = dict(self._cells)
+        for values, delta in cells.items():
+            cell = merged.get(values)
+            if cell is None:
+                merged[values] = delta
+                continue
+            cell = dict(cell, count=cell["count"] + delta["count"])
+            cell.update((measure, list(cell[measure])) for measure in self.measures)
+            for measure in self.measures:
+                current, new = cell[measure], delta[measure]
+                current[0] += new[0]
+                current[1] = new[1] if current[1] is None else current[1] if new[1] is None else current[1] + new[1]
+                current[2] = min((v for v in (current[2], new[2]) if v is not None), default=None)
+                current[3] = max((v for v in (current[3], new[3]) if v is not None), default=None)
+            merged[values] = cell
+        return merged
+
+    def _table_state(self, connection):
+        key = f", MAX({self._quote(self.key)})" if self.key else ""
+        row = connection.execute(text(f"SELECT COUNT(*){key} FROM {self._quote(self.table)}")).fetchone()
+        return row[0], (row[1] if self.key else None)
+
+    def _rebuild(self, connection, version):
+        row_count, max_key = self._table_state(connection)
+        cells = self._load_cells(connection)
+        self._row_count = sum(cell["count"] for cell in cells.values())
+        self._max_key = max_key if row_count == self._row_count else None  # Rows arrived in between; no delta base
+        self._version = version
+        self._built_at = time.time()
+        self._cells = cells
+        self.rebuilds += 1
+
+    def refresh(self):
+        """Brings the cube up to date; called by one thread at a time, at most every check_interval seconds."""
+        now = time.time()
+        self._checked_at = now
+        versions = get_table_versions(self.engine)
+        version = versions.get(self.table) if versions else None
+        with self.engine.connect() as connection:
+            if self._cells is None or now - self._built_at > self.ttl:
+                self._rebuild(connection, version)
+                return
+            # UPDATE_TIME can lag behind writes by up to a day, so it only ever adds a reason to
+            # rebuild; the count and highest key are always checked
+            row_count, max_key = self._table_state(connection)
+            if row_count == self._row_count and max_key == self._max_key:
+                if versions is not None and version != self._version:
+                    self._rebuild(connection, version)  # Same count and key but a new UPDATE_TIME: rows changed in place
+                return
+            if self._max_key is not None and max_key is not None and max_key > self._max_key:
+                delta = self._load_cells(connection, self._max_key, max_key)
+                added = sum(cell["count"] for cell in delta.values())
+                if self._row_count + added == row_count:
+                    self._cells = self._merged(delta)
+                    self._row_count, self._max_key, self._version = row_count, max_key, version
+                    self.incremental_updates += 1
+                    return
+            self._rebuild(connection, version)  # Deletes, or changes the key cannot account for
+
+    def _current_cells(self):
+        cells = self._cells
+        if cells is not None and time.time() - self._checked_at < self.check_interval:
+            return cells
+        # One thread refreshes while the others keep answering from the current cells; only the
+        # first build makes them wait, as there is nothing to answer from yet
+        if not self._lock.acquire(blocking=cells is None):
+            return cells
+        try:
+            if self._cells is None or time.time() - self._checked_at >= self.check_interval:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Error refreshing aggregates: {e}")
+                    if self._cells is None:
+                        raise
+            return self._cells
+        finally:
+            self._lock.release()
+
+    # --- Answering queries ---
+
+    def _plan(self, query):
+        """Checks that query only needs the cube and returns (filters, group_columns), else None."""
+        if query["table"].lower() != self.table.lower() or query["ranges"]:
+            return None  # Only equality filters on dimensions map onto cube cells
+        dimensions = {name.lower(): name for name in self.dimensions}
+        measures = {name.lower(): name for name in self.measures}
+
+        aggregates = [item for item in query["select"] if item["function"]]
+        plain = [item for item in query["select"] if not item["function"]]
+        for item in plain:
+            if item["column"].lower() not in dimensions:
+                return None
+        for item in aggregates:
+            column = item["column"].lower()
+            if item["function"] == "count":
+                if item["distinct"] and column not in dimensions:
+                    return None
+                if column != "*" and column not in dimensions and column not in measures:
+                    return None
+            elif item["distinct"] or column not in measures:
+                return None
+
+        if query["group_by"]:
+            group_columns = [name.lower() for name in query["group_by"]]
+            if any(name not in dimensions for name in group_columns):
+                return None
+            if any(item["column"].lower() not in group_columns for item in plain):
+                return None  # Not a valid grouped query in strict SQL
+        elif aggregates:
+            if plain:
+                return None
+            group_columns = []
+        elif query["distinct"]:
+            group_columns = [item["column"].lower() for item in plain]
+        else:
+            return None  # One row per table row; the cube cannot reproduce that
+
+        filters = []
+        for column, values in query["where"]:
+            if column.lower() not in dimensions or not all(isinstance(value, str) for value in values):
+                return None  # Comparing text to numbers follows each database's own coercion rules
+            filters.append(
+                (self.dimensions.index(dimensions[column.lower()]), {self._fold(value) for value in values})
+            )
+        return filters, [self.dimensions.index(dimensions[name]) for name in group_columns]
+
+    def _aggregate(self, item, cells):
+        function, column = item["function"], item["column"]
+        if function == "count":
+            if column == "*":
+                return sum(cell["count"] for _, cell in cells)
+            if item["distinct"]:
+                index = [name.lower() for name in self.dimensions].index(column.lower())
+                return len({self._fold(values[index]) for values, _ in cells if values[index] is not None})
+            if column.lower() in (name.lower() for name in self.measures):
+                measure = next(name for name in self.measures if name.lower() == column.lower())
+                return sum(cell[measure][0] for _, cell in cells)
+            index = [name.lower() for name in self.dimensions].index(column.lower())
+            return sum(cell["count"] for values, cell in cells if values[index] is not None)
+
+        measure = next(name for name in self.measures if name.lower() == column.lower())
+        stats = [cell[measure] for _, cell in cells if cell[measure][0]]
+        if not stats:
+            return None
+        if function == "min":
+            return min(stat[2] for stat in stats)
+        if function == "max":
+            return max(stat[3] for stat in stats)
+        total = sum(stat[1] for stat in stats)
+        return total if function == "sum" else self._average(total, sum(stat[0] for stat in stats))
+
+    def _order(self, query, rows):
+        """Sorts rows by ORDER BY, or by the group values when there is none; False if a reference is unknown."""
+        names = [item["name"].lower() for item in query["select"]]
+        columns = [item["column"].lower() if not item["function"] else None for item in query["select"]]
+        for reference, descending in reversed(query["order_by"]):
+            if isinstance(reference, int):
+                position = reference - 1 if 0 < reference <= len(names) else None
+            elif reference.lower() in names:
+                position = names.index(reference.lower())
+            elif reference.lower() in columns:
+                position = columns.index(reference.lower())
+            else:
+                position = None
+            if position is None:
+                return False
+            rows.sort(key=lambda row: _sort_key(self._fold(row[position])), reverse=descending)
+        return True
+
+    def answer(self, sql_query):
+        """Returns (column_names, rows) computed from the cube, or None when sql_query cannot be answered from it."""
+        query = parse_simple_select(sql_query)
+        plan = self._plan(query) if query else None
+        if plan is None:
+            self.misses += 1
+            return None
+        filters, group_indexes = plan
+        cells = self._current_cells()
+        matching = [
+            (values, cell) for values, cell in cells.items()
+            if all(self._fold(values[index]) in accepted for index, accepted in filters)
+        ]
+
+        groups = {}
+        for values, cell in matching:
+            group = tuple(values[index] for index in group_indexes)
+            # The database already grouped equal values together, so folding only merges what it would
+            groups.setdefault(tuple(self._fold(value) for value in group), (group, []))[1].append((values, cell))
+        if not group_indexes and not groups and not query["distinct"]:
+            groups[()] = ((), [])  # An aggregate without GROUP BY always returns one row
+
+        rows = []
+        for group, group_cells in sorted(groups.values(), key=lambda entry: [_sort_key(self._fold(value)) for value in entry[0]]):
+            named = dict(zip((self.dimensions[index].lower() for index in group_indexes), group))
+            rows.append(tuple(
+                self._aggregate(item, group_cells) if item["function"] else named[item["column"].lower()]
+                for item in query["select"]
+            ))
+        if not self._order(query, rows):
+            self.misses += 1
+            return None
+        if query["limit"] is not None:
+            rows = rows[:query["limit"]]
+        self.hits += 1
+        return [item["name"] for item in query["select"]], rows
+
+    def stats(self):
+        """Returns routing hits and misses plus how often the cube was rebuilt or updated incrementally."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cells": len(self._cells or ()),
+            "rebuilds": self.rebuilds,
+            "incremental_updates": self.incremental_updates,
+        }
+
+
+_cubes = {}  # engine URL -> AggregateCube or None, so every database object on an engine shares one
+_cubes_lock = threading.Lock()
+
+
+def get_aggregate_cube(engine):
+    """Returns the shared AggregateCube for engine, or None when aggregates are disabled or unavailable."""
+    key = engine.url.render_as_string(hide_password=False)
+    with _cubes_lock:
+        if key not in _cubes:
+            _cubes[key] = AggregateCube.from_env(engine)
+        return _cubes[key]
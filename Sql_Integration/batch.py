@@ -0,0 +1,202 @@
+"""Answers a file of questions concurrently and streams the results as they finish.
+
+    python batch.py questions.txt --output results.jsonl --rate 2 --burst 5
+    python batch.py questions.txt --output results.parquet
+
+The input has one question per line (blank lines and lines starting with # are skipped), or
+one JSON object with a "question" key per line.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from cache import normalize_question
+from guard import UnsafeQueryError
+from service import QueryService
+
+
+class TokenBucket:
+    """Async token bucket: allows `rate` acquisitions per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def retryable_errors():
+    """Errors from the Gemini client that are worth retrying (rate limits, overload, timeouts)."""
+    errors = [TimeoutError, ConnectionError]
+    try:
+        from google.api_core import exceptions
+        errors += [
+            exceptions.ResourceExhausted, exceptions.TooManyRequests, exceptions.ServiceUnavailable,
+            exceptions.DeadlineExceeded, exceptions.InternalServerError,
+        ]
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+class BatchRunner:
+    """Schedules Gemini calls through a token bucket with jittered exponential backoff on top of QueryService."""
+
+    def __init__(self, service, rate=1.0, burst=1, retries=5, base_delay=1.0, max_delay=60.0):
+        self.service = service
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = retryable_errors()
+
+    async def generate_sql(self, question):
+        # Templated questions are answered locally and do not spend rate limit tokens
+        sql_query = await self.service.fast_path_sql(question)
+        if sql_query is not None:
+            return sql_query
+        # So are questions the response cache already holds; only a Gemini call takes a token
+        prompt = await self.service.build_prompt(question)
+        sql_query = await self.service.cached_sql(question, prompt)
+        if sql_query is not None:
+            return sql_query
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            try:
+                return await self.service.ask_gemini(question, prompt)
+            except self.retryable:
+                if attempt == self.retries:
+                    raise
+                # Full jitter keeps retrying workers from hitting the API in lockstep
+                await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    async def _answer(self, question):
+        try:
+            return await self.service.answer(question, generate=self.generate_sql)
+        except UnsafeQueryError as e:
+            return {"error": f"Query blocked: {e}"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def run(self, questions, writer):
+        """Answers questions (deduplicated) and passes one record per input line to writer as each finishes."""
+        lines_by_key = {}
+        for line_number, question in questions:
+            lines_by_key.setdefault(normalize_question(question), []).append((line_number, question))
+
+        async def answer_group(lines):
+            return lines, await self._answer(lines[0][1])
+
+        tasks = [asyncio.ensure_future(answer_group(lines)) for lines in lines_by_key.values()]
+        print(f"{len(questions)} questions, {len(tasks)} unique")
+        done = 0
+        for finished in asyncio.as_completed(tasks):
+            lines, answer = await finished
+            for line_number, question in lines:
+                writer.write(dict(answer, line=line_number, question=question))
+            done += 1
+            print(f"\r{done}/{len(tasks)} answered", end="", flush=True)
+        print()
+
+
+class JsonLinesWriter:
+    def __init__(self, path):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Writes records as Parquet row groups of batch_size rows; rows are stored as JSON text."""
+
+    def __init__(self, path, batch_size=100):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet output needs pyarrow. Install it with `pip install pyarrow`.")
+        self._pa = pa
+        self._schema = pa.schema([
+            ("line", pa.int64()), ("question", pa.string()), ("sql", pa.string()),
+            ("columns", pa.list_(pa.string())), ("rows", pa.string()), ("truncated", pa.bool_()),
+            ("warnings", pa.list_(pa.string())), ("error", pa.string()), ("seconds", pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._batch_size = batch_size
+        self._pending = []
+
+    def write(self, record):
+        record = dict(record)
+        if "rows" in record:
+            record["rows"] = json.dumps(record["rows"], default=str)
+        self._pending.append({name: record.get(name) for name in self._schema.names})
+        if len(self._pending) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._writer.write_table(self._pa.Table.from_pylist(self._pending, schema=self._schema))
+            self._pending = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def read_questions(path):
+    """Returns [(line_number, question)] from a text or JSON-lines file."""
+    questions = []
+    with open(path, encoding="utf-8") as lines:
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            question = json.loads(line)["question"] if line.startswith("{") else line
+            questions.append((line_number, question))
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="File with one question per line")
+    parser.add_argument("--output", default="results.jsonl", help="Output file (.jsonl or .parquet)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Gemini requests per second")
+    parser.add_argument("--burst", type=int, default=1, help="Requests allowed back to back")
+    parser.add_argument("--retries", type=int, default=5)
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    writer = ParquetWriter(args.output) if args.output.endswith(".parquet") else JsonLinesWriter(args.output)
+
+    async def run():
+        runner = BatchRunner(QueryService.from_env(), rate=args.rate, burst=args.burst, retries=args.retries)
+        await runner.run(questions, writer)
+
+    try:
+        asyncio.run(run())
+    finally:
+        writer.close()
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
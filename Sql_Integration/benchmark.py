@@ -0,0 +1,224 @@
+"""Offline benchmark for the question -> SQL -> DataFrame -> CSV pipeline.
+
+Uses a deterministic stub in place of Gemini and generated SQLite t_shirts fixtures, so runs
+need neither an API key nor the production database:
+
+    python benchmark.py --sizes 1000 100000 1000000 --output bench.json
+    python benchmark.py --compare bench.json      # print p50 changes against an earlier run
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import sql
+from aggregates import get_aggregate_cube
+from metrics import get_metrics
+
+BRANDS = ["Van Huesen", "Levi", "Nike", "Adidas"]
+COLORS = ["Red", "Blue", "Black", "White"]
+SIZES = ["XS", "S", "M", "L", "XL"]
+
+# Question -> SQL the stub model answers with; covers point lookups, aggregates and a full scan
+WORKLOAD = {
+    "How many t-shirts do we have left for Nike in extra small size and white color?":
+        "SELECT SUM(`stock_quantity`) FROM `t_shirts` WHERE `brand` = 'Nike' AND `color` = 'White' AND `size` = 'XS';",
+    "What are the available sizes for Adidas brand?":
+        "SELECT DISTINCT `size` FROM `t_shirts` WHERE `brand` = 'Adidas';",
+    "What is the total stock for each brand?":
+        "SELECT `brand`, SUM(`stock_quantity`) FROM `t_shirts` GROUP BY `brand`;",
+    "Show me all data for black t-shirts":
+        "SELECT * FROM `t_shirts` WHERE `color` = 'Black';",
+    "Show me all t-shirts":
+        "SELECT * FROM `t_shirts`;",
+}
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """Stands in for a Gemini GenerativeModel, answering from WORKLOAD after a fixed delay."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def generate_content(self, parts):
+        if self.latency:
+            time.sleep(self.latency)
+        return StubResponse(WORKLOAD[parts[-1]])
+
+
+def build_fixture(path, rows, seed=0, batch_size=50000):
+    """Creates a SQLite t_shirts table with rows deterministic random rows, reusing an existing file."""
+    if os.path.exists(path):
+        with sqlite3.connect(path) as connection:
+            try:
+                if connection.execute("SELECT COUNT(*) FROM t_shirts").fetchone()[0] == rows:
+                    return path
+            except sqlite3.OperationalError:
+                pass
+        os.remove(path)
+
+    rng = random.Random(seed)
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE t_shirts ("
+            "t_shirt_id INTEGER PRIMARY KEY, brand TEXT NOT NULL, color TEXT NOT NULL, size TEXT NOT NULL, "
+            "price DECIMAL(10, 2) NOT NULL, stock_quantity INTEGER NOT NULL)"
+        )
+        for start in range(0, rows, batch_size):
+            connection.executemany(
+                "INSERT INTO t_shirts VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        row_id + 1,
+                        rng.choice(BRANDS),
+                        rng.choice(COLORS),
+                        rng.choice(SIZES),
+                        rng.randint(7, 50),
+                        rng.randint(0, 100),
+                    )
+                    for row_id in range(start, min(start + batch_size, rows))
+                ],
+            )
+    return path
+
+
+# Stages that handle every result row; the rows of each answering stage are counted separately
+ROW_STAGES = ("row_conversion", "dataframe", "csv_encoding")
+
+
+def run_pipeline(db, model, question):
+    """Runs one question through every stage and returns (result rows, the stage that answered the query).
+
+    Queries the aggregate cube can answer show up as aggregate_lookup rather than sql_execution.
+    """
+    metrics = get_metrics()
+    cube = get_aggregate_cube(db._engine)
+    hits = cube.hits if cube is not None else 0
+    sql_query = sql.get_gemini_response(question, sql.get_prompt(), api_key=None, model=model)
+    df = sql.fetch_frame(db, sql_query)
+    with metrics.stage("csv_encoding"):
+        df.to_csv(index=False)
+    answered_by = "aggregate_lookup" if cube is not None and cube.hits > hits else "sql_execution"
+    return len(df), answered_by
+
+
+def benchmark_size(rows, fixture_dir, repeat, latency):
+    """Benchmarks the workload against a fixture of the given size and returns its report."""
+    path = build_fixture(os.path.join(fixture_dir, f"t_shirts_{rows}.db"), rows)
+    db = sql.get_db(f"sqlite:///{path}")
+    model = StubModel(latency)
+    metrics = get_metrics()
+
+    for question in WORKLOAD:  # Warm up the engine, pool and SQLite page cache
+        run_pipeline(db, model, question)
+    metrics.reset()
+
+    stage_rows = {"aggregate_lookup": 0, "sql_execution": 0}
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for question in WORKLOAD:
+            rows_out, answered_by = run_pipeline(db, model, question)
+            stage_rows[answered_by] += rows_out
+    for name in ROW_STAGES:
+        stage_rows[name] = stage_rows["aggregate_lookup"] + stage_rows["sql_execution"]
+    elapsed = time.perf_counter() - started
+    summary = metrics.summary()
+
+    # Peak memory is measured in a separate pass because tracing slows every allocation down
+    peak_memory = {}
+    for question in WORKLOAD:
+        tracemalloc.start()
+        run_pipeline(db, model, question)
+        peak_memory[question] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 3)
+        tracemalloc.stop()
+    metrics.reset()
+
+    stages = {}
+    for name, stats in summary.items():
+        total = stats["total"]  # Every sample of the timed pass; the mean only covers the metrics window
+        rows_out = stage_rows.get(name)  # None for stages such as gemini_call that handle no rows
+        stages[name] = {
+            "count": stats["count"],
+            "p50_ms": round(stats["p50"] * 1000, 3),
+            "p95_ms": round(stats["p95"] * 1000, 3),
+            "p99_ms": round(stats["p99"] * 1000, 3),
+            "rows_per_second": round(rows_out / total) if rows_out is not None and total else None,
+        }
+    return {
+        "rows": rows,
+        "questions_per_second": round(repeat * len(WORKLOAD) / elapsed, 2),
+        "stages": stages,
+        "peak_memory_mb": peak_memory,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(previous, current):
+    """Prints the p50 change of every stage between two reports."""
+    for size, report in current["sizes"].items():
+        old = previous["sizes"].get(size)
+        if old is None:
+            continue
+        print(f"{size} rows ({previous.get('revision')} -> {current.get('revision')}):")
+        for name, stats in report["stages"].items():
+            if name in old["stages"] and old["stages"][name]["p50_ms"]:
+                change = stats["p50_ms"] / old["stages"][name]["p50_ms"] - 1
+                print(f"  {name:<17} p50 {old['stages'][name]['p50_ms']:>10.3f} -> {stats['p50_ms']:>10.3f} ms ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the workload per size")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated Gemini latency in seconds")
+    parser.add_argument("--fixture-dir", default=os.path.join(tempfile.gettempdir(), "sql_benchmark"))
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare this run against")
+    args = parser.parse_args()
+
+    os.makedirs(args.fixture_dir, exist_ok=True)
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "latency": args.latency,
+        "sizes": {},
+    }
+    for rows in args.sizes:
+        print(f"Benchmarking {rows} rows...")
+        report["sizes"][str(rows)] = benchmark_size(rows, args.fixture_dir, args.repeat, args.latency)
+        for name, stats in report["sizes"][str(rows)]["stages"].items():
+            print(f"  {name:<17} p50 {stats['p50_ms']:>10.3f} ms  p95 {stats['p95_ms']:>10.3f} ms  p99 {stats['p99_ms']:>10.3f} ms")
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as previous:
+            compare(json.load(previous), report)
+
+
+if __name__ == "__main__":
+    main()
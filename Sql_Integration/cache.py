@@ -0,0 +1,293 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from schema import get_table_versions
+from sqltext import normalize_sql, referenced_tables
+
+
+def normalize_question(question):
+    """Lowercases a question, collapses whitespace and drops trailing sentence punctuation, for use as a key.
+
+    Operators and signs stay: "price > 20" and "price < 20", or "-5" and "5", are different questions.
+    """
+    question = " ".join(question.lower().split())
+    return re.sub(r"[\s?!.,;:]+$", "", question)
+
+
+def question_words(question):
+    """Splits a question into lowercase words without punctuation, for fuzzy matching; never use it as a key."""
+    question = question.lower()
+    question = re.sub(r"[^\w\s.]|\.(?!\d)", " ", question)  # Keep decimal points like 10.5
+    return question.split()
+
+
+class ResponseCache:
+    """Caches generated SQL in an in-memory LRU with an optional SQLite tier that survives restarts."""
+
+    def __init__(self, max_entries=512, ttl=24 * 60 * 60, db_path=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory = OrderedDict()  # key -> (value, created_at)
+        self._lock = threading.Lock()
+        self._disk = None
+        if db_path:
+            # Streamlit serves sessions from several threads, so share one connection behind the lock.
+            self._disk = sqlite3.connect(db_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._disk.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Builds a cache from RESPONSE_CACHE_* environment variables."""
+        return cls(
+            max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 512)),
+            ttl=float(os.environ.get("RESPONSE_CACHE_TTL", 24 * 60 * 60)),
+            db_path=os.environ.get("RESPONSE_CACHE_PATH") or None,
+            max_disk_entries=int(os.environ.get("RESPONSE_CACHE_DISK_SIZE", 10000)),
+        )
+
+    @staticmethod
+    def make_key(question, prompt, model_name):
+        """Returns the cache key for a question asked with a given prompt and model."""
+        prompt_hash = hashlib.sha256(prompt[0].encode("utf-8")).hexdigest()
+        raw = json.dumps([normalize_question(question), prompt_hash, model_name])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT value, created_at FROM response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1], now):
+                        self._disk.execute(
+                            "UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        self._disk.commit()
+                        self._remember(key, row[0], row[1])  # Promote to the memory tier
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return row[0]
+                    self._disk.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                    self._disk.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Stores value under key in both tiers."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                if self.ttl is not None:
+                    self._disk.execute("DELETE FROM response_cache WHERE created_at < ?", (now - self.ttl,))
+                # Keep only the most recently used rows on disk
+                self._disk.execute(
+                    "DELETE FROM response_cache WHERE key NOT IN "
+                    "(SELECT key FROM response_cache ORDER BY accessed_at DESC LIMIT ?)",
+                    (self.max_disk_entries,),
+                )
+                self._disk.commit()
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        """Drops every cached entry and resets the counters."""
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM response_cache")
+                self._disk.commit()
+            self.hits = self.misses = self.disk_hits = 0
+
+    def stats(self):
+        """Returns hit/miss counters and the current tier sizes."""
+        with self._lock:
+            disk_entries = None
+            if self._disk is not None:
+                disk_entries = self._disk.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+
+def estimate_result_size(columns, rows):
+    """Approximates the memory held by a result in bytes."""
+    size = sys.getsizeof(rows) + sum(sys.getsizeof(name) for name in columns)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+class ResultCache:
+    """Caches query results by normalized SQL in a memory-bounded LRU.
+
+    Each entry remembers the tables its query reads. On MySQL it is dropped as soon as one of
+    them reports a new UPDATE_TIME/CREATE_TIME in information_schema (checked at most every
+    check_interval seconds, without holding the cache lock). Every entry expires after ttl
+    whatever its versions say, since UPDATE_TIME can lag behind writes (MySQL 8 caches it for
+    information_schema_stats_expiry, a day by default, and it only has one-second resolution).
+    """
+
+    def __init__(self, engine, max_bytes=64 * 1024 * 1024, max_entry_rows=10000, ttl=300, check_interval=5):
+        self.engine = engine
+        self.max_bytes = max_bytes
+        self.max_entry_rows = max_entry_rows
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # key -> dict(columns, rows, versions, created_at, size)
+        self._versions = None
+        self._versions_checked_at = 0.0
+        self._lock = threading.Lock()
+        self._versions_lock = threading.Lock()  # Lets one thread query information_schema while lookups go on
+
+    @classmethod
+    def from_env(cls, engine):
+        """Builds a result cache from RESULT_CACHE_* environment variables."""
+        return cls(
+            engine,
+            max_bytes=int(os.environ.get("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            max_entry_rows=int(os.environ.get("RESULT_CACHE_MAX_ROWS", 10000)),
+            ttl=float(os.environ.get("RESULT_CACHE_TTL", 300)),
+            check_interval=float(os.environ.get("RESULT_CACHE_CHECK_INTERVAL", 5)),
+        )
+
+    @property
+    def max_stream_rows(self):
+        """A stream that reads the whole result anyway keeps results up to this many rows."""
+        return self.max_entry_rows
+
+    def _table_versions(self):
+        """Returns the latest per-table versions, querying information_schema at most every check_interval."""
+        with self._versions_lock:
+            now = time.time()
+            if now - self._versions_checked_at >= self.check_interval:
+                try:
+                    self._versions = get_table_versions(self.engine)
+                except Exception as e:
+                    print(f"Error reading table versions: {e}")
+                    self._versions = None
+                self._versions_checked_at = now
+            return self._versions
+
+    def versions_for(self, tables):
+        """Returns {table: version} for tables, or None if any of them has no version to compare."""
+        current = self._table_versions()
+        if current is None or not tables or any(table not in current for table in tables):
+            return None
+        return {table: current[table] for table in tables}
+
+    def _fresh(self, entry):
+        if time.time() - entry["created_at"] > self.ttl:
+            return False
+        return entry["versions"] is None or self.versions_for(entry["versions"].keys()) == entry["versions"]
+
+    def get(self, sql_query):
+        """Returns (column_names, rows) for sql_query if a fresh result is cached, else None."""
+        key = normalize_sql(sql_query)
+        with self._lock:
+            entry = self._entries.get(key)
+        fresh = entry is not None and self._fresh(entry)  # May query information_schema, so not under the lock
+        with self._lock:
+            if fresh:
+                if self._entries.get(key) is entry:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+                self.bytes_saved += entry["size"]
+                return entry["columns"], entry["rows"]
+            if entry is not None and self._entries.get(key) is entry:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def set(self, sql_query, columns, rows):
+        """Caches a complete result; results over max_entry_rows or a quarter of max_bytes are skipped."""
+        if len(rows) > self.max_entry_rows:
+            return
+        size = estimate_result_size(columns, rows)
+        if size > self.max_bytes // 4:
+            return
+        key = normalize_sql(sql_query)
+        versions = self.versions_for(referenced_tables(sql_query))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                "columns": list(columns),
+                "rows": list(rows),
+                "versions": versions,
+                "created_at": time.time(),
+                "size": size,
+            }
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        self.current_bytes -= self._entries.pop(key)["size"]
+
+    def clear(self):
+        """Drops every cached result."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Returns hit/miss counters, bytes served from cache and current memory use."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+            }
@@ -0,0 +1,54 @@
+import time
+
+from langchain.sql_database import SQLDatabase
+from sqlalchemy import text
+
+from routing import get_router
+from schema import get_schema_cache
+from stats import get_database_stats
+
+
+class CustomSQLDatabase(SQLDatabase):
+    @property
+    def read_engine(self):
+        """The engine metadata reads go to: a read replica when any is usable, else the primary."""
+        router = get_router(self._engine)
+        return router.metadata_engine() if router is not None else self._engine
+
+    @property
+    def schema_cache(self):
+        """The cached schema metadata shared by every database object on this engine."""
+        return get_schema_cache(self.read_engine)
+
+    def get_columns_for_table(self, table_name):
+        """Retrieves column names for a given table from the cached schema snapshot."""
+        return self.schema_cache.column_names(table_name)
+
+    def get_table_count(self):
+        """Returns the number of tables in the database."""
+        return len(self.schema_cache.table_names())
+
+    @property
+    def stats(self):
+        """Size and row statistics, refreshed in the background for every database object on the engine."""
+        return get_database_stats(self.read_engine)
+
+    def get_database_size(self):
+        """Returns the database size in MB from the latest background statistics."""
+        snapshot = self.stats.snapshot()
+        if snapshot is None:
+            return "N/A (Statistics are not available yet)"
+        return round(snapshot["database_bytes"] / (1024 * 1024), 2)
+
+    def get_execution_time(self, sql_query):
+        """Executes a simple query and returns the execution time in seconds."""
+        engine = self.read_engine
+        try:
+            start_time = time.time()
+            with engine.connect() as connection:
+                connection.execute(text(sql_query))  # Using text clause to protect from SQL injections
+            end_time = time.time()
+            return round(end_time - start_time, 3)
+        except Exception as e:
+            print(f"Error measuring execution time: {e}")
+            return None
@@ -0,0 +1,158 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from cache import normalize_question, question_words
+from sqltext import referenced_tables
+
+
+def parse_examples(text):
+    """Parses "Q: ... A: ..." pairs, the format of sql.PROMPT_EXAMPLES, into [(question, sql)]."""
+    return [
+        (question.strip(), answer.strip())
+        for question, answer in re.findall(r"Q:\s*(.+?)\s*\n\s*A:\s*(.+?)\s*(?:\n\s*\n|\Z)", text, re.DOTALL)
+    ]
+
+
+def render_examples(examples):
+    """Formats [(question, sql)] the way sql.PROMPT_EXAMPLES is written."""
+    return "".join(f"\n    Q: {question}\n    A: {sql_query}\n" for question, sql_query in examples)
+
+
+def char_ngrams(text, sizes=(3, 4, 5)):
+    """Character n-grams of each word padded with spaces, which survive typos and inflections."""
+    grams = Counter()
+    for word in question_words(text):
+        padded = f" {word} "
+        for size in sizes:
+            grams.update(padded[start:start + size] for start in range(max(len(padded) - size + 1, 1)))
+    return grams
+
+
+class ExampleStore:
+    """Verified question -> SQL pairs with a character n-gram TF-IDF index for picking few-shot examples.
+
+    Pairs live in memory and, when db_path is set, in a SQLite file so confirmations survive
+    restarts. The index is an inverted list of L2-normalized TF-IDF weights per n-gram held in
+    NumPy arrays; a search scores every example at once by scattering each query n-gram's
+    postings into one score vector. It is rebuilt lazily after the store changes, since IDF
+    weights shift as examples are added.
+    """
+
+    def __init__(self, db_path=None, seeds=(), min_score=0.1):
+        self.min_score = min_score
+        self._examples = {}  # normalized question -> (question, sql)
+        self._keys = []
+        self._grams = {}  # normalized question -> n-gram counts, kept so rebuilds only tokenize new examples
+        self._postings = {}  # n-gram -> (example positions, weights)
+        self._idf = {}
+        self._dirty = True
+        self._lock = threading.Lock()
+        self._disk = None
+        for question, sql_query in seeds:
+            self._examples[normalize_question(question)] = (question, sql_query)
+        if db_path:
+            self._disk = sqlite3.connect(db_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS examples ("
+                "key TEXT PRIMARY KEY, question TEXT NOT NULL, sql TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._disk.commit()
+            for question, sql_query in self._disk.execute("SELECT question, sql FROM examples ORDER BY created_at"):
+                self._examples[normalize_question(question)] = (question, sql_query)  # Keys follow the current normalizer
+
+    @classmethod
+    def from_env(cls, seeds=()):
+        """Builds a store from EXAMPLE_STORE_* environment variables."""
+        return cls(
+            db_path=os.environ.get("EXAMPLE_STORE_PATH") or None,
+            seeds=seeds,
+            min_score=float(os.environ.get("EXAMPLE_MIN_SCORE", 0.1)),
+        )
+
+    def __len__(self):
+        return len(self._examples)
+
+    def add(self, question, sql_query):
+        """Stores a confirmed pair, replacing any earlier SQL for the same question."""
+        key = normalize_question(question)
+        with self._lock:
+            self._examples[key] = (question, sql_query)
+            self._grams.pop(key, None)
+            self._dirty = True
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO examples (key, question, sql, created_at) VALUES (?, ?, ?, ?)",
+                    (key, question, sql_query, time.time()),
+                )
+                self._disk.commit()
+
+    def _rebuild(self):
+        import numpy as np  # Loaded with the first search rather than at startup
+
+        self._keys = list(self._examples)
+        for key in self._keys:
+            if key not in self._grams:
+                self._grams[key] = char_ngrams(self._examples[key][0])
+        grams = [self._grams[key] for key in self._keys]
+
+        # Flatten to (n-gram id, example, log tf) triples and let NumPy do the weighting and grouping
+        vocabulary, gram_ids, positions, tfs = {}, [], [], []
+        for position, counts in enumerate(grams):
+            for gram, count in counts.items():
+                gram_ids.append(vocabulary.setdefault(gram, len(vocabulary)))
+                positions.append(position)
+                tfs.append(count)
+        gram_ids = np.array(gram_ids, dtype=np.int64)
+        positions = np.array(positions, dtype=np.int32)
+        document_frequency = np.bincount(gram_ids, minlength=len(vocabulary))
+        idf = np.log((1 + len(self._keys)) / (1 + document_frequency)) + 1
+        weights = (1 + np.log(np.array(tfs, dtype=np.float64))) * idf[gram_ids]
+        norms = np.sqrt(np.bincount(positions, weights=weights * weights, minlength=len(self._keys)))
+        weights = (weights / norms[positions]).astype(np.float32)
+
+        order = np.argsort(gram_ids, kind="stable")
+        bounds = np.searchsorted(gram_ids[order], np.arange(len(vocabulary) + 1))
+        self._idf = dict(zip(vocabulary, idf.tolist()))
+        self._postings = {
+            gram: (positions[order[bounds[index]:bounds[index + 1]]], weights[order[bounds[index]:bounds[index + 1]]])
+            for gram, index in vocabulary.items()
+        }
+        self._dirty = False
+
+    def search(self, question, k=3, tables=None):
+        """Returns up to k [(score, question, sql)] by cosine similarity, best first.
+
+        With tables, only examples whose SQL reads nothing but those tables are considered.
+        """
+        import numpy as np
+
+        with self._lock:
+            if self._dirty:
+                self._rebuild()
+            if not self._keys:
+                return []
+            counts = char_ngrams(question)
+            weights = {gram: (1 + math.log(count)) * self._idf[gram] for gram, count in counts.items() if gram in self._idf}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+            if not norm:
+                return []
+            scores = np.zeros(len(self._keys), dtype=np.float32)
+            for gram, weight in weights.items():
+                positions, values = self._postings[gram]
+                scores[positions] += values * (weight / norm)  # Positions are unique within one posting list
+            order = np.argsort(-scores)
+            results = []
+            for position in order:
+                score = float(scores[position])
+                if score < self.min_score or len(results) >= k:
+                    break
+                example_question, sql_query = self._examples[self._keys[position]]
+                if tables is not None and not referenced_tables(sql_query) <= set(tables):
+                    continue
+                results.append((score, example_question, sql_query))
+            return results
@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from sqlalchemy import text
+
+from routing import get_router
+
+
+class QueryTimeoutError(TimeoutError):
+    """Raised when a query runs past its deadline and has been cancelled."""
+
+
+class QueryCancelledError(Exception):
+    """Raised when a query was cancelled before it finished."""
+
+
+def server_connection_id(connection):
+    """Returns what a second connection needs to cancel this one's running statement."""
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        return connection.execute(text("SELECT CONNECTION_ID()")).scalar()
+    if dialect == "postgresql":
+        return connection.execute(text("SELECT pg_backend_pid()")).scalar()
+    if dialect == "sqlite":
+        return connection.connection.dbapi_connection  # sqlite3 can interrupt from another thread
+    return None
+
+
+def set_statement_timeout(connection, seconds):
+    """Applies a server-side timeout to the statements run on connection; None clears it."""
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        # Only applies to read-only SELECTs, which is all the guard lets through
+        milliseconds = int(seconds * 1000) if seconds else 0
+        connection.execute(text(f"SET SESSION max_execution_time = {milliseconds}"))
+    elif dialect == "postgresql":
+        if seconds:
+            connection.execute(text(f"SET statement_timeout = {int(seconds * 1000)}"))
+        else:
+            connection.execute(text("RESET statement_timeout"))
+
+
+def cancel_server_query(engine, connection_id):
+    """Stops the statement running on another connection of engine."""
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        connection_id.interrupt()
+        return
+    with engine.connect() as connection:
+        if dialect == "mysql":
+            connection.execute(text(f"KILL QUERY {int(connection_id)}"))
+        elif dialect == "postgresql":
+            connection.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": connection_id})
+
+
+class QueryHandle:
+    """A query running on a QueryExecutor worker."""
+
+    def __init__(self, engine, timeout, key=None):
+        self.engine = engine
+        self.timeout = timeout
+        self.key = key  # Lets callers tell whether a running handle still matches what they want
+        self.started_at = time.time()
+        self.future = None
+        self.connection_id = None
+        self.cancelled = False
+        self.timed_out = False
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started_at
+
+    def done(self):
+        return self.future.done()
+
+    def wait(self, timeout):
+        """Waits up to timeout seconds and returns whether the query has finished."""
+        try:
+            self.future.exception(timeout=timeout)
+        except (FutureTimeoutError, CancelledError):
+            pass
+        return self.future.done()
+
+    def result(self, timeout=None):
+        """Returns the query's result, waiting up to timeout seconds; by default until the watchdog's deadline stops it."""
+        try:
+            return self.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.cancel(timed_out=True)
+            raise QueryTimeoutError(f"Query exceeded the {timeout:g}s limit and was cancelled.")
+        except CancelledError:
+            raise QueryCancelledError("Query was cancelled.")
+        except Exception:
+            if self.timed_out:
+                raise QueryTimeoutError(f"Query exceeded the {self.timeout:g}s limit and was cancelled.")
+            if self.cancelled:
+                raise QueryCancelledError("Query was cancelled.")
+            raise
+
+    def cancel(self, timed_out=False):
+        """Cancels the query: drops it if still queued, otherwise stops it on the server."""
+        # Held throughout so the worker cannot return the connection to the pool mid-cancel
+        with self._lock:
+            if self.future.done() or self.cancelled:
+                return
+            self.cancelled = True
+            self.timed_out = timed_out
+            if self.future.cancel() or self.connection_id is None:
+                return
+            try:
+                cancel_server_query(self.engine, self.connection_id)
+            except Exception as e:
+                print(f"Error cancelling query: {e}")
+
+
+class QueryExecutor:
+    """Runs queries on a worker pool with a per-query deadline.
+
+    Each query gets its own pooled connection, from a read replica when the engine has any, with
+    a server-side statement timeout (MySQL max_execution_time, PostgreSQL statement_timeout). A
+    watchdog cancels it on the server when the deadline passes, even if nobody is waiting for the
+    result any more. The deadline counts from when a worker picks the query up, not time spent
+    queued. Exports get export_timeout instead, which is no deadline at all by default.
+    """
+
+    def __init__(self, max_workers=4, timeout=30, export_timeout=None):
+        self.timeout = timeout
+        self.export_timeout = export_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+
+    @classmethod
+    def from_env(cls):
+        """Builds an executor from QUERY_WORKERS, QUERY_TIMEOUT and QUERY_EXPORT_TIMEOUT environment variables."""
+        return cls(
+            max_workers=int(os.environ.get("QUERY_WORKERS", 4)),
+            timeout=float(os.environ.get("QUERY_TIMEOUT", 30)),
+            export_timeout=float(os.environ["QUERY_EXPORT_TIMEOUT"]) if os.environ.get("QUERY_EXPORT_TIMEOUT") else None,
+        )
+
+    def submit(self, engine, fn, *args, timeout=None, key=None, **kwargs):
+        """Runs fn(*args, connection=<connection>, **kwargs) on a worker and returns a QueryHandle."""
+        return self._submit(engine, fn, args, kwargs, self.timeout if timeout is None else timeout, key)
+
+    def submit_export(self, engine, fn, *args, key=None, **kwargs):
+        """Like submit, for a streaming export: its deadline is export_timeout, or none."""
+        return self._submit(engine, fn, args, kwargs, self.export_timeout, key)
+
+    def _submit(self, engine, fn, args, kwargs, timeout, key):
+        handle = QueryHandle(engine, timeout, key)
+        handle.future = self._pool.submit(self._run, handle, engine, fn, args, kwargs)
+        return handle
+
+    def _run(self, handle, engine, fn, args, kwargs):
+        watchdog = None
+        if handle.timeout is not None:
+            watchdog = threading.Timer(handle.timeout, handle.cancel, kwargs={"timed_out": True})
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            # Only guarded, read-only SELECTs are submitted, so they may run on a read replica
+            router = get_router(engine)
+            with router.connect() if router is not None else engine.connect() as connection:
+                set_statement_timeout(connection, handle.timeout)
+                try:
+                    with handle._lock:
+                        if handle.cancelled:
+                            raise QueryCancelledError("Query was cancelled.")
+                        handle.engine = connection.engine  # Cancel on the server that runs the query
+                        handle.connection_id = server_connection_id(connection)
+                    return fn(*args, connection=connection, **kwargs)
+                finally:
+                    with handle._lock:
+                        handle.connection_id = None  # The connection goes back to the pool; never kill it later
+                    try:
+                        set_statement_timeout(connection, None)
+                    except Exception:
+                        connection.invalidate()  # Don't hand a connection in an unknown state back to the pool
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,198 @@
+"""Exports a query result to CSV, gzip-compressed CSV, JSON lines or Parquet.
+
+    python export.py "SELECT * FROM t_shirts" --format csv.gz --output t_shirts.csv.gz
+
+Rows are streamed from a server-side cursor and encoded one chunk at a time, so memory stays
+bounded by the chunk size whatever the row count.
+"""
+import argparse
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import time
+from decimal import Decimal
+
+import sql
+from guard import check_read_only
+from metrics import get_metrics
+
+# name -> (label, file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": ("CSV", ".csv", "text/csv"),
+    "csv.gz": ("CSV (gzip)", ".csv.gz", "application/gzip"),
+    "jsonl": ("JSON lines", ".jsonl", "application/x-ndjson"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def available_formats():
+    """Export formats whose dependencies are installed; Parquet needs pyarrow."""
+    return [name for name in EXPORT_FORMATS if name != "parquet" or importlib.util.find_spec("pyarrow")]
+
+
+class CsvEncoder:
+    def __init__(self, file, compress=False):
+        level = int(os.environ.get("EXPORT_COMPRESSION_LEVEL", 6))
+        self._gzip = gzip.GzipFile(fileobj=file, mode="wb", compresslevel=level) if compress else None
+        self._text = io.TextIOWrapper(self._gzip or file, encoding="utf-8", newline="")
+        self._writer = csv.writer(self._text)
+        self._header = False
+
+    def write(self, columns, rows):
+        if not self._header:
+            self._writer.writerow(columns)
+            self._header = True
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._text.flush()
+        self._text.detach()  # Leave the file itself to the caller
+        if self._gzip is not None:
+            self._gzip.close()
+
+
+class JsonLinesEncoder:
+    def __init__(self, file):
+        self._file = file
+        # json.dumps with default= builds a new encoder per call; one shared encoder is much faster
+        self._encode = json.JSONEncoder(default=str).encode
+
+    def write(self, columns, rows):
+        encode = self._encode
+        self._file.write("".join(encode(dict(zip(columns, row))) + "\n" for row in rows).encode("utf-8"))
+
+    def close(self):
+        pass
+
+
+class ParquetEncoder:
+    """Writes each chunk as a row group; column types come from the first chunk.
+
+    DECIMAL columns are stored as float64 for the whole stream, so a later chunk with a fraction
+    is not truncated to the integers of the first. Every chunk is cast with safe=True, so a value
+    that does not fit its column's type fails the export instead of being silently changed.
+    """
+
+    def __init__(self, file):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet export needs pyarrow. Install it with `pip install pyarrow`.")
+        self._pa = pa
+        self._pq = pq
+        self._file = file
+        self._writer = None
+
+    def write(self, columns, rows):
+        pa = self._pa
+        values = list(zip(*rows)) if rows else [() for _ in columns]
+        if self._writer is None:
+            fields = [pa.field(name, self._column_type(column)) for name, column in zip(columns, values)]
+            self._writer = self._pq.ParquetWriter(self._file, pa.schema(fields))
+        arrays = []
+        for field, column in zip(self._writer.schema, values):
+            if field.type == pa.string():
+                column = [None if value is None else str(value) for value in column]
+            elif field.type == pa.float64():
+                column = [None if value is None else float(value) for value in column]
+            # pa.array(..., type=) truncates floats to integers; a checked cast raises instead
+            arrays.append(pa.array(column).cast(field.type, safe=True))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._writer.schema))
+
+    def _column_type(self, column):
+        pa = self._pa
+        sample = next((value for value in column if value is not None), None)
+        if sample is None:
+            return pa.string()  # A column that is all NULL in the first chunk has no type yet; store it as text
+        if isinstance(sample, Decimal):
+            return pa.float64()
+        return pa.array(column).type
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def make_encoder(export_format, file):
+    if export_format == "csv":
+        return CsvEncoder(file)
+    if export_format == "csv.gz":
+        return CsvEncoder(file, compress=True)
+    if export_format == "jsonl":
+        return JsonLinesEncoder(file)
+    if export_format == "parquet":
+        return ParquetEncoder(file)
+    raise ValueError(f"Unknown export format {export_format!r}; choose one of {', '.join(EXPORT_FORMATS)}.")
+
+
+def export_result(db, sql_query, export_format="csv", path=None, chunk_size=1000, max_rows=None, cache=None, connection=None):
+    """Streams the result of sql_query into a file and returns {"path", "format", "rows", "bytes", "seconds"}.
+
+    Without path, a temporary file is created (in EXPORT_DIR if set) that the caller removes. The
+    export is timed as the export stage, and its rows and bytes are added to the metrics counters.
+    """
+    metrics = get_metrics()
+    extension = EXPORT_FORMATS[export_format][1] if export_format in EXPORT_FORMATS else ""
+    if path is None:
+        handle, path = tempfile.mkstemp(prefix="sql_export_", suffix=extension, dir=os.environ.get("EXPORT_DIR") or None)
+        os.close(handle)
+    start = time.perf_counter()
+    row_count = 0
+    try:
+        with open(path, "wb") as file:
+            encoder = make_encoder(export_format, file)
+            # Parquet types its columns once for the whole file, so it takes DECIMAL values as they are
+            # rather than as ints or floats decided chunk by chunk
+            chunks = sql.stream_result(db, sql_query, chunk_size, max_rows, cache=cache, connection=connection,
+                                       convert_decimals=export_format != "parquet")
+            for columns, rows in chunks:
+                with metrics.stage("export_encoding", format=export_format, rows=len(rows)):
+                    encoder.write(columns, rows)
+                row_count += len(rows)
+            encoder.close()
+    except BaseException:
+        metrics.record("export", time.perf_counter() - start, error=True, format=export_format)
+        os.remove(path)
+        raise
+    seconds = time.perf_counter() - start
+    size = os.path.getsize(path)
+    metrics.record("export", seconds, format=export_format, rows=row_count, bytes=size)
+    metrics.increment("export_rows", row_count)
+    metrics.increment("export_bytes", size)
+    return {"path": path, "format": export_format, "rows": row_count, "bytes": size, "seconds": round(seconds, 3)}
+
+
+def read_export(path):
+    """Returns an export file's bytes, for handing to a download."""
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def remove_export(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sql_query", help="SELECT statement to export")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--output", required=True, help="File to write")
+    args = parser.parse_args()
+
+    _, db_uri = sql.load_environment_variables()
+    settings = sql.load_result_settings()
+    exported = export_result(sql.get_db(db_uri), check_read_only(args.sql_query), args.format, args.output, chunk_size=settings["chunk_size"])
+    print(f"Exported {exported['rows']} rows ({exported['bytes'] / (1024 * 1024):.2f} MB) to {args.output} "
+          f"in {exported['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import String, text
+
+from cache import question_words
+from schema import get_schema_cache
+
+# Spoken forms of size codes; an alias is only used when its target is a value in the table
+VALUE_ALIASES = {
+    "extra small": "XS",
+    "x small": "XS",
+    "small": "S",
+    "medium": "M",
+    "large": "L",
+    "extra large": "XL",
+    "x large": "XL",
+}
+
+COLUMN_SYNONYMS = {
+    "color": ("colour", "colours"),
+    "price": ("cost", "costs"),
+    "stock_quantity": ("stock", "quantity", "inventory", "units"),
+}
+
+# Words the templates account for; anything else in a question lowers the confidence
+FILLER_WORDS = frozenset("""
+    a an the of for in with and or all any our we do does did have has is are was were be there it its that
+    those these this me us you i please can could tell what which how many much show list give get find
+    display see available left total number from on t shirt shirts tshirt tshirts tee tees item items
+    product products piece pieces average avg mean lowest minimum min cheapest highest maximum max
+    different distinct unique kind kinds type types currently now still
+""".split())
+
+# Words that change a query's shape beyond the templates: negation, comparison, ranking, grouping
+BLOCKING_WORDS = frozenset("""
+    not no except without excluding than between more less greater fewer above below under over
+    each per by top most least order sort sorted group grouped percent percentage ratio if when
+""".split())
+
+RECORD_WORDS = frozenset(("data", "details", "records", "rows", "info", "information", "everything"))
+LIST_WORDS = frozenset(("list", "show", "display", "give", "get", "find", "see", "what", "which"))
+AVERAGE_WORDS = frozenset(("average", "avg", "mean"))
+MINIMUM_WORDS = frozenset(("lowest", "minimum", "min", "cheapest"))
+MAXIMUM_WORDS = frozenset(("highest", "maximum", "max"))
+
+
+class SlotFiller:
+    """Answers templated questions about one table locally, without a Gemini round trip.
+
+    The distinct values of the categorical slot columns are kept in memory, refreshed from the
+    database every refresh_interval seconds. A question is matched word by word: known values fill
+    the WHERE slots, a few intent words pick the SELECT list (stock sum, price aggregate, distinct
+    values, a projection or whole rows). The share of words accounted for is the confidence; below
+    min_confidence, or when a word implies a shape the templates lack, the question goes to Gemini.
+    So does a question with an unknown word beside a column name ("the Puma brand" when no Puma is
+    stocked), since dropping that filter would answer a different question.
+    Templates carry bind parameters and are rendered with the dialect's literal quoting.
+    """
+
+    def __init__(self, engine, table, slot_columns, stock_column=None, price_column=None,
+                 refresh_interval=300, min_confidence=0.9, max_values=1000):
+        self.engine = engine
+        self.table = table
+        self.slot_columns = list(slot_columns)
+        self.stock_column = stock_column
+        self.price_column = price_column
+        self.refresh_interval = refresh_interval
+        self.min_confidence = min_confidence
+        self.max_values = max_values
+        self.hits = 0
+        self.misses = 0
+        self._phrases = {}  # value words -> {column: (value, needs_column_word)}
+        self._longest = 0
+        self._values = 0
+        self._refreshed_at = 0.0
+        self._templates = {}  # (select, ((column, value count), ...)) -> SQL with bind parameters
+        self._literal = None
+        self._lock = threading.Lock()
+        self._column_words = {}  # word -> (column, plural)
+        for column in self.slot_columns + [name for name in (stock_column, price_column) if name]:
+            name = column.lower()
+            for word in (name,) + COLUMN_SYNONYMS.get(name, ()):
+                self._column_words.setdefault(word, (column, word.endswith("s") and word != name))
+            self._column_words.setdefault(name + "s", (column, True))
+
+    @classmethod
+    def from_env(cls, engine):
+        """Builds a slot filler from FAST_PATH_* environment variables, or returns None if disabled or the table is missing."""
+        table = os.environ.get("FAST_PATH_TABLE", "t_shirts")
+        if not table:
+            return None
+        slot_columns = [name.strip() for name in os.environ.get("FAST_PATH_COLUMNS", "brand,color,size").split(",") if name.strip()]
+        try:
+            columns = set(get_schema_cache(engine).column_names(table))
+        except Exception:
+            return None
+        if not slot_columns or not set(slot_columns) <= columns:
+            return None
+        stock_column = os.environ.get("FAST_PATH_STOCK_COLUMN", "stock_quantity")
+        price_column = os.environ.get("FAST_PATH_PRICE_COLUMN", "price")
+        return cls(
+            engine, table, slot_columns,
+            stock_column=stock_column if stock_column in columns else None,
+            price_column=price_column if price_column in columns else None,
+            refresh_interval=float(os.environ.get("FAST_PATH_REFRESH", 300)),
+            min_confidence=float(os.environ.get("FAST_PATH_MIN_CONFIDENCE", 0.9)),
+            max_values=int(os.environ.get("FAST_PATH_MAX_VALUES", 1000)),
+        )
+
+    def _quote(self, name):
+        return self.engine.dialect.identifier_preparer.quote_identifier(name)
+
+    def refresh(self):
+        """Reloads the distinct values of every slot column; columns with more than max_values are left out."""
+        values_by_column = {}
+        with self.engine.connect() as connection:
+            for column in self.slot_columns:
+                values = [row[0] for row in connection.execute(text(
+                    f"SELECT DISTINCT {self._quote(column)} FROM {self._quote(self.table)} LIMIT {self.max_values + 1}"
+                )) if isinstance(row[0], str)]
+                if len(values) <= self.max_values:
+                    values_by_column[column] = values
+
+        phrases = {}
+        for column, values in values_by_column.items():
+            folded = {value.casefold(): value for value in values}
+            spoken = [(value, value) for value in values]
+            spoken += [(alias, folded[target.casefold()]) for alias, target in VALUE_ALIASES.items() if target.casefold() in folded]
+            for words, value in spoken:
+                words = tuple(question_words(words))
+                if not words:
+                    continue
+                # One-letter codes like the size "S" also appear as stray words, so they need "size" beside them
+                short = len(words) == 1 and len(words[0]) == 1
+                variants = [words] if len(words[-1]) <= 2 else [words, words[:-1] + (words[-1] + "s",)]
+                for variant in variants:
+                    phrases.setdefault(variant, {}).setdefault(column, (value, short))
+
+        with self._lock:
+            self._phrases = phrases
+            self._longest = max((len(words) for words in phrases), default=0)
+            self._values = sum(len(values) for values in values_by_column.values())
+            self._refreshed_at = time.time()
+            # The dialect knows its escaping rules (e.g. MySQL backslashes) once it has connected
+            self._literal = String().literal_processor(dialect=self.engine.dialect)
+
+    def match(self, question):
+        """Returns {"sql", "template", "params", "confidence"} for question, or None when no template fits."""
+        if time.time() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+        words = question_words(re.sub(r"['’]s\b", "s", question))  # "Levi's" reads as "Levis"
+        if not words or any(word in BLOCKING_WORDS or any(char.isdigit() for char in word) for word in words):
+            return None
+
+        filters = {}  # column -> [values]
+        explained = set()  # Positions of the words a value, column name or filler word accounts for
+        position = 0
+        while position < len(words):
+            for length in range(min(self._longest, len(words) - position), 0, -1):
+                candidates = self._phrases.get(tuple(words[position:position + length]))
+                if candidates:
+                    break
+            else:
+                position += 1
+                continue
+            beside = {self._column_words.get(word, (None,))[0]
+                      for word in words[max(position - 1, 0):position] + words[position + length:position + length + 1]}
+            usable = {column: value for column, (value, short) in candidates.items() if not short or column in beside}
+            if len(usable) == 1:
+                column, value = next(iter(usable.items()))
+                if value not in filters.setdefault(column, []):
+                    filters[column].append(value)
+                explained.update(range(position, position + length))
+            position += length
+
+        mentioned = {}  # column -> plural, for column names in the question
+        for position, word in enumerate(words):
+            if word in self._column_words:
+                column, plural = self._column_words[word]
+                mentioned[column] = mentioned.get(column, False) or plural
+                explained.add(position)
+            elif word in FILLER_WORDS or word in RECORD_WORDS:
+                explained.add(position)
+        for position, word in enumerate(words):
+            if word in self._column_words and not {position - 1, position + 1} & set(range(len(words))) <= explained:
+                return None  # Most likely a value the table does not have, e.g. an unstocked brand
+        confidence = min(len(explained) / len(words), 1.0)
+
+        select = self._select(set(words), mentioned, filters)
+        if select is None:
+            return None
+        key = (select, tuple((column, len(values)) for column, values in filters.items()))
+        template = self._templates.get(key)
+        if template is None:
+            conditions = []
+            for column, count in key[1]:
+                names = [f":{column}_{index}" for index in range(1, count + 1)]
+                condition = f"= {names[0]}" if count == 1 else f"IN ({', '.join(names)})"
+                conditions.append(f"{self._quote(column)} {condition}")
+            template = f"SELECT {select} FROM {self._quote(self.table)}"
+            if conditions:
+                template += " WHERE " + " AND ".join(conditions)
+            self._templates[key] = template
+        params = {f"{column}_{index}": value
+                  for column, values in filters.items() for index, value in enumerate(values, 1)}
+        sql_query = re.sub(r":(\w+)", lambda name: self._literal(params[name.group(1)]), template)
+        return {"sql": sql_query, "template": template, "params": params, "confidence": round(confidence, 3)}
+
+    def _select(self, words, mentioned, filters):
+        """Picks the SELECT list from the intent words, or None when the question fits no template."""
+        projected = [column for column in self.slot_columns if mentioned.get(column) and column not in filters]
+        price = self.price_column in mentioned
+        stock = self.stock_column in mentioned
+        if words & RECORD_WORDS:
+            return "*"
+        if "how" in words and "many" in words:
+            if len(projected) == 1 and not stock:
+                return f"COUNT(DISTINCT {self._quote(projected[0])})"
+            return f"SUM({self._quote(self.stock_column)})" if self.stock_column else None
+        if price:
+            for function, function_words in (("AVG", AVERAGE_WORDS), ("MIN", MINIMUM_WORDS), ("MAX", MAXIMUM_WORDS)):
+                if words & function_words:
+                    return f"{function}({self._quote(self.price_column)})"
+        if stock and not price and not projected:
+            return f"SUM({self._quote(self.stock_column)})"
+        if words & (AVERAGE_WORDS | MINIMUM_WORDS | MAXIMUM_WORDS | {"total"}):
+            return None  # An aggregate of something the templates do not cover
+        columns = projected + [name for name, wanted in ((self.price_column, price), (self.stock_column, stock)) if wanted]
+        if len(columns) == 1 and columns == projected:
+            return f"DISTINCT {self._quote(columns[0])}"
+        if columns:
+            return ", ".join(self._quote(column) for column in columns)
+        return "*" if words & LIST_WORDS else None
+
+    def answer(self, question):
+        """Returns SQL for question when the match is confident enough, else None; counts toward the hit rate."""
+        try:
+            match = self.match(question)
+        except Exception as e:
+            print(f"Error matching question to a template: {e}")
+            match = None
+        with self._lock:
+            if match is None or match["confidence"] < self.min_confidence:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return match["sql"]
+
+    def stats(self):
+        """Returns hits, misses and the hit rate, plus the number of slot values in memory."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "values": self._values,
+                "refreshed_at": self._refreshed_at or None,
+            }
+
+    def to_prometheus(self, prefix="sql_assistant"):
+        """Renders the hit and miss counters in the Prometheus text exposition format."""
+        stats = self.stats()
+        return (
+            f"# HELP {prefix}_fast_path_total Questions the local slot filler answered (hit) or passed to Gemini (miss).\n"
+            f"# TYPE {prefix}_fast_path_total counter\n"
+            f'{prefix}_fast_path_total{{result="hit"}} {stats["hits"]}\n'
+            f'{prefix}_fast_path_total{{result="miss"}} {stats["misses"]}\n'
+        )
+
+
+_fillers = {}  # engine URL -> SlotFiller or None, so every database object on an engine shares one
+_fillers_lock = threading.Lock()
+
+
+def get_slot_filler(engine):
+    """Returns the shared SlotFiller for engine, or None when the fast path is disabled or unavailable."""
+    key = engine.url.render_as_string(hide_password=False)
+    with _fillers_lock:
+        if key not in _fillers:
+            _fillers[key] = SlotFiller.from_env(engine)
+        return _fillers[key]
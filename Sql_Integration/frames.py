@@ -0,0 +1,101 @@
+import operator
+from decimal import Decimal
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+# Integers above this lose precision as float64, so Decimal columns holding them are converted one by one
+MAX_EXACT_FLOAT = 2 ** 53
+
+
+def object_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _floats(values):
+    # fromiter over float() is far faster than letting np.array convert each Decimal itself
+    try:
+        return np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+    except TypeError:
+        return np.fromiter(
+            (np.nan if value is None else float(value) for value in values), dtype=np.float64, count=len(values)
+        )
+
+
+def decimal_array(values, sample):
+    """Converts a column of Decimals (and NULLs) without changing any value.
+
+    Wholeness is confirmed on the Decimals themselves, since float64 rounds e.g.
+    1.0000000000000001 to 1. Whole columns become int64 (float64 with NaN for NULLs while every
+    value is exact in it); others become float64 if every value round-trips, else stay Decimals.
+    """
+    floats = _floats(values)
+    nulls = np.isnan(floats)
+    present = [value for value in values if value is not None] if nulls.any() else values
+    known = floats[~nulls]
+    # A whole Decimal always gives a whole float, so only columns whose floats look whole need the exact check
+    whole = (known == np.floor(known)).all() and not any(map(operator.mod, present, repeat(1)))
+    if whole:
+        exact = (np.abs(known) < MAX_EXACT_FLOAT).all()
+        if not nulls.any():
+            if exact:
+                return floats.astype(np.int64)
+            try:
+                return np.fromiter(map(int, values), dtype=np.int64, count=len(values))
+            except OverflowError:
+                return object_array([int(value) for value in values])
+        return floats if exact else object_array([None if value is None else int(value) for value in values])
+    # Up to 15 significant digits survive float64. A DECIMAL column has one scale, which the
+    # sample shows, so the largest value tells whether every value fits in 15 digits.
+    scale = -sample.as_tuple().exponent
+    if np.abs(known).max() < 10.0 ** (15 - scale):
+        return floats
+    if all(Decimal(repr(float(value))) == value for value in present):
+        return floats
+    return object_array(values)
+
+
+def column_array(values):
+    """Builds a typed NumPy array from one column of fetched values.
+
+    Decimal columns are converted in bulk by decimal_array: int64 when every value is whole,
+    float64 when any value has a fraction or is NULL (as NaN, which is what pandas does for
+    nullable numbers too), and Decimal objects when float64 would change a value.
+    Other columns are left for pandas to infer, as when building a DataFrame from rows.
+    """
+    sample = next((value for value in values if value is not None), None)
+    if isinstance(sample, Decimal):
+        return decimal_array(values, sample)
+    if isinstance(sample, float):
+        return np.array(values, dtype=np.float64)
+    if isinstance(sample, int) and not isinstance(sample, bool):
+        try:
+            return np.array(values, dtype=np.int64)
+        except TypeError:
+            floats = np.array(values, dtype=np.float64)  # NULLs become NaN, as pandas does
+            if (np.abs(floats[~np.isnan(floats)]) < MAX_EXACT_FLOAT).all():
+                return floats
+        except OverflowError:
+            pass  # Too large for int64; let pandas decide
+    return object_array(values)
+
+
+def build_frame(columns, arrays):
+    # Positional construction keeps duplicate column names (e.g. from a join) apart
+    frame = pd.DataFrame(dict(enumerate(arrays)), copy=False)
+    frame.columns = columns
+    return frame
+
+
+def concatenate(arrays):
+    """Joins one column's chunk arrays; int64 and float64 chunks promote the way a whole column would."""
+    if len(arrays) == 1:
+        return arrays[0]
+    joined = np.concatenate(arrays)
+    if joined.dtype == object and any(array.dtype != object for array in arrays):
+        # An all-NULL chunk next to numeric ones; infer the type of the whole column again
+        return pd.Series(joined).infer_objects().to_numpy()
+    return joined
@@ -0,0 +1,182 @@
+import json
+import os
+
+from sqlalchemy import text
+
+from sqltext import split_statements, strip_code_fences, tokenize
+
+# Words that let a statement write, lock, change session state or stall the server
+FORBIDDEN_WORDS = {
+    "insert", "update", "delete", "merge", "upsert", "drop", "alter", "create", "truncate",
+    "rename", "grant", "revoke", "call", "exec", "execute", "load", "handler", "lock", "unlock", "set",
+    "use", "into", "outfile", "dumpfile", "attach", "detach", "pragma", "vacuum", "analyze",
+}
+FORBIDDEN_FUNCTIONS = {"sleep", "benchmark", "pg_sleep", "get_lock", "load_file"}
+
+
+class UnsafeQueryError(ValueError):
+    """Raised when generated SQL is rejected before it reaches the database."""
+
+
+class GuardResult:
+    """The vetted SQL to execute, the planner's estimate of rows scanned and any warnings."""
+
+    def __init__(self, sql_query, estimated_rows=None, warnings=None):
+        self.sql_query = sql_query
+        self.estimated_rows = estimated_rows
+        self.warnings = warnings or []
+
+
+def load_guard_settings():
+    """Reads guard thresholds from the environment."""
+    return {
+        "row_limit": int(os.environ.get("GUARD_ROW_LIMIT", os.environ.get("RESULT_MAX_ROWS", 100000))),
+        "warn_rows": int(os.environ.get("GUARD_WARN_ROWS", 1000000)),
+        "max_rows": int(os.environ.get("GUARD_MAX_ROWS", 50000000)),
+        "explain": os.environ.get("GUARD_EXPLAIN", "true").lower() in ("1", "true", "yes"),
+    }
+
+
+def check_read_only(sql_query):
+    """Returns the single SELECT statement in sql_query, raising UnsafeQueryError otherwise."""
+    statements = split_statements(strip_code_fences(sql_query))
+    if len(statements) != 1:
+        raise UnsafeQueryError(f"Expected exactly one SQL statement, got {len(statements)}.")
+    statement = statements[0]
+
+    tokens = list(tokenize(statement))
+    first = tokens[0][1].lower()
+    if first not in ("select", "with"):
+        raise UnsafeQueryError(f"Only SELECT queries are allowed, got {first.upper()}.")
+
+    for index, (kind, value) in enumerate(tokens):
+        if kind != "word":
+            continue
+        word = value.lower()
+        following = tokens[index + 1][1].lower() if index + 1 < len(tokens) else ""
+        if word in FORBIDDEN_WORDS:
+            raise UnsafeQueryError(f"{value.upper()} is not allowed in generated queries.")
+        if word in FORBIDDEN_FUNCTIONS and following == "(":
+            raise UnsafeQueryError(f"{value.upper()}() is not allowed in generated queries.")
+        if word == "for" and following in ("update", "share"):
+            raise UnsafeQueryError("Locking reads (FOR UPDATE/FOR SHARE) are not allowed.")
+    return statement
+
+
+def enforce_limit(statement, row_limit):
+    """Appends LIMIT row_limit when the outer query has none, and lowers a larger literal LIMIT.
+
+    The row count of MySQL's LIMIT offset, count is lowered too. A new LIMIT goes right after the
+    last token, so a trailing -- or # comment cannot swallow it.
+    """
+    depth = 0
+    tokens = list(tokenize(statement, positions=True))
+    for index, (kind, value, start, end) in enumerate(tokens):
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif depth == 0 and kind == "word" and value.lower() == "limit":
+            count = tokens[index + 1] if index + 1 < len(tokens) else None
+            if index + 3 < len(tokens) and tokens[index + 2][1] == ",":
+                count = tokens[index + 3]
+            if count and count[0] == "number" and int(float(count[1])) > row_limit:
+                return statement[:count[2]] + str(row_limit) + statement[count[3]:]
+            return statement
+    end = tokens[-1][3] if tokens else len(statement)
+    return f"{statement[:end]} LIMIT {row_limit}{statement[end:]}"
+
+
+def _scan_nodes(plan):
+    if plan.get("Node Type", "").endswith("Scan"):
+        yield plan
+    for child in plan.get("Plans", []):
+        yield from _scan_nodes(child)
+
+
+def _collect_scan_rows(plan, table_rows=None):
+    """Sums the rows every scan node of a PostgreSQL JSON plan examines.
+
+    "Plan Rows" counts the rows a node returns, after its filter. A Seq Scan reads every row of
+    its relation whatever the filter keeps, so it counts the relation's estimate from table_rows
+    ({(schema, relation): pg_class.reltuples}) instead.
+    """
+    rows = 0
+    for node in _scan_nodes(plan):
+        scanned = node.get("Plan Rows", 0)
+        if node["Node Type"] == "Seq Scan":
+            scanned = max(scanned, (table_rows or {}).get((node.get("Schema"), node.get("Relation Name")), 0))
+        rows += scanned
+    return rows
+
+
+def _postgres_table_rows(connection, plan):
+    """Returns {(schema, relation): reltuples} for the relations plan reads with a Seq Scan."""
+    names = sorted({node.get("Relation Name") for node in _scan_nodes(plan) if node["Node Type"] == "Seq Scan"} - {None})
+    if not names:
+        return {}
+    rows = connection.execute(
+        text(
+            "SELECT n.nspname, c.relname, c.reltuples FROM pg_class c "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE c.relname = ANY(:names)"
+        ),
+        {"names": names},
+    )
+    return {(schema, name): reltuples for schema, name, reltuples in rows}  # reltuples is -1 before the first ANALYZE
+
+
+def estimate_rows_scanned(engine, statement):
+    """Asks the planner how many rows statement will examine; None when the dialect gives no estimate."""
+    dialect = engine.dialect.name
+    with engine.connect() as connection:
+        if dialect == "mysql":
+            result = connection.execute(text(f"EXPLAIN {statement}"))
+            columns = list(result.keys())
+            per_select = {}
+            for row in result:
+                row = dict(zip(columns, row))
+                # Tables within one SELECT are joined, so their estimates multiply
+                per_select[row.get("id")] = per_select.get(row.get("id"), 1) * int(row.get("rows") or 1)
+            return sum(per_select.values())
+        if dialect == "postgresql":
+            # VERBOSE adds each scan's schema, so relations of the same name in other schemas stay apart
+            plan = connection.execute(text(f"EXPLAIN (FORMAT JSON, VERBOSE) {statement}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            plan = plan[0]["Plan"]
+            return int(_collect_scan_rows(plan, _postgres_table_rows(connection, plan)))
+    return None
+
+
+def guard_sql(db, sql_query, settings=None):
+    """Vets generated SQL before execution and returns a GuardResult.
+
+    Rejects anything but a single read-only SELECT, makes sure the outer query has a LIMIT, and
+    runs EXPLAIN to refuse queries estimated to scan more than max_rows rows (warning above
+    warn_rows). Raises UnsafeQueryError when the query is refused.
+    """
+    settings = settings or load_guard_settings()
+    statement = enforce_limit(check_read_only(sql_query), settings["row_limit"])
+    result = GuardResult(statement)
+    if not settings["explain"]:
+        return result
+
+    try:
+        # On the engine reads go to, so with read replicas EXPLAIN does not load the primary either
+        result.estimated_rows = estimate_rows_scanned(db.read_engine, statement)
+    except Exception as e:
+        # A failing EXPLAIN means the query would fail too; let execution report the real error
+        result.warnings.append(f"Could not estimate query cost: {e}")
+        return result
+
+    if result.estimated_rows is not None:
+        if result.estimated_rows > settings["max_rows"]:
+            raise UnsafeQueryError(
+                f"Query refused: the planner estimates {result.estimated_rows:,} rows scanned "
+                f"(limit {settings['max_rows']:,})."
+            )
+        if result.estimated_rows > settings["warn_rows"]:
+            result.warnings.append(
+                f"Expensive query: the planner estimates {result.estimated_rows:,} rows scanned."
+            )
+    return result
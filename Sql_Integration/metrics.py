@@ -0,0 +1,154 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# The stages Metrics records; anything else is rejected, so a misspelt name cannot start a new series
+STAGES = (
+    "slot_filling", "prompt_build", "gemini_call", "sql_guard", "aggregate_lookup", "sql_execution", "row_conversion",
+    "dataframe", "csv_encoding", "export_encoding", "export",
+)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Metrics:
+    """Times request stages and keeps counts, errors and a rolling window of latencies per stage.
+
+    Every recorded sample is optionally appended to a JSON-lines log.
+    """
+
+    def __init__(self, window=1000, log_path=None):
+        self.window = window
+        self.log_path = log_path
+        self._samples = {}  # stage -> deque of recent durations in seconds
+        self._counts = {}
+        self._errors = {}
+        self._totals = {}
+        self._counters = {}  # name -> running total, e.g. bytes exported
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Builds a registry from METRICS_* environment variables."""
+        return cls(
+            window=int(os.environ.get("METRICS_WINDOW", 1000)),
+            log_path=os.environ.get("METRICS_LOG_PATH") or None,
+        )
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Times the enclosed block as one sample of stage name; exceptions count as errors."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(name, time.perf_counter() - start, error=True, **fields)
+            raise
+        self.record(name, time.perf_counter() - start, **fields)
+
+    def record(self, name, seconds, error=False, **fields):
+        """Adds one sample for stage name, which must be one of STAGES; extra fields only go to the JSON-lines log."""
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage {name!r}; add it to metrics.STAGES")
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+                self._counts[name] = self._errors[name] = 0
+                self._totals[name] = 0.0
+            self._samples[name].append(seconds)
+            self._counts[name] += 1
+            self._totals[name] += seconds
+            if error:
+                self._errors[name] += 1
+            if self.log_path:
+                entry = {"ts": time.time(), "stage": name, "seconds": round(seconds, 6), "error": error}
+                entry.update(fields)
+                with open(self.log_path, "a", encoding="utf-8") as log:
+                    log.write(json.dumps(entry, default=str) + "\n")
+
+    def increment(self, name, amount=1):
+        """Adds amount to the counter name."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def summary(self):
+        """Returns {stage: {count, errors, success_rate, total, mean, p50, p95, p99}} with latencies in seconds.
+
+        count and total cover every sample since the last reset; the mean and percentiles only the window.
+        """
+        with self._lock:
+            result = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                count = self._counts[name]
+                result[name] = {
+                    "count": count,
+                    "errors": self._errors[name],
+                    "success_rate": round(1 - self._errors[name] / count, 4) if count else None,
+                    "total": self._totals[name],
+                    "mean": sum(ordered) / len(ordered) if ordered else None,
+                    "p50": percentile(ordered, 0.50),
+                    "p95": percentile(ordered, 0.95),
+                    "p99": percentile(ordered, 0.99),
+                }
+            return result
+
+    def to_prometheus(self, prefix="sql_assistant"):
+        """Renders a snapshot in the Prometheus text exposition format."""
+        summary = self.summary()
+        with self._lock:
+            totals = dict(self._totals)
+            counters = dict(self._counters)
+        lines = [
+            f"# HELP {prefix}_stage_seconds Stage latency; quantiles cover the last {self.window} samples.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, stats in summary.items():
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{quantile}"}} {stats[key]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {totals[name]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+        lines.append(f"# HELP {prefix}_stage_errors_total Stage executions that raised an error.")
+        lines.append(f"# TYPE {prefix}_stage_errors_total counter")
+        for name, stats in summary.items():
+            lines.append(f'{prefix}_stage_errors_total{{stage="{name}"}} {stats["errors"]}')
+        for name, value in counters.items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forgets every sample and counter."""
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._errors.clear()
+            self._totals.clear()
+            self._counters.clear()
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Returns the process-wide metrics registry, created from the environment on first use."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics.from_env()
+        return _metrics
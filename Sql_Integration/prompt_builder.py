@@ -0,0 +1,226 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from examples import render_examples
+from sqltext import referenced_tables
+
+PROMPT_TEMPLATE = """
+        You are a SQL generation assistant for a {dialect} database.
+    Generate a SQL SELECT query that fetches only the relevant fields asked by the user.
+
+    DO:
+    - Use only SELECT queries.
+    - Use only the tables and columns listed in the schema below.
+    - Select only the columns mentioned in the question — do NOT select id columns unless explicitly asked.
+    - Always filter using WHERE if conditions are given.
+    - Use lowercase SQL syntax and {quote} for table and column names.
+
+    DO NOT:
+    - Do NOT select columns not asked (e.g., avoid `*` unless user says so).
+    - Do NOT alias columns or add explanation.
+    - Do NOT return anything other than SQL code.
+
+    Schema:
+{schema}
+{examples}{previous}
+    Return only the SQL query. No explanation.
+        """
+
+
+PREVIOUS_TEMPLATE = """
+    Previous question: {question}
+    Previous SQL: {sql}
+    If the new question refines the previous one (e.g. "only the white ones", "sort by price"),
+    keep the previous query's table and conditions and add to them.
+"""
+
+# Openers and back-references that only make sense against the previous question
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(?:now|then|and|also|but|only|just|instead|sort|order|what about|how about)\b"
+    r"|\b(?:those|these|them|ones|same|previous)\b",
+    re.IGNORECASE,
+)
+
+
+def is_follow_up(question):
+    """Whether question reads as a refinement of the one before it ("now only the white ones")."""
+    return bool(FOLLOW_UP_PATTERN.search(question or ""))
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting; Gemini averages about four characters per token."""
+    return len(text) // 4 + 1
+
+
+def tokenize(text):
+    """Splits identifiers and prose into lowercase word stems (snake_case and camelCase aware)."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "")
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    # Crude plural stemming so "brands" matches `brand` and "t-shirts" matches `t_shirts`
+    return [word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words]
+
+
+class SchemaIndex:
+    """BM25 index over table names, column names and comments."""
+
+    def __init__(self, tables, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents = {}
+        for name, table in tables.items():
+            text = [name, table.get("comment") or ""]
+            for col in table["columns"]:
+                text.extend([col["name"], col.get("comment") or ""])
+            # Repeat the table name so a direct mention outranks a matching column elsewhere
+            self.documents[name] = Counter(tokenize(" ".join(text)) + tokenize(name) * 2)
+        self.average_length = (
+            sum(sum(doc.values()) for doc in self.documents.values()) / len(self.documents)
+            if self.documents else 0.0
+        )
+        document_frequency = Counter()
+        for doc in self.documents.values():
+            document_frequency.update(doc.keys())
+        total = len(self.documents)
+        self.idf = {
+            term: math.log(1 + (total - count + 0.5) / (count + 0.5))
+            for term, count in document_frequency.items()
+        }
+
+    def rank(self, question):
+        """Returns [(table_name, score)] sorted best first; tables with no matching terms score 0."""
+        terms = set(tokenize(question))
+        scores = []
+        for name, doc in self.documents.items():
+            length = sum(doc.values())
+            score = 0.0
+            for term in terms & doc.keys():
+                tf = doc[term]
+                norm = tf + self.k1 * (1 - self.b + self.b * length / self.average_length)
+                score += self.idf[term] * tf * (self.k1 + 1) / norm
+            scores.append((name, score))
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        return scores
+
+
+def describe_table(name, table, quote="`"):
+    """Renders one table as a compact single-line schema description."""
+    primary_key = set(table["primary_key"])
+    columns = ", ".join(
+        f"{quote}{col['name']}{quote} {col['type']}{' PK' if col['name'] in primary_key else ''}"
+        + (f" -- {col['comment']}" if col.get("comment") else "")
+        for col in table["columns"]
+    )
+    line = f"    {quote}{name}{quote}({columns})"
+    if table.get("comment"):
+        line += f" -- {table['comment']}"
+    return line
+
+
+class PromptBuilder:
+    """Builds a per-question prompt whose schema section holds only the most relevant tables.
+
+    Tables are ranked against the question with a local BM25 index and added best first until
+    token_budget is spent, so the prompt stays bounded however large the schema grows. With an
+    ExampleStore, the few-shot examples are the example_count stored pairs most similar to the
+    question instead of the fixed examples text.
+    """
+
+    def __init__(self, schema_cache, token_budget=1500, max_tables=10, examples="", example_store=None, example_count=3):
+        self.schema_cache = schema_cache
+        self.token_budget = token_budget
+        self.max_tables = max_tables
+        self.examples = examples
+        self.example_store = example_store
+        self.example_count = example_count
+        self._state = None  # (tables, index, descriptions, schema_tokens), replaced whole
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, schema_cache, examples="", example_store=None):
+        """Builds a prompt builder configured from PROMPT_* environment variables."""
+        return cls(
+            schema_cache,
+            token_budget=int(os.environ.get("PROMPT_TOKEN_BUDGET", 1500)),
+            max_tables=int(os.environ.get("PROMPT_MAX_TABLES", 10)),
+            examples=examples,
+            example_store=example_store,
+            example_count=int(os.environ.get("PROMPT_EXAMPLE_COUNT", 3)),
+        )
+
+    @property
+    def quote(self):
+        return '"' if self.schema_cache.engine.dialect.name == "postgresql" else "`"
+
+    def _refresh(self):
+        """Returns the current state, rebuilding it only when the schema cache hands back a new snapshot.
+
+        The index and descriptions are built outside the lock and swapped in together, so a
+        concurrent build never ranks with one snapshot and describes with another.
+        """
+        tables = self.schema_cache.snapshot()
+        with self._lock:
+            state = self._state
+        if state is None or state[0] is not tables:
+            descriptions = {name: describe_table(name, table, self.quote) for name, table in tables.items()}
+            schema_tokens = sum(estimate_tokens(text) for text in descriptions.values())
+            state = (tables, SchemaIndex(tables), descriptions, schema_tokens)
+            with self._lock:
+                self._state = state
+        return state
+
+    def select_tables(self, question):
+        """Returns the table names to include for question, best first, within the token budget."""
+        return self._select(self._refresh(), question)
+
+    def _select(self, state, question):
+        _, index, descriptions, schema_tokens = state
+        ranked = index.rank(question)
+        selected, used = [], 0
+        for name, score in ranked:
+            if len(selected) >= self.max_tables:
+                break
+            # On small schemas everything fits; otherwise only tables the question touches are useful
+            if schema_tokens > self.token_budget and score <= 0 and selected:
+                break
+            cost = estimate_tokens(descriptions[name])
+            if selected and used + cost > self.token_budget:
+                continue
+            selected.append(name)
+            used += cost
+        return selected
+
+    def build(self, question, previous=None):
+        """Returns the prompt for question in the same one-element list shape as sql.get_prompt().
+
+        previous is the session's last (question, sql), so a follow-up like "now only the white
+        ones" is written as a refinement of that query, which the session's results can answer.
+        It is left out for a question that stands on its own, so the prompt (and the response
+        cache key hashed from it) does not change with whatever was asked before.
+        """
+        if previous is not None and not is_follow_up(question):
+            previous = None
+        state = self._refresh()
+        descriptions = state[2]
+        tables = self._select(state, question)
+        if previous is not None:
+            # A follow-up rarely names its table, so keep the previous query's tables in the prompt
+            tables += [name for name in sorted(referenced_tables(previous[1])) if name in descriptions and name not in tables]
+        quote = self.quote
+        # The examples only help when they use a table that is in the prompt
+        if self.example_store is not None:
+            matches = self.example_store.search(question, self.example_count, tables)
+            examples = render_examples((example, sql_query) for _, example, sql_query in matches)
+        else:
+            examples = self.examples if any(f"`{name}`" in self.examples for name in tables) else ""
+        return [
+            PROMPT_TEMPLATE.format(
+                dialect=self.schema_cache.engine.dialect.name,
+                quote="double quotes" if quote == '"' else "backticks",
+                schema="\n".join(descriptions[name] for name in tables),
+                examples=f"\n    Examples:\n{examples}" if examples else "",
+                previous=PREVIOUS_TEMPLATE.format(question=previous[0], sql=previous[1]) if previous else "",
+            )
+        ]
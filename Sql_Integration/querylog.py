@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqltext import normalize_sql
+
+
+class QueryLog:
+    """Keeps per-statement execution counts and timings, keyed by normalized SQL.
+
+    Each entry also keeps the latest statement as it was run, as "sample": the normalized key
+    spaces out operators such as >= and is not meant to be executed.
+
+    Statements are kept in an LRU of max_entries. Every execution is optionally appended to a
+    JSON-lines file, so offline tools such as the index advisor can read the whole history.
+    """
+
+    def __init__(self, max_entries=1000, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()  # normalized SQL -> dict(count, errors, total_seconds, ...)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Builds a query log from QUERY_LOG_* environment variables."""
+        return cls(
+            max_entries=int(os.environ.get("QUERY_LOG_SIZE", 1000)),
+            path=os.environ.get("QUERY_LOG_PATH") or None,
+        )
+
+    @classmethod
+    def load(cls, path, max_entries=100000):
+        """Rebuilds a query log from a JSON-lines file written by another process."""
+        log = cls(max_entries=max_entries)
+        with open(path, encoding="utf-8") as lines:
+            for line in lines:
+                if line.strip():
+                    entry = json.loads(line)
+                    log._add(entry["sql"], entry.get("sample", entry["sql"]), entry["seconds"], entry.get("rows"),
+                             entry.get("source", "database"), entry.get("error", False), entry.get("ts", time.time()))
+        return log
+
+    def record(self, sql_query, seconds, rows=None, source="database", error=False):
+        """Adds one execution of sql_query; source tells the database apart from the in-memory aggregates."""
+        now = time.time()
+        key = normalize_sql(sql_query)
+        with self._lock:
+            self._add(key, sql_query, seconds, rows, source, error, now)
+            if self.path:
+                entry = {"ts": now, "sql": key, "sample": sql_query, "seconds": round(seconds, 6), "rows": rows, "source": source, "error": error}
+                with open(self.path, "a", encoding="utf-8") as log:
+                    log.write(json.dumps(entry) + "\n")
+
+    def _add(self, key, sample, seconds, rows, source, error, now):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            entry = {"sql": key, "count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                     "rows": None, "sources": {}, "last_seen": now}
+        entry["sample"] = sample
+        entry["count"] += 1
+        entry["errors"] += int(bool(error))
+        entry["total_seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        entry["rows"] = rows if rows is not None else entry["rows"]
+        entry["sources"][source] = entry["sources"].get(source, 0) + 1
+        entry["last_seen"] = now
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def entries(self, source=None):
+        """Returns copies of the logged statements, slowest in total first; source keeps only statements run there."""
+        with self._lock:
+            entries = [dict(entry, sources=dict(entry["sources"])) for entry in self._entries.values()]
+        if source is not None:
+            entries = [entry for entry in entries if source in entry["sources"]]
+        for entry in entries:
+            entry["mean_seconds"] = entry["total_seconds"] / entry["count"]
+        return sorted(entries, key=lambda entry: entry["total_seconds"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_query_log = None
+_query_log_lock = threading.Lock()
+
+
+def get_query_log():
+    """Returns the process-wide query log, created from the environment on first use."""
+    global _query_log
+    with _query_log_lock:
+        if _query_log is None:
+            _query_log = QueryLog.from_env()
+        return _query_log
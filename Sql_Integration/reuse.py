@@ -0,0 +1,457 @@
+import operator
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from aggregates import mysql_average, mysql_fold
+from metrics import get_metrics
+from querylog import get_query_log
+from sqltext import normalize_sql, parse_simple_select
+
+COMPARISONS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _python_values(series, kind):
+    """Turns a column back into the Python values a cursor returns: None for NULL, int for integer columns."""
+    values = series.tolist()
+    if not series.hasnans:
+        return values
+    missing = series.isna().tolist()
+    if kind == "integer" and series.dtype.kind == "f":
+        return [None if gap else int(value) for value, gap in zip(values, missing)]
+    return [None if gap else value for value, gap in zip(values, missing)]
+
+
+class SessionResultStore:
+    """Keeps one session's recent results as DataFrames and answers narrower follow-ups from them.
+
+    The store stands in for the shared ResultCache wherever a cache is passed: exact repeats still
+    come from the shared cache, and every complete result is offered to it too. Paging only reads
+    ahead as far as the shared cache would; larger results, up to max_rows, are kept when an
+    export streams them. Complete results of
+    plain single-table selects (columns or *, equality and range filters, no grouping) are also kept
+    here as typed column arrays, in an LRU capped at max_bytes. A later query on the same table
+    whose filters are at least as strict as a kept query's, and which only reads kept columns, is
+    answered by filtering, projecting, grouping, sorting and limiting that frame with pandas.
+    Entries go stale like the shared cache's: on a new MySQL table version, and always after ttl.
+    """
+
+    def __init__(self, engine, shared_cache=None, max_bytes=32 * 1024 * 1024, max_entries=4, max_rows=100000, ttl=300):
+        self.engine = engine
+        self.shared_cache = shared_cache
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.rows_served = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # normalized SQL -> dict(query, frame, kinds, versions, created_at, size)
+        self._lock = threading.Lock()
+        self._dialect = engine.dialect.name
+        self._fold = mysql_fold if self._dialect == "mysql" else (lambda value: value)
+
+    @classmethod
+    def from_env(cls, engine, shared_cache=None):
+        """Builds a session store from SESSION_RESULT_* environment variables."""
+        return cls(
+            engine, shared_cache,
+            max_bytes=int(os.environ.get("SESSION_RESULT_MAX_BYTES", 32 * 1024 * 1024)),
+            max_entries=int(os.environ.get("SESSION_RESULT_ENTRIES", 4)),
+            max_rows=int(os.environ.get("SESSION_RESULT_MAX_ROWS", 100000)),
+            ttl=float(os.environ.get("SESSION_RESULT_TTL", 300)),
+        )
+
+    @property
+    def max_entry_rows(self):
+        """A page read reads results up to this many rows to the end; the shared cache's limit, so page 1 stays fast."""
+        return self.shared_cache.max_entry_rows if self.shared_cache is not None else 0
+
+    @property
+    def max_stream_rows(self):
+        """A stream that reads the whole result anyway (an export) keeps results up to this many rows."""
+        return max(self.max_rows, self.max_entry_rows)
+
+    def _versions(self, table):
+        return self.shared_cache.versions_for([table]) if self.shared_cache is not None else None
+
+    def _fresh(self, entry):
+        if time.time() - entry["created_at"] > self.ttl:
+            return False
+        return entry["versions"] is None or self._versions(entry["query"]["table"]) == entry["versions"]
+
+    # --- Keeping results ---
+
+    def set(self, sql_query, columns, rows):
+        """Offers a complete result to the shared cache and keeps it here if later queries can derive from it."""
+        if self.shared_cache is not None:
+            self.shared_cache.set(sql_query, columns, rows)
+        if len(rows) > self.max_rows:
+            return
+        query = parse_simple_select(sql_query)
+        if query is None or query["distinct"] or query["group_by"] or any(item["function"] for item in query["select"]):
+            return
+        if query["limit"] is not None and len(rows) >= query["limit"]:
+            return  # Cut off by its LIMIT, so rows past it are missing
+        if len({name.lower() for name in columns}) != len(columns):
+            return
+
+        from frames import build_frame, column_array, object_array
+
+        with get_metrics().stage("dataframe", rows=len(rows)):
+            values = list(zip(*rows)) if rows else [() for _ in columns]
+            arrays = [column_array(column) if column else object_array([]) for column in values]
+            frame = build_frame(list(columns), arrays)
+        kinds = {}
+        for name, array, column in zip(columns, arrays, values):
+            sample = next((value for value in column if value is not None), None)
+            if array.dtype.kind in "iu":
+                kinds[name] = "integer"
+            elif array.dtype.kind == "f":
+                kinds[name] = "integer" if isinstance(sample, int) else "number"  # Whole numbers with NULLs as NaN
+            elif isinstance(sample, str):
+                kinds[name] = "text"  # SQL columns are homogeneous, so the first value decides
+            else:
+                kinds[name] = "other"
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+
+        key = normalize_sql(sql_query)
+        versions = self._versions(query["table"])
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                "query": query,
+                "frame": frame,
+                "kinds": kinds,
+                "folded": {},  # column -> values folded for MySQL comparisons, filled on first use
+                "versions": versions,
+                "created_at": time.time(),
+                "size": size,
+            }
+            self.current_bytes += size
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        self.current_bytes -= self._entries.pop(key)["size"]
+
+    def clear(self):
+        """Drops every kept result."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    # --- Answering queries ---
+
+    def get(self, sql_query):
+        """Returns (column_names, rows) from the shared cache or derived from a kept result, else None."""
+        if self.shared_cache is not None:
+            cached = self.shared_cache.get(sql_query)
+            if cached is not None:
+                return cached
+        query = parse_simple_select(sql_query)
+        start = time.perf_counter()
+        with self._lock:
+            entries = list(self._entries.items())
+        # Freshness may query information_schema, so it is checked without holding the lock
+        stale = {key for key, entry in entries if not self._fresh(entry)}
+        with self._lock:
+            for key, entry in entries:
+                if key in stale and self._entries.get(key) is entry:
+                    self._drop(key)
+        candidates = [
+            (key, entry) for key, entry in reversed(entries)  # Newest first
+            if query is not None and key not in stale and entry["query"]["table"].lower() == query["table"].lower()
+        ]
+
+        result = None
+        for key, entry in candidates:
+            try:
+                result = self._derive(entry, query)
+            except Exception as e:
+                print(f"Error answering from the session's results: {e}")
+                result = None
+            if result is not None:
+                break
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            self.rows_served += len(result[1])
+
+        seconds = time.perf_counter() - start
+        get_metrics().record("sql_execution", seconds, source="session")
+        get_query_log().record(sql_query, seconds, rows=len(result[1]), source="session")
+        return result
+
+    def _key(self, value):
+        # Text and numbers never compare equal to each other here; each database coerces them its own way
+        return ("text", self._fold(value)) if isinstance(value, str) else ("number", value)
+
+    def _implies(self, base, query):
+        """Whether every row query can return passes base's filters, so base's rows are enough."""
+        for column, values in base["where"]:
+            accepted = {self._key(value) for value in values}
+            narrower = [
+                query_values for query_column, query_values in query["where"]
+                if query_column.lower() == column.lower()
+            ]
+            if not any({self._key(value) for value in query_values} <= accepted for query_values in narrower):
+                return False
+        for column, comparison, bound in base["ranges"]:
+            if not _is_number(bound):
+                return False  # Text ranges follow each database's collation
+            passes = COMPARISONS[comparison]
+            implied = any(
+                all(_is_number(value) and passes(value, bound) for value in query_values)
+                for query_column, query_values in query["where"] if query_column.lower() == column.lower()
+            )
+            for query_column, query_comparison, query_bound in query["ranges"]:
+                if implied or query_column.lower() != column.lower() or not _is_number(query_bound):
+                    continue
+                if comparison[0] == query_comparison[0]:  # Same direction: the query's bound must be as tight
+                    implied = passes(query_bound, bound) or (query_bound == bound and (
+                        comparison.endswith("=") or not query_comparison.endswith("=")))
+            if not implied:
+                return False
+        return True
+
+    def _folded(self, entry, name):
+        folded = entry["folded"].get(name)
+        if folded is None:
+            folded = entry["frame"][name].map(self._fold)
+            entry["folded"][name] = folded
+        return folded
+
+    def _comparable(self, entry, name):
+        """The column as the database compares it: folded text on MySQL, otherwise as stored."""
+        if entry["kinds"][name] == "text" and self._dialect == "mysql":
+            return self._folded(entry, name)
+        return entry["frame"][name]
+
+    def _sortable(self, kind):
+        # pandas compares text by code point, which is SQLite's default; MySQL is approximated by folding
+        return kind in ("integer", "number") or (kind == "text" and self._dialect in ("sqlite", "mysql"))
+
+    def _sort(self, frame, keys, kinds):
+        """Stable-sorts frame by [(column, descending)], NULLs sorting as the smallest values except on PostgreSQL."""
+        for name, descending in reversed(keys):
+            nulls_first = descending if self._dialect == "postgresql" else not descending
+            fold = kinds[name] == "text" and self._dialect == "mysql"
+            frame = frame.sort_values(
+                name, ascending=not descending, kind="stable", na_position="first" if nulls_first else "last",
+                key=(lambda series: series.map(mysql_fold)) if fold else None,
+            )
+        return frame
+
+    def _derive(self, entry, query):
+        """Answers query from entry's frame, or returns None when the answer cannot be proven to match the database."""
+        base = entry["query"]
+        frame, kinds = entry["frame"], entry["kinds"]
+        if not self._implies(base, query):
+            return None
+        names = {name.lower(): name for name in frame.columns}
+
+        mask = None
+        for column, values in query["where"]:
+            name = names.get(column.lower())
+            if name is None:
+                return None
+            if all(isinstance(value, str) for value in values) and kinds[name] == "text":
+                condition = self._comparable(entry, name).isin({self._fold(value) for value in values})
+            elif all(_is_number(value) for value in values) and kinds[name] in ("integer", "number"):
+                condition = frame[name].isin(values)
+            else:
+                return None
+            mask = condition if mask is None else mask & condition
+        for column, comparison, bound in query["ranges"]:
+            name = names.get(column.lower())
+            if name is None or not _is_number(bound) or kinds[name] not in ("integer", "number"):
+                return None
+            condition = COMPARISONS[comparison](frame[name], bound)  # NaN compares false, like NULL
+            mask = condition if mask is None else mask & condition
+        filtered = frame[mask] if mask is not None else frame
+
+        # Expand * into the kept columns; that is the whole table only when the kept query read *
+        items = []
+        for item in query["select"]:
+            if item["column"] == "*" and not item["function"]:
+                if [kept["column"] for kept in base["select"]] != ["*"]:
+                    return None
+                items += [{"name": name, "function": None, "column": name, "distinct": False} for name in frame.columns]
+            elif item["column"] != "*" and item["column"].lower() not in names:
+                return None
+            else:
+                items.append(item)
+
+        if query["group_by"] or any(item["function"] for item in items):
+            result = self._aggregate(entry, filtered, query, items, names)
+        else:
+            result = self._project(filtered, query, items, names, kinds)
+        if result is None:
+            return None
+        columns, frame, output_kinds = result
+        if query["limit"] is not None:
+            frame = frame.head(query["limit"])
+        values = [_python_values(frame.iloc[:, position], kind) for position, kind in enumerate(output_kinds)]
+        return columns, list(zip(*values))
+
+    def _order_position(self, reference, output_names):
+        """Resolves an ORDER BY reference to a select list position, or None."""
+        if isinstance(reference, int):
+            return reference - 1 if 0 < reference <= len(output_names) else None
+        lowered = [name.lower() for name in output_names]
+        return lowered.index(reference.lower()) if reference.lower() in lowered else None
+
+    def _project(self, filtered, query, items, names, kinds):
+        """Plain rows: sort on the kept columns, then pick the select list and drop duplicates for DISTINCT."""
+        sources = [names[item["column"].lower()] for item in items]
+        output_names = [item["name"] for item in items]
+        keys = []
+        for reference, descending in query["order_by"]:
+            position = self._order_position(reference, output_names)
+            if position is not None:
+                name = sources[position]
+            elif not query["distinct"] and isinstance(reference, str) and reference.lower() in names:
+                name = names[reference.lower()]  # A column that is sorted on but not selected
+            else:
+                return None
+            if not self._sortable(kinds[name]):
+                return None
+            keys.append((name, descending))
+        if keys:
+            filtered = self._sort(filtered, keys, kinds)
+
+        projected = filtered[sources]
+        projected.columns = range(len(sources))  # The same column may be selected twice
+        if query["distinct"]:
+            duplicate_keys = projected.copy()
+            for position, name in enumerate(sources):
+                if kinds[name] == "text" and self._dialect == "mysql":
+                    duplicate_keys[position] = duplicate_keys[position].map(mysql_fold)
+            projected = projected[~duplicate_keys.duplicated()]
+        return output_names, projected, [kinds[name] for name in sources]
+
+    def _aggregate(self, entry, filtered, query, items, names):
+        """GROUP BY and COUNT/SUM/AVG/MIN/MAX over the filtered rows, one vectorized pass per select item."""
+        import pandas as pd
+
+        kinds = entry["kinds"]
+        if query["distinct"]:
+            return None
+        group_names = []
+        for column in query["group_by"]:
+            name = names.get(column.lower())
+            if name is None:
+                return None
+            group_names.append(name)
+        plain = [names[item["column"].lower()] for item in items if not item["function"]]
+        if any(name not in group_names for name in plain):
+            return None  # Not a valid grouped query in strict SQL
+
+        # Group on the values as the database compares them, and report each group's first stored value
+        work = pd.DataFrame(index=filtered.index)
+        for position, name in enumerate(group_names):
+            work[f"key_{position}"] = self._comparable(entry, name).loc[filtered.index]
+        if not group_names:
+            work["key_0"] = 0
+        key_columns = list(work.columns)
+
+        series, output_kinds = [], []
+        for position, item in enumerate(items):
+            function = item["function"]
+            column = item["column"]
+            if function is None:
+                name = names[column.lower()]
+                work[f"value_{position}"] = filtered[name]
+                kind = kinds[name]
+            elif function == "count" and column == "*":
+                kind = "integer"
+            else:
+                name = names[column.lower()]
+                kind = kinds[name]
+                if function == "count":
+                    source = self._comparable(entry, name).loc[filtered.index] if item["distinct"] else filtered[name]
+                    work[f"value_{position}"] = source
+                    kind = "integer"
+                elif item["distinct"] or kind not in ("integer", "number"):
+                    return None  # SUM/AVG need numbers; text MIN/MAX follow the collation
+                elif function == "avg" and kind == "number" and self._dialect == "mysql":
+                    return None  # MySQL's AVG scale follows the column's, which the stored floats no longer show
+                else:
+                    work[f"value_{position}"] = filtered[name]
+                    if function == "avg":
+                        kind = "number"
+            output_kinds.append(kind)
+
+        grouped = work.groupby(key_columns, dropna=False, sort=False)
+        for position, item in enumerate(items):
+            function = item["function"]
+            value = f"value_{position}"
+            if function is None:
+                series.append(grouped[value].first())
+            elif function == "count" and item["column"] == "*":
+                series.append(grouped.size())
+            elif function == "count":
+                series.append(grouped[value].nunique() if item["distinct"] else grouped[value].count())
+            elif function == "sum":
+                series.append(grouped[value].sum(min_count=1))
+            elif function == "avg" and self._dialect == "mysql":
+                totals, counts = grouped[value].sum(min_count=1), grouped[value].count()
+                series.append(pd.Series(
+                    [float(mysql_average(int(total), count)) if count else None for total, count in zip(totals, counts)],
+                    index=totals.index, dtype="float64",
+                ))
+            elif function == "avg":
+                series.append(grouped[value].mean())
+            else:
+                series.append(getattr(grouped[value], function)())
+
+        output_names = [item["name"] for item in items]
+        if not group_names and filtered.empty:
+            # An aggregate without GROUP BY always returns one row
+            row = [0 if item["function"] == "count" else None for item in items]
+            return output_names, pd.DataFrame([row], dtype=object, columns=range(len(items))), output_kinds
+        frame = pd.concat(series, axis=1, ignore_index=True).reset_index(drop=True)
+        frame.columns = range(len(items))
+
+        result_kinds = dict(enumerate(output_kinds))
+        if query["order_by"]:
+            keys = []
+            for reference, descending in query["order_by"]:
+                position = self._order_position(reference, output_names)
+                if position is None or not self._sortable(result_kinds[position]):
+                    return None
+                keys.append((position, descending))
+            frame = self._sort(frame, keys, result_kinds)
+        elif group_names:
+            # Groups come out ordered by their values, as from the precomputed aggregates
+            group_positions = [position for position, item in enumerate(items) if not item["function"]]
+            if all(self._sortable(result_kinds[position]) for position in group_positions):
+                frame = self._sort(frame, [(position, False) for position in group_positions], result_kinds)
+        return output_names, frame, output_kinds
+
+    def stats(self):
+        """Returns follow-ups answered locally, the rows they returned and the memory held."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "rows_served": self.rows_served,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+            }
@@ -0,0 +1,337 @@
+"""Routes read-only queries across the primary database and its read replicas.
+
+    python routing.py "SELECT COUNT(*) FROM t_shirts" --reads 200 --threads 8
+
+The primary is DATABASE_URI; replicas are listed in DATABASE_REPLICAS as name=uri pairs. The
+command above runs the query concurrently through the router and prints where the reads went,
+which makes it easy to try policies and lag limits against local SQLite or MySQL stand-ins.
+"""
+import argparse
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+
+from metrics import percentile
+
+POLICIES = ("least_loaded", "round_robin")
+
+
+def parse_sources(value):
+    """Parses "name=uri,name=uri" into [(name, uri)]; a bare uri is named replica1, replica2, ..."""
+    sources = []
+    for index, entry in enumerate((part.strip() for part in value.split(",") if part.strip()), 1):
+        match = re.match(r"(\w+)=(.+)", entry)
+        if match and ":" not in match.group(1):
+            sources.append((match.group(1), match.group(2).strip()))
+        else:
+            sources.append((f"replica{index}", entry))
+    return sources
+
+
+def replica_lag(connection, lag_query=None):
+    """Returns how many seconds the server behind connection is behind its source.
+
+    lag_query, when given, is run instead and must return the lag in seconds (e.g. from a table a
+    test stand-in updates). A server that is not replicating reports 0; a MySQL replica whose
+    replication is stopped reports infinity.
+    """
+    if lag_query:
+        return float(connection.execute(text(lag_query)).scalar() or 0)
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        for statement, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"), ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+            try:
+                row = connection.execute(text(statement)).mappings().first()
+            except DBAPIError:
+                continue  # Servers before 8.0.22 only know SHOW SLAVE STATUS
+            if row is None:
+                return 0.0
+            return float("inf") if row.get(column) is None else float(row[column])
+        return 0.0
+    if dialect == "postgresql":
+        return float(connection.execute(text(
+            "SELECT CASE WHEN pg_is_in_recovery() "
+            "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END"
+        )).scalar())
+    return 0.0
+
+
+class DataSource:
+    """One database server with its own pooled engine, plus the load and latency seen on it."""
+
+    def __init__(self, name, engine, role="replica", window=1000):
+        self.name = name
+        self.engine = engine
+        self.role = role
+        self.reads = 0  # Connections the router handed out for reads
+        self.queries = 0
+        self.errors = 0
+        self.in_use = 0  # Pooled connections checked out right now, whoever took them
+        self.lag = 0.0 if role == "primary" else None
+        self.lag_checked_at = 0.0
+        self.down_until = 0.0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        # Engine events see every connection and statement on the source, however it was checked out
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        event.listen(engine, "handle_error", self._on_error)
+
+    def _on_checkout(self, dbapi_connection, record, proxy):
+        with self._lock:
+            self.in_use += 1
+
+    def _on_checkin(self, dbapi_connection, record):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def _before_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - connection.info["query_started"].pop()
+        with self._lock:
+            self.queries += 1
+            self.latencies.append(seconds)
+
+    def _on_error(self, context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+        with self._lock:
+            self.errors += 1
+
+    def load(self):
+        """(connections in use, mean latency) for least-loaded selection."""
+        with self._lock:
+            return self.in_use, (sum(self.latencies) / len(self.latencies)) if self.latencies else 0.0
+
+    def stats(self):
+        with self._lock:
+            ordered = sorted(self.latencies)
+        pool = self.engine.pool
+        return {
+            "name": self.name,
+            "role": self.role,
+            "reads": self.reads,
+            "queries": self.queries,
+            "errors": self.errors,
+            "in_use": self.in_use,
+            "pool_size": pool.size() if hasattr(pool, "size") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "lag": self.lag,
+            "down": self.down_until > time.time(),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 2) if ordered else None,
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 2) if ordered else None,
+        }
+
+
+class SourceRouter:
+    """Sends read-only queries to read replicas and everything else to the primary.
+
+    Each read goes to the replica with the fewest connections in use (least_loaded, ties to the
+    lower mean latency) or to the next one in turn (round_robin). Replica lag is checked at most
+    every lag_check_interval seconds; a replica more than max_lag seconds behind, or one that
+    failed to connect within the last retry_interval seconds, is skipped. With no usable replica
+    the read falls back to the primary.
+    """
+
+    def __init__(self, primary, replicas, policy="least_loaded", max_lag=30, lag_check_interval=5,
+                 retry_interval=30, lag_query=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown routing policy {policy!r}; choose one of {', '.join(POLICIES)}.")
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.policy = policy
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.retry_interval = retry_interval
+        self.lag_query = lag_query
+        self.fallbacks = 0  # Reads sent to the primary because no replica was usable
+        self._turn = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, engine):
+        """Builds a router for the primary engine from DATABASE_REPLICAS and REPLICA_* settings, or None without replicas."""
+        from sql import get_engine  # sql imports this module for its checkouts
+
+        replicas = parse_sources(os.environ.get("DATABASE_REPLICAS", ""))
+        if not replicas:
+            return None
+        return cls(
+            DataSource("primary", engine, role="primary"),
+            [DataSource(name, get_engine(uri)) for name, uri in replicas],
+            policy=os.environ.get("REPLICA_POLICY", "least_loaded"),
+            max_lag=float(os.environ.get("REPLICA_MAX_LAG", 30)),
+            lag_check_interval=float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 5)),
+            retry_interval=float(os.environ.get("REPLICA_RETRY_INTERVAL", 30)),
+            lag_query=os.environ.get("REPLICA_LAG_QUERY") or None,
+        )
+
+    @property
+    def sources(self):
+        return [self.primary] + self.replicas
+
+    def source_for(self, engine):
+        """Returns the source whose engine is engine, or None if it is not one of the router's."""
+        return next((source for source in self.sources if source.engine is engine), None)
+
+    def _mark_down(self, source, error):
+        print(f"Error using data source {source.name}: {error}")
+        source.down_until = time.time() + self.retry_interval
+
+    def _check_lag(self):
+        """Measures the lag of every replica that is due, outside the router lock."""
+        now = time.time()
+        with self._lock:
+            due = [source for source in self.replicas
+                   if now - source.lag_checked_at >= self.lag_check_interval and source.down_until <= now]
+            for source in due:
+                source.lag_checked_at = now  # Claimed, so concurrent reads don't check it too
+        for source in due:
+            try:
+                with source.engine.connect() as connection:
+                    source.lag = replica_lag(connection, self.lag_query)
+            except Exception as e:
+                source.lag = None
+                self._mark_down(source, e)
+
+    def usable_replicas(self):
+        """Replicas that are up and no further behind than max_lag, in configuration order."""
+        self._check_lag()
+        now = time.time()
+        return [source for source in self.replicas
+                if source.down_until <= now and source.lag is not None and source.lag <= self.max_lag]
+
+    def select(self, exclude=()):
+        """Picks the source for the next read."""
+        candidates = [source for source in self.usable_replicas() if source.name not in exclude]
+        with self._lock:
+            if not candidates:
+                self.fallbacks += 1
+                return self.primary
+            if self.policy == "round_robin":
+                self._turn += 1
+                return candidates[self._turn % len(candidates)]
+        return min(candidates, key=lambda source: source.load())
+
+    def connect(self, read_only=True):
+        """Returns a new connection for a query; reads go to a replica, anything else to the primary.
+
+        A replica that fails to connect is marked down and the next one is tried, then the primary.
+        """
+        if not read_only:
+            return self.primary.engine.connect()
+        tried = set()
+        while True:
+            source = self.select(exclude=tried)
+            try:
+                connection = source.engine.connect()
+            except Exception as e:
+                if source is self.primary:
+                    raise
+                self._mark_down(source, e)
+                tried.add(source.name)
+                continue
+            with self._lock:
+                source.reads += 1
+            return connection
+
+    def metadata_engine(self):
+        """The engine for schema and statistics reads: the first usable replica, else the primary.
+
+        Always preferring the same replica keeps the schema cache and background statistics, which
+        are kept per engine, from being built once per replica.
+        """
+        replicas = self.usable_replicas()
+        return replicas[0].engine if replicas else self.primary.engine
+
+    def stats(self):
+        """Returns per-source reads, queries, errors, pool use, lag and latency percentiles."""
+        return [source.stats() for source in self.sources]
+
+    def to_prometheus(self, prefix="sql_assistant"):
+        """Renders the per-source statistics in the Prometheus text exposition format."""
+        stats = self.stats()
+        lines = []
+        for name, key, kind, help_text in (
+            ("source_reads_total", "reads", "counter", "Read connections the router handed to the source."),
+            ("source_queries_total", "queries", "counter", "Statements executed on the source."),
+            ("source_errors_total", "errors", "counter", "Statements or connections on the source that failed."),
+            ("source_connections_in_use", "in_use", "gauge", "Pooled connections checked out from the source."),
+            ("source_replica_lag_seconds", "lag", "gauge", "Last measured replication lag of the source."),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for source in stats:
+                if source[key] is not None:
+                    lines.append(f'{prefix}_{name}{{source="{source["name"]}",role="{source["role"]}"}} {source[key]}')
+        lines.append(f"# HELP {prefix}_source_latency_seconds Statement latency per source over its recent window.")
+        lines.append(f"# TYPE {prefix}_source_latency_seconds summary")
+        for source in stats:
+            for quantile, key in (("0.5", "p50_ms"), ("0.95", "p95_ms")):
+                if source[key] is not None:
+                    lines.append(f'{prefix}_source_latency_seconds{{source="{source["name"]}",quantile="{quantile}"}} '
+                                 f"{source[key] / 1000:.6f}")
+        lines.append(f"# HELP {prefix}_replica_fallbacks_total Reads sent to the primary because no replica was usable.")
+        lines.append(f"# TYPE {prefix}_replica_fallbacks_total counter")
+        lines.append(f"{prefix}_replica_fallbacks_total {self.fallbacks}")
+        return "\n".join(lines) + "\n"
+
+
+_routers = {}  # primary engine URL -> SourceRouter or None, so every database object on an engine shares one
+_routers_lock = threading.Lock()
+
+
+def get_router(engine):
+    """Returns the shared SourceRouter for the primary engine, or None when no replicas are configured."""
+    key = engine.url.render_as_string(hide_password=False)
+    with _routers_lock:
+        if key not in _routers:
+            _routers[key] = SourceRouter.from_env(engine)
+        return _routers[key]
+
+
+def main():
+    import sql
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sql_query", help="Read-only query to run")
+    parser.add_argument("--reads", type=int, default=100, help="Times to run it")
+    parser.add_argument("--threads", type=int, default=4, help="Concurrent readers")
+    args = parser.parse_args()
+
+    _, db_uri = sql.load_environment_variables()
+    db = sql.get_db(db_uri)
+    router = get_router(db._engine)
+    if router is None:
+        raise SystemExit("No replicas configured. Set DATABASE_REPLICAS to name=uri pairs.")
+
+    def read(_):
+        with router.connect() as connection:
+            connection.execute(text(args.sql_query)).fetchall()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(read, range(args.reads)))
+    print(f"{args.reads} reads in {time.perf_counter() - start:.2f}s with policy {router.policy}, "
+          f"{router.fallbacks} fell back to the primary")
+    for source in router.stats():
+        lag = "n/a" if source["lag"] is None else f"{source['lag']:.1f}s"
+        latency = "no queries" if source["p50_ms"] is None else f"p50 {source['p50_ms']} ms  p95 {source['p95_ms']} ms"
+        print(f"  {source['name']:<12} {source['role']:<8} {source['reads']:>6} reads {source['queries']:>6} queries "
+              f"{source['errors']:>3} errors  {latency}  lag {lag}"
+              f"{'  DOWN' if source['down'] else ''}")
+
+
+if __name__ == "__main__":
+    main()
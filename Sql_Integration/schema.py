@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import NoSuchTableError
+
+
+def get_schema_version(engine):
+    """Returns a cheap value that changes whenever the schema changes, or None if the dialect has none."""
+    with engine.connect() as connection:
+        if engine.dialect.name == "mysql":
+            # CREATE_TIME changes on CREATE/ALTER, the count catches DROP
+            row = connection.execute(
+                text(
+                    "SELECT COUNT(*), MAX(CREATE_TIME) FROM information_schema.TABLES "
+                    "WHERE table_schema = DATABASE()"
+                )
+            ).fetchone()
+            return tuple(row)
+        if engine.dialect.name == "sqlite":
+            return connection.execute(text("PRAGMA schema_version")).scalar()
+    return None
+
+
+def get_table_versions(engine):
+    """Returns {table_name: (UPDATE_TIME, CREATE_TIME)} on MySQL, or None if the dialect has no such signal."""
+    if engine.dialect.name != "mysql":
+        return None
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(
+                "SELECT TABLE_NAME, UPDATE_TIME, CREATE_TIME FROM information_schema.TABLES "
+                "WHERE table_schema = DATABASE()"
+            )
+        )
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+
+class SchemaCache:
+    """Keeps a snapshot of tables, columns, primary keys and indexes in memory.
+
+    The snapshot is reloaded when the dialect's schema version changes (checked at most every
+    check_interval seconds) or, on dialects without a version signal, when it is older than ttl.
+    """
+
+    def __init__(self, engine, ttl=300, check_interval=30):
+        self.engine = engine
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._tables = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Reflects the whole schema, using the bulk inspector calls when available."""
+        inspector = inspect(self.engine)
+        table_names = inspector.get_table_names()
+        tables = {}
+        if hasattr(inspector, "get_multi_columns"):
+            columns = {key[1]: value for key, value in inspector.get_multi_columns().items()}
+            primary_keys = {key[1]: value for key, value in inspector.get_multi_pk_constraint().items()}
+            indexes = {key[1]: value for key, value in inspector.get_multi_indexes().items()}
+            try:
+                comments = {key[1]: value for key, value in inspector.get_multi_table_comment().items()}
+            except NotImplementedError:
+                comments = {}
+        else:
+            columns = {name: inspector.get_columns(name) for name in table_names}
+            primary_keys = {name: inspector.get_pk_constraint(name) for name in table_names}
+            indexes = {name: inspector.get_indexes(name) for name in table_names}
+            comments = {}
+
+        for name in table_names:
+            tables[name] = {
+                "columns": [
+                    {
+                        "name": col["name"],
+                        "type": str(col["type"]),
+                        "nullable": col.get("nullable", True),
+                        "comment": col.get("comment"),
+                    }
+                    for col in columns.get(name, [])
+                ],
+                "primary_key": list((primary_keys.get(name) or {}).get("constrained_columns") or []),
+                "indexes": [
+                    {"name": index["name"], "columns": list(index["column_names"]), "unique": index["unique"]}
+                    for index in indexes.get(name, [])
+                ],
+                "comment": (comments.get(name) or {}).get("text"),
+            }
+        return tables
+
+    def snapshot(self):
+        """Returns {table_name: metadata}, reloading it first if the schema has changed."""
+        with self._lock:
+            now = time.time()
+            if self._tables is not None and now - self._checked_at < self.check_interval:
+                return self._tables
+
+            version = get_schema_version(self.engine)
+            self._checked_at = now
+            stale = (
+                self._tables is None
+                or (version is not None and version != self._version)
+                or (version is None and now - self._loaded_at > self.ttl)
+            )
+            if stale:
+                self._tables = self._load()
+                self._version = version
+                self._loaded_at = now
+            return self._tables
+
+    def invalidate(self):
+        """Forces a reload on the next lookup."""
+        with self._lock:
+            self._tables = None
+
+    def table_names(self):
+        return list(self.snapshot())
+
+    def table(self, table_name):
+        """Returns the metadata for one table, raising NoSuchTableError if it does not exist."""
+        tables = self.snapshot()
+        if table_name not in tables:
+            raise NoSuchTableError(table_name)
+        return tables[table_name]
+
+    def columns(self, table_name):
+        return self.table(table_name)["columns"]
+
+    def column_names(self, table_name):
+        return [col["name"] for col in self.columns(table_name)]
+
+    def primary_key(self, table_name):
+        return self.table(table_name)["primary_key"]
+
+    def indexes(self, table_name):
+        return self.table(table_name)["indexes"]
+
+
+_schema_caches = {}  # engine URL -> SchemaCache, so every database object on an engine shares one
+_schema_caches_lock = threading.Lock()
+
+
+def get_schema_cache(engine):
+    """Returns the shared SchemaCache for engine, configured from SCHEMA_CACHE_* environment variables."""
+    key = engine.url.render_as_string(hide_password=False)
+    with _schema_caches_lock:
+        cache = _schema_caches.get(key)
+        if cache is None:
+            cache = SchemaCache(
+                engine,
+                ttl=float(os.environ.get("SCHEMA_CACHE_TTL", 300)),
+                check_interval=float(os.environ.get("SCHEMA_CHECK_INTERVAL", 30)),
+            )
+            _schema_caches[key] = cache
+        return cache
@@ -0,0 +1,232 @@
+"""Asyncio service that answers questions for many concurrent users from one process.
+
+    python service.py --host 127.0.0.1 --port 8080
+
+    POST /query    {"question": "..."}  ->  {"sql", "columns", "rows", "truncated", "warnings", "seconds"}
+    POST /examples {"question": "...", "sql": "..."}  stores a confirmed pair as a few-shot example
+    GET  /metrics  Prometheus text snapshot
+    GET  /health
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import sql
+from cache import ResponseCache, ResultCache
+from examples import ExampleStore, parse_examples
+from fastpath import get_slot_filler
+from guard import UnsafeQueryError, check_read_only, guard_sql, load_guard_settings
+from metrics import get_metrics
+from prompt_builder import PromptBuilder
+from routing import get_router
+
+
+class QueryService:
+    """Answers questions concurrently on top of the synchronous helpers in sql.py.
+
+    Gemini calls and database work are bounded by separate limits. A DB slot is only taken once
+    the SQL is ready and covers the guard and the query; while Gemini is still generating, the pool
+    is warmed with a connection that goes straight back, so checkout latency is hidden behind the
+    model call without holding a slot or a connection through it.
+    """
+
+    def __init__(self, api_key, db, llm_concurrency=8, db_concurrency=4, max_rows=1000):
+        self.api_key = api_key
+        self.db = db
+        self.max_rows = max_rows
+        self.model = sql.get_model(api_key)
+        self.response_cache = ResponseCache.from_env()
+        self.result_cache = ResultCache.from_env(db._engine)
+        self.example_store = ExampleStore.from_env(seeds=parse_examples(sql.PROMPT_EXAMPLES))
+        self.prompt_builder = PromptBuilder.from_env(
+            db.schema_cache, examples=sql.PROMPT_EXAMPLES, example_store=self.example_store
+        )
+        self.guard_settings = load_guard_settings()
+        self._llm_slots = asyncio.Semaphore(llm_concurrency)
+        self._db_slots = asyncio.Semaphore(db_concurrency)
+        self._threads = ThreadPoolExecutor(max_workers=llm_concurrency + db_concurrency, thread_name_prefix="service")
+        self._warming = None  # The pool warm-up in flight, so concurrent questions share one
+
+    @classmethod
+    def from_env(cls):
+        """Builds the service from .env settings plus SERVICE_* concurrency limits."""
+        api_key, db_uri = sql.load_environment_variables()
+        return cls(
+            api_key,
+            sql.get_db(db_uri),
+            llm_concurrency=int(os.environ.get("SERVICE_LLM_CONCURRENCY", 8)),
+            db_concurrency=int(os.environ.get("SERVICE_DB_CONCURRENCY", 4)),
+            max_rows=int(os.environ.get("SERVICE_MAX_ROWS", 1000)),
+        )
+
+    async def _in_thread(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._threads, partial(fn, *args, **kwargs))
+
+    async def fast_path_sql(self, question):
+        """Returns SQL from the local slot filler for templated questions, or None."""
+        return await self._in_thread(sql.route_to_fast_path, self.db, question)
+
+    async def build_prompt(self, question):
+        """Builds the prompt with the tables and examples most relevant to question."""
+        with get_metrics().stage("prompt_build"):
+            # May reflect the schema or search the examples, so it stays off the event loop
+            return await self._in_thread(self.prompt_builder.build, question)
+
+    async def cached_sql(self, question, prompt):
+        """Returns the response cache's SQL for question asked with prompt, or None."""
+        key = self.response_cache.make_key(question, prompt, sql.MODEL_NAME)
+        return await self._in_thread(self.response_cache.get, key)
+
+    async def ask_gemini(self, question, prompt):
+        """Calls Gemini holding one of the LLM slots and caches its SQL."""
+        async with self._llm_slots:
+            sql_query = await self._in_thread(sql.get_gemini_response, question, prompt, self.api_key, model=self.model)
+        key = self.response_cache.make_key(question, prompt, sql.MODEL_NAME)
+        await self._in_thread(self.response_cache.set, key, sql_query)
+        return sql_query
+
+    async def generate_sql(self, question, fast_path=True):
+        """Generates SQL for question locally when a template fits or it is cached, otherwise from Gemini."""
+        if fast_path:
+            sql_query = await self.fast_path_sql(question)
+            if sql_query is not None:
+                return sql_query
+        prompt = await self.build_prompt(question)
+        sql_query = await self.cached_sql(question, prompt)
+        if sql_query is not None:
+            return sql_query
+        return await self.ask_gemini(question, prompt)
+
+    def _warm_pool(self):
+        """Checks a read connection out and straight back in, so the pool has one open when the SQL is ready."""
+        try:
+            sql.connect_for_read(self.db).close()
+        except Exception as e:
+            print(f"Error warming the connection pool: {e}")
+
+    def _start_warming(self):
+        if self._warming is None or self._warming.done():
+            self._warming = asyncio.ensure_future(self._in_thread(self._warm_pool))
+
+    async def answer(self, question, generate=None):
+        """Returns {"sql", "columns", "rows", "truncated", "warnings", "seconds"} for question.
+
+        generate is an optional coroutine function used instead of generate_sql (e.g. to add rate
+        limiting and retries); its waits do not hold a DB slot.
+        """
+        started = time.perf_counter()
+        self._start_warming()
+        sql_query = await (generate or self.generate_sql)(question)
+        async with self._db_slots:
+            with get_metrics().stage("sql_guard"):
+                guarded = await self._in_thread(guard_sql, self.db, sql_query, self.guard_settings)
+            # Guarded SQL is read-only, so fetch_result checks it out through the read replicas if any
+            columns, rows = await self._in_thread(sql.fetch_result, self.db, guarded.sql_query, cache=self.result_cache)
+        return {
+            "sql": guarded.sql_query,
+            "columns": columns,
+            "rows": [list(row) for row in rows[:self.max_rows]],
+            "truncated": len(rows) > self.max_rows,
+            "warnings": guarded.warnings,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    # --- HTTP/JSON front end ---
+
+    async def handle_connection(self, reader, writer):
+        try:
+            status, content_type, body = await self._handle_request(reader)
+        except Exception as e:
+            status, content_type, body = 500, "application/json", json.dumps({"error": str(e)})
+        payload = body.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Error')}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("ascii")
+            + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) < 2:
+            return 400, "application/json", json.dumps({"error": "Malformed request line."})
+        method, path = request_line[0], request_line[1]
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if method == "GET" and path == "/health":
+            return 200, "application/json", json.dumps({"status": "ok"})
+        if method == "GET" and path == "/metrics":
+            body = get_metrics().to_prometheus()
+            slot_filler = get_slot_filler(self.db._engine)
+            if slot_filler is not None:
+                body += slot_filler.to_prometheus()
+            router = get_router(self.db._engine)
+            if router is not None:
+                body += router.to_prometheus()
+            return 200, "text/plain; version=0.0.4", body
+        if method != "POST" or path not in ("/query", "/examples"):
+            return 404, "application/json", json.dumps({"error": f"No route for {method} {path}."})
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            return 400, "application/json", json.dumps({"error": "Malformed Content-Length header."})
+        body = await reader.readexactly(length)
+        try:
+            payload = json.loads(body or b"{}")
+            question = payload.get("question", "").strip()
+        except (ValueError, AttributeError):
+            return 400, "application/json", json.dumps({"error": "Body must be a JSON object."})
+        if not question:
+            return 400, "application/json", json.dumps({"error": "Missing 'question'."})
+        if path == "/examples":
+            try:
+                self.example_store.add(question, check_read_only(payload.get("sql") or ""))
+            except UnsafeQueryError as e:
+                return 422, "application/json", json.dumps({"error": str(e)})
+            return 200, "application/json", json.dumps({"examples": len(self.example_store)})
+        try:
+            answer = await self.answer(question)
+        except UnsafeQueryError as e:
+            return 422, "application/json", json.dumps({"error": str(e)})
+        return 200, "application/json", json.dumps(answer, default=str)
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 422: "Unprocessable Entity", 500: "Internal Server Error"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    async def run():
+        await QueryService.from_env().serve(args.host, args.port)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
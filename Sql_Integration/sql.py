@@ -1,11 +1,20 @@
 import os
 from dotenv import load_dotenv
-from langchain.sql_database import SQLDatabase
-import google.generativeai as genai
 from decimal import Decimal
-from sqlalchemy import create_engine, inspect, text
+from sqlalchemy import create_engine, text
+from aggregates import get_aggregate_cube
+from fastpath import get_slot_filler
+from querylog import get_query_log
+from metrics import get_metrics
+from guard import UnsafeQueryError, check_read_only, guard_sql
+from routing import get_router
 import json  # Import the json module
+import threading
 import time
+from contextlib import contextmanager
+
+MODEL_NAME = "gemini-1.5-flash-latest"
+
 
 def load_environment_variables():
     """Loads API keys and database credentials from .env file."""
@@ -24,62 +33,110 @@ def load_environment_variables():
     return api_key, db_uri
 
 
-def get_gemini_response(question, prompt, api_key):
-    """Uses the Gemini model to generate SQL from a natural language question."""
-    genai.configure(api_key=api_key)  # Ensure the API key is configured each call.
-    model = genai.GenerativeModel("gemini-1.5-flash-latest")
-    response = model.generate_content([prompt[0], question])
+def load_result_settings():
+    """Reads result streaming settings (chunk size, row cap, page size) from the environment."""
+    return {
+        "chunk_size": int(os.environ.get("RESULT_CHUNK_SIZE", 1000)),
+        "max_rows": int(os.environ.get("RESULT_MAX_ROWS", 100000)),
+        "page_size": int(os.environ.get("RESULT_PAGE_SIZE", 100)),
+    }
+
+
+def load_pool_settings():
+    """Reads connection pool settings from the environment."""
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+    }
+
+
+_engines = {}  # db_uri -> Engine, shared by every database object in the process
+_engines_lock = threading.Lock()
+
+
+def get_engine(db_uri):
+    """Returns the process-wide pooled engine for db_uri, creating it on first use."""
+    with _engines_lock:
+        engine = _engines.get(db_uri)
+        if engine is None:
+            options = load_pool_settings()
+            if db_uri.startswith("sqlite"):
+                # SQLite picks its own pool class, which does not take size limits
+                options.pop("pool_size")
+                options.pop("max_overflow")
+            engine = create_engine(db_uri, **options)
+            _engines[db_uri] = engine
+        return engine
+
+
+_models = {}  # api_key -> GenerativeModel, configured once and reused by every request
+_models_lock = threading.Lock()
+
+
+def get_model(api_key):
+    """Returns the shared Gemini client for api_key, configuring the library on first use."""
+    with _models_lock:
+        model = _models.get(api_key)
+        if model is None:
+            import google.generativeai as genai  # By far the slowest import, and only needed to call Gemini
+
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel(MODEL_NAME)
+            _models[api_key] = model
+        return model
+
+
+def get_gemini_response(question, prompt, api_key, cache=None, model=None):
+    """Uses the Gemini model to generate SQL from a natural language question.
+
+    If a ResponseCache is given, repeated questions are answered from it without calling Gemini.
+    A model object with generate_content (e.g. a benchmark stub) can be passed instead of Gemini.
+    """
+    if cache is not None:
+        key = cache.make_key(question, prompt, MODEL_NAME)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    with get_metrics().stage("gemini_call"):
+        if model is None:
+            model = get_model(api_key)
+        response = model.generate_content([prompt[0], question])
+
+    if cache is not None:
+        cache.set(key, response.text)
     return response.text
 
 
-class CustomSQLDatabase(SQLDatabase):
-    def get_columns_for_table(self, table_name):
-        """Retrieves column names for a given table using the instance's engine."""
-        inspector = inspect(self._engine)
-        columns = inspector.get_columns(table_name)
-        column_names = [col['name'] for col in columns]
-        return column_names
-
-    def get_table_count(self):
-        """Returns the number of tables in the database."""
-        inspector = inspect(self._engine)
-        return len(inspector.get_table_names())
-
-    def get_database_size(self):
-        """Returns the approximate database size in MB for MySQL."""
-        engine = self._engine  # use existing engine
-        conn = engine.raw_connection()
-        cursor = conn.cursor()
-        try:
-            if engine.dialect.name == 'mysql':
-                db_name = engine.url.database
-                cursor.execute(
-                    f"SELECT SUM(data_length + index_length) / (1024 * 1024) FROM information_schema.TABLES WHERE table_schema = '{db_name}';"
-                )
-                size_mb = cursor.fetchone()[0]
-                return round(size_mb, 2) if size_mb else 0.0
-            else:
-                return "N/A (Size estimation not implemented for this database type)"
-        finally:
-            cursor.close()
-            conn.close()
-
-    def get_execution_time(self, sql_query):
-        """Executes a simple query and returns the execution time in seconds."""
-        engine = self._engine
-        try:
-            start_time = time.time()
-            with engine.connect() as connection:
-                connection.execute(text(sql_query))  # Using text clause to protect from SQL injections
-            end_time = time.time()
-            return round(end_time - start_time, 3)
-        except Exception as e:
-            print(f"Error measuring execution time: {e}")
-            return None
+def route_to_fast_path(db, question):
+    """Returns SQL for question from the local slot filler when it is confident, else None (ask Gemini)."""
+    filler = get_slot_filler(db._engine)
+    if filler is None:
+        return None
+    with get_metrics().stage("slot_filling"):
+        return filler.answer(question)
 
 
 def get_db(db_uri):
-    return SQLDatabase.from_uri(db_uri)
+    """Returns a database object backed by the shared engine for db_uri."""
+    from database import CustomSQLDatabase  # LangChain is only loaded once a database object is needed
+
+    # LangChain would otherwise reflect every table up front; the schema cache already does that lazily
+    return CustomSQLDatabase(get_engine(db_uri), lazy_table_reflection=True)
+
+
+PROMPT_EXAMPLES = """
+    Q: List the price of all the white t-shirts from Nike Brand in all the sizes.
+    A: SELECT `size`, `price` FROM `t_shirts` WHERE `brand` = 'Nike' AND `color` = 'white';
+
+    Q: What colors are available for Puma?
+    A: SELECT DISTINCT `color` FROM `t_shirts` WHERE `brand` = 'Puma';
+
+    Q: Show me all stock data for large size.
+    A: SELECT * FROM `t_shirts` WHERE `size` = 'large';
+"""
 
 
 def get_prompt():
@@ -101,48 +158,292 @@ def get_prompt():
     - Do NOT return anything other than SQL code.
 
     Examples:
-
-    Q: List the price of all the white t-shirts from Nike Brand in all the sizes.
-    A: SELECT `size`, `price` FROM `t_shirts` WHERE `brand` = 'Nike' AND `color` = 'white';
-
-    Q: What colors are available for Puma?
-    A: SELECT DISTINCT `color` FROM `t_shirts` WHERE `brand` = 'Puma';
-
-    Q: Show me all stock data for large size.
-    A: SELECT * FROM `t_shirts` WHERE `size` = 'large';
-
+""" + PROMPT_EXAMPLES + """
     Return only the SQL query. No explanation.
         """
     ]
     return prompt
 
 
+def convert_decimal_columns(rows):
+    """Converts Decimal columns to int, or float if any value has a fraction, one column at a time."""
+    if not rows:
+        return []
+    with get_metrics().stage("row_conversion", rows=len(rows)):
+        return _convert_decimal_columns(rows)
+
+
+def _convert_decimal_columns(rows):
+    columns = list(zip(*rows))
+    for index, values in enumerate(columns):
+        sample = next((value for value in values if value is not None), None)
+        if not isinstance(sample, Decimal):
+            continue  # SQL columns are homogeneous, so the first value decides the type
+        if all(value is None or value % 1 == 0 for value in values):
+            columns[index] = tuple(None if value is None else int(value) for value in values)
+        else:
+            columns[index] = tuple(None if value is None else float(value) for value in values)
+    return list(zip(*columns))
+
+
+def rows_to_frame(columns, rows):
+    """Builds a DataFrame from fetched rows one typed column at a time."""
+    from frames import build_frame, column_array, object_array  # NumPy and pandas load on the first DataFrame
+
+    with get_metrics().stage("dataframe", rows=len(rows)):
+        arrays = [column_array(values) for values in zip(*rows)] if rows else [object_array([]) for _ in columns]
+        return build_frame(columns, arrays)
+
+
+def connect_for_read(db):
+    """Returns a new pooled connection for read-only queries: a read replica when any is usable, else the primary."""
+    router = get_router(db._engine)
+    return router.connect() if router is not None else db._engine.connect()
+
+
+def is_read_only(sql_query):
+    try:
+        check_read_only(sql_query)
+        return True
+    except UnsafeQueryError:
+        return False
+
+
+def is_current(db, connection):
+    """Whether rows read on connection may be cached under the primary's table versions.
+
+    That holds for the primary and for a replica whose last measured lag was zero; rows from a
+    replica that is behind would otherwise be cached as the result for versions they predate.
+    """
+    router = get_router(db._engine)
+    if router is None:
+        return True
+    source = router.source_for(connection.engine)
+    return source is not None and source.lag == 0
+
+
+@contextmanager
+def checkout(db, connection=None, sql_query=None):
+    """Yields connection if one is given (e.g. by a QueryExecutor), otherwise a pooled one.
+
+    With read replicas configured, a read-only sql_query gets a replica connection; any other
+    statement runs on the primary.
+    """
+    if connection is not None:
+        yield connection
+    elif sql_query is not None and is_read_only(sql_query):
+        with connect_for_read(db) as pooled:
+            yield pooled
+    else:
+        with db._engine.connect() as pooled:
+            yield pooled
+
+
+@contextmanager
+def timed_query(sql_query):
+    """Times a database query as the sql_execution stage and records it in the query log.
+
+    Yields a dict the caller can put the number of rows read into, under "rows".
+    """
+    run = {"rows": None}
+    start = time.perf_counter()
+    try:
+        with get_metrics().stage("sql_execution"):
+            yield run
+    except Exception:
+        get_query_log().record(sql_query, time.perf_counter() - start, error=True)
+        raise
+    get_query_log().record(sql_query, time.perf_counter() - start, rows=run["rows"])
+
+
+def route_to_aggregates(db, sql_query):
+    """Returns (column_names, rows) from the precomputed aggregates if they can answer sql_query, else None."""
+    cube = get_aggregate_cube(db._engine)
+    if cube is None:
+        return None
+    start = time.perf_counter()
+    try:
+        result = cube.answer(sql_query)
+    except Exception as e:
+        print(f"Error answering from aggregates: {e}")
+        return None
+    if result is None:
+        return None
+    seconds = time.perf_counter() - start
+    get_metrics().record("aggregate_lookup", seconds)  # Its own stage, so sql_execution stays database time
+    columns, rows = result
+    get_query_log().record(sql_query, seconds, rows=len(rows), source="aggregates")
+    return columns, convert_decimal_columns(rows)
+
+
+def fetch_result(db, sql_query, cache=None, connection=None):
+    """Executes the SQL query and returns (column_names, rows) straight from the cursor.
+
+    Queries the precomputed aggregates can answer never reach the database, and if a ResultCache
+    is given, a fresh cached result is returned without touching the database either.
+    """
+    routed = route_to_aggregates(db, sql_query)
+    if routed is not None:
+        return routed
+    if cache is not None:
+        cached = cache.get(sql_query)
+        if cached is not None:
+            return cached
+    with timed_query(sql_query) as run, checkout(db, connection, sql_query) as connection:
+        cursor = connection.execute(text(sql_query))
+        if not cursor.returns_rows:
+            return [], []
+        columns = list(cursor.keys())
+        rows = cursor.fetchall()
+        run["rows"] = len(rows)
+        cacheable = cache is not None and is_current(db, connection)
+    rows = convert_decimal_columns(rows)
+    if cacheable:
+        cache.set(sql_query, columns, rows)
+    return columns, rows
+
+
+def stream_result(db, sql_query, chunk_size=1000, max_rows=None, cache=None, connection=None, convert_decimals=True):
+    """Yields (column_names, rows) chunks from a server-side cursor, stopping after max_rows rows.
+
+    An empty result still yields one empty chunk, so consumers learn the column names. Decimal
+    columns are converted per chunk, so one column can be ints in one chunk and floats in the
+    next; pass convert_decimals=False to get the Decimal values from the cursor instead. With a
+    cache, a complete result of up to cache.max_stream_rows rows is stored once it is read.
+    """
+    cached = route_to_aggregates(db, sql_query)
+    if cached is None and cache is not None:
+        cached = cache.get(sql_query)
+    if cached is not None:
+        columns, rows = cached
+        rows = rows[:max_rows] if max_rows is not None else rows
+        for start in range(0, max(len(rows), 1), chunk_size):
+            yield columns, rows[start:start + chunk_size]
+        return
+    with checkout(db, connection, sql_query) as connection:
+        connection = connection.execution_options(stream_results=True, max_row_buffer=chunk_size)
+        with timed_query(sql_query):
+            cursor = connection.execute(text(sql_query))
+        if not cursor.returns_rows:
+            return
+        columns = list(cursor.keys())
+        fetched = 0
+        # Every row so far, while the result may still fit the cache
+        kept = [] if cache is not None and is_current(db, connection) else None
+        for chunk in cursor.partitions(chunk_size):
+            if max_rows is not None:
+                chunk = chunk[:max_rows - fetched]
+            fetched += len(chunk)
+            if kept is not None:
+                kept.extend(chunk)
+                if len(kept) > cache.max_stream_rows:
+                    kept = None
+            yield columns, convert_decimal_columns(chunk) if convert_decimals else list(chunk)
+            if max_rows is not None and fetched >= max_rows:
+                return  # Rows past max_rows were never read, so the result is incomplete
+        if not fetched:
+            yield columns, []
+    if kept is not None:
+        cache.set(sql_query, columns, convert_decimal_columns(kept))
+
+
+def fetch_page(db, sql_query, page, page_size, chunk_size=1000, max_rows=None, cache=None, connection=None):
+    """Returns (column_names, rows, has_more) for one page of the result.
+
+    Rows before the page are read from the streaming cursor and discarded, so only the
+    requested page is ever held in memory. With a ResultCache, a result small enough to cache
+    is read to the end on first use, and later pages and repeats are sliced from memory.
+    """
+    start = page * page_size
+    stop = start + page_size
+    if max_rows is not None:
+        stop = min(stop, max_rows)
+    cached = route_to_aggregates(db, sql_query)
+    if cached is None and cache is not None:
+        cached = cache.get(sql_query)
+    if cached is not None:
+        columns, all_rows = cached
+        has_more = len(all_rows) > stop and (max_rows is None or stop < max_rows)
+        return columns, all_rows[start:stop], has_more
+
+    columns, rows, seen = [], [], 0
+    # Read one row past the page so we know whether a next page exists
+    limit = stop + 1 if max_rows is None or stop < max_rows else stop
+    with timed_query(sql_query) as run, checkout(db, connection, sql_query) as connection:
+        connection = connection.execution_options(stream_results=True, max_row_buffer=chunk_size)
+        cursor = connection.execute(text(sql_query))
+        if not cursor.returns_rows:
+            return [], [], False
+        columns = list(cursor.keys())
+        # Every row so far, while the result may still fit the cache
+        kept = [] if cache is not None and is_current(db, connection) else None
+        for chunk in cursor.partitions(chunk_size):
+            chunk_start = seen
+            seen += len(chunk)
+            if seen > start:
+                rows.extend(chunk[max(start - chunk_start, 0):limit - chunk_start])
+            if kept is not None:
+                kept.extend(chunk)
+                if len(kept) > cache.max_entry_rows:
+                    kept = None  # Too large to cache, go back to reading only up to the page
+            if seen >= limit and kept is None:
+                break
+        run["rows"] = seen
+
+    if kept is not None:
+        # The loop only ends with rows still kept once the whole result has been read
+        all_rows = convert_decimal_columns(kept)
+        cache.set(sql_query, columns, all_rows)
+        has_more = len(all_rows) > stop and (max_rows is None or stop < max_rows)
+        return columns, all_rows[start:stop], has_more
+    has_more = seen > stop and (max_rows is None or stop < max_rows)
+    return columns, convert_decimal_columns(rows[:max(stop - start, 0)]), has_more
+
+
+def fetch_frame(db, sql_query, chunk_size=1000, max_rows=None, cache=None, connection=None):
+    """Executes the SQL query and returns the result as a DataFrame built from typed column arrays.
+
+    Each fetched chunk is turned into NumPy arrays straight away, so the row tuples of only one
+    chunk are alive at a time; the chunks are joined per column at the end.
+    """
+    from frames import build_frame, column_array, concatenate, object_array
+
+    cached = route_to_aggregates(db, sql_query)
+    if cached is None and cache is not None:
+        cached = cache.get(sql_query)
+    if cached is not None:
+        columns, rows = cached
+        return rows_to_frame(columns, rows[:max_rows] if max_rows is not None else rows)
+    metrics = get_metrics()
+    columns, chunks, fetched = [], [], 0
+    # sql_execution covers the fetches too, as in fetch_result; row_conversion is timed within it
+    with timed_query(sql_query) as run, checkout(db, connection, sql_query) as connection:
+        connection = connection.execution_options(stream_results=True, max_row_buffer=chunk_size)
+        cursor = connection.execute(text(sql_query))
+        if not cursor.returns_rows:
+            return build_frame([], [])
+        columns = list(cursor.keys())
+        for chunk in cursor.partitions(chunk_size):
+            if max_rows is not None:
+                chunk = chunk[:max_rows - fetched]
+            fetched += len(chunk)
+            with metrics.stage("row_conversion", rows=len(chunk)):
+                chunks.append([column_array(values) for values in zip(*chunk)])
+            if max_rows is not None and fetched >= max_rows:
+                break
+        run["rows"] = fetched
+    with metrics.stage("dataframe", rows=fetched):
+        if not chunks:
+            return build_frame(columns, [object_array([]) for _ in columns])
+        arrays = [concatenate([chunk[index] for chunk in chunks]) for index in range(len(columns))]
+        return build_frame(columns, arrays)
+
+
 def execute_sql_and_convert(db, sql_query):
     """Executes the SQL query and converts Decimal results to integers."""
     try:
-        # Get raw result from the database
-        result = db.run(sql_query)
-        
-        # If the result is empty, return an empty list
-        if not result or result == "[]":
-            return []
-            
-        # Convert Decimal values to integers/floats in the result
-        converted_result = []
-        
-        # Parse the result string to a Python object
-        rows = eval(result)  # Safe eval because result comes from SQLDatabase
-        
-        for row in rows:
-            converted_row = []
-            for item in row:
-                if isinstance(item, Decimal):
-                    converted_row.append(int(item) if item % 1 == 0 else float(item))
-                else:
-                    converted_row.append(item)
-            converted_result.append(tuple(converted_row))
-            
-        return converted_result
+        columns, rows = fetch_result(db, sql_query)
+        return rows
 
     except Exception as e:
         return f"Error executing SQL: {e}"
@@ -165,6 +466,12 @@ if __name__ == "__main__":
         sql_query = get_gemini_response(question, prompt, api_key)
         print(f"Generated SQL Query: {sql_query}")
 
+        # Vet the query (read-only, LIMIT, EXPLAIN cost) before it reaches the database
+        guarded = guard_sql(db, sql_query)
+        for warning in guarded.warnings:
+            print(f"Warning: {warning}")
+        sql_query = guarded.sql_query
+
         # Execute the SQL query and convert decimals
         result = execute_sql_and_convert(db, sql_query)
         print(f"Result: {result}")
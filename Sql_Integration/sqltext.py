@@ -0,0 +1,390 @@
+import re
+
+# Order matters: literals and comments first so keywords inside them are never matched
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    | (?P<string>'(?:[^'\\]|\\.|'')*')
+    | (?P<quoted>`(?:[^`]|``)*`|"(?:[^"]|"")*")
+    | (?P<number>\d+(?:\.\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<space>\s+)
+    | (?P<symbol>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+KEYWORDS = {
+    "select", "distinct", "from", "where", "and", "or", "not", "in", "is", "null", "like", "between",
+    "group", "by", "order", "asc", "desc", "having", "limit", "offset", "join", "inner", "left", "right",
+    "outer", "cross", "on", "as", "union", "all", "case", "when", "then", "else", "end", "with",
+    "count", "sum", "avg", "min", "max", "exists",
+}
+
+
+def tokenize(sql_query, positions=False):
+    """Yields (kind, text) tokens, skipping comments and whitespace.
+
+    With positions=True each token also carries its (start, end) offsets in sql_query.
+    """
+    for match in TOKEN_PATTERN.finditer(sql_query):
+        kind = match.lastgroup
+        if kind in ("comment", "space"):
+            continue
+        if positions:
+            yield kind, match.group(), match.start(), match.end()
+        else:
+            yield kind, match.group()
+
+
+def strip_code_fences(text):
+    """Removes the Markdown code fence models often wrap SQL in (```sql ... ```)."""
+    text = text.strip()
+    match = re.match(r"^```[A-Za-z]*\s*\n?(.*?)\n?```$", text, re.DOTALL)
+    return match.group(1).strip() if match else text
+
+
+def split_statements(sql_query):
+    """Splits sql_query on top-level semicolons, returning the non-empty statements."""
+    statements, start = [], 0
+    for kind, value, token_start, token_end in tokenize(sql_query, positions=True):
+        if kind == "symbol" and value == ";":
+            statements.append(sql_query[start:token_start])
+            start = token_end
+    statements.append(sql_query[start:])
+    return [statement.strip() for statement in statements if list(tokenize(statement))]
+
+
+def unquote(identifier):
+    """Strips backticks or double quotes from an identifier."""
+    if identifier[:1] in ("`", '"') and identifier[-1:] == identifier[:1]:
+        return identifier[1:-1]
+    return identifier
+
+
+def normalize_sql(sql_query):
+    """Returns a canonical form of sql_query for use as a cache key.
+
+    Comments, redundant whitespace and a trailing semicolon are dropped and keywords are
+    lowercased; literals and identifier case are kept since they can change the result.
+    """
+    parts = []
+    for kind, value in tokenize(sql_query):
+        if kind == "word" and value.lower() in KEYWORDS:
+            value = value.lower()
+        parts.append(value)
+    while parts and parts[-1] == ";":
+        parts.pop()
+    return " ".join(parts)
+
+
+def table_aliases(sql_query):
+    """Returns {name_or_alias: table} for every table after FROM or JOIN (schema prefixes dropped)."""
+    tokens = list(tokenize(sql_query))
+    aliases = {}
+    index = 0
+    while index < len(tokens):
+        kind, value = tokens[index]
+        index += 1
+        if kind != "word" or value.lower() not in ("from", "join"):
+            continue
+        # FROM may list several comma-separated tables, each optionally aliased
+        while index < len(tokens):
+            kind, value = tokens[index]
+            if kind not in ("word", "quoted") or (kind == "word" and value.lower() in KEYWORDS):
+                break  # A subquery or something that is not a table name
+            name = unquote(value)
+            index += 1
+            while index + 1 < len(tokens) and tokens[index][1] == "." and tokens[index + 1][0] in ("word", "quoted"):
+                name = unquote(tokens[index + 1][1])
+                index += 2
+            aliases[name] = name
+            # Skip an optional alias
+            if index < len(tokens) and tokens[index][1].lower() == "as":
+                index += 1
+            if index < len(tokens) and tokens[index][0] in ("word", "quoted") and tokens[index][1].lower() not in KEYWORDS:
+                aliases[unquote(tokens[index][1])] = name
+                index += 1
+            if index < len(tokens) and tokens[index][1] == ",":
+                index += 1
+                continue
+            break
+    return aliases
+
+
+def referenced_tables(sql_query):
+    """Returns the set of table names that appear after FROM or JOIN (schema prefixes dropped)."""
+    return set(table_aliases(sql_query).values())
+
+
+# Keywords that start a clause, which predicate_columns uses to tell filters from grouping and ordering
+CLAUSE_KEYWORDS = {"select": "select", "from": "from", "join": "from", "where": "filter", "on": "filter",
+                   "having": "filter", "group": "group", "order": "order", "limit": "limit", "union": "select"}
+RANGE_OPERATORS = {"<", ">", "<=", ">=", "between"}
+
+
+def _read_operator(tokens, index):
+    """Returns (operator, next_index) for the comparison starting at tokens[index], or (None, index)."""
+    if index >= len(tokens):
+        return None, index
+    kind, value = tokens[index]
+    if kind == "word" and value.lower() in ("in", "between", "like", "is"):
+        return value.lower(), index + 1
+    operator = ""
+    while index < len(tokens) and tokens[index][0] == "symbol" and tokens[index][1] in "<>=!":
+        operator += tokens[index][1]
+        index += 1
+    return operator or None, index
+
+
+def predicate_columns(sql_query):
+    """Returns (table, column, role) for every column a query filters, groups or orders on.
+
+    role is "equality" (=, IN, IS, <=>, joins), "range" (<, >, BETWEEN, LIKE without a leading
+    wildcard), "group" or "order". table is resolved through the FROM aliases; it is None for an
+    unqualified column when the query reads several tables.
+    """
+    tokens = list(tokenize(sql_query))
+    aliases = table_aliases(sql_query)
+    only_table = next(iter(set(aliases.values()))) if len(set(aliases.values())) == 1 else None
+    columns = []
+    clause = None
+    index = 0
+    while index < len(tokens):
+        kind, value = tokens[index]
+        if kind == "word" and value.lower() in CLAUSE_KEYWORDS:
+            clause = CLAUSE_KEYWORDS[value.lower()]
+            index += 1
+            continue
+        is_name = kind == "quoted" or (kind == "word" and value.lower() not in KEYWORDS)
+        if not is_name or (index + 1 < len(tokens) and tokens[index + 1][1] == "("):
+            index += 1  # Not a column, or a function name
+            continue
+
+        start = index
+        qualifier, column = None, unquote(value)
+        index += 1
+        if index + 1 < len(tokens) and tokens[index][1] == "." and tokens[index + 1][0] in ("word", "quoted"):
+            qualifier, column = column, unquote(tokens[index + 1][1])
+            index += 2
+        table = aliases.get(qualifier) if qualifier else only_table
+
+        if clause in ("group", "order"):
+            columns.append((table, column, clause))
+        elif clause == "filter":
+            operator, after = _read_operator(tokens, index)
+            if operator is None:
+                # 'Nike' = brand or a.id = b.id: read the operator to the left instead, flipping its direction
+                left = start
+                while left > 0 and tokens[left - 1][0] == "symbol" and tokens[left - 1][1] in "<>=!":
+                    left -= 1
+                operator = "".join(token[1] for token in tokens[left:start]) or None
+                operator = {"<": ">", ">": "<", "<=": ">=", ">=": "<="}.get(operator, operator)
+            if operator in ("=", "<=>", "in", "is"):
+                columns.append((table, column, "equality"))
+            elif operator in RANGE_OPERATORS:
+                columns.append((table, column, "range"))
+            elif operator == "like" and after < len(tokens) and tokens[after][0] == "string" \
+                    and not tokens[after][1][1:].startswith(("%", "_")):
+                columns.append((table, column, "range"))  # A fixed prefix can use an index
+    return columns
+
+AGGREGATE_FUNCTIONS = {"count", "sum", "avg", "min", "max"}
+
+
+class _Parser:
+    """Cursor over the tokens of one statement for parse_simple_select."""
+
+    def __init__(self, sql_query):
+        self.sql_query = sql_query
+        self.tokens = list(tokenize(sql_query, positions=True))
+        self.index = 0
+
+    def peek(self, offset=0):
+        index = self.index + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, "", len(self.sql_query), len(self.sql_query))
+
+    def accept(self, *words):
+        """Consumes the next token if it is one of words (case-insensitive) and returns it."""
+        kind, value = self.peek()[:2]
+        if value.lower() in words and (kind == "word" or kind == "symbol"):
+            self.index += 1
+            return value.lower()
+        return None
+
+    def identifier(self):
+        kind, value = self.peek()[:2]
+        if kind == "quoted" or (kind == "word" and value.lower() not in KEYWORDS):
+            self.index += 1
+            return unquote(value)
+        return None
+
+    def column(self):
+        """Parses [qualifier.]name and returns name."""
+        name = self.identifier()
+        if name is not None and self.peek()[1] == "." and self.peek(1)[0] in ("word", "quoted"):
+            self.index += 1
+            name = self.identifier()
+        return name
+
+    def literal(self):
+        kind, value = self.peek()[:2]
+        if kind == "string" and "\\" not in value:  # Backslash escapes differ between dialects
+            self.index += 1
+            return value[1:-1].replace("''", "'")
+        if kind == "number":
+            self.index += 1
+            return float(value) if "." in value else int(value)
+        return None
+
+    def alias(self):
+        if self.accept("as"):
+            return self.identifier()
+        return self.identifier()
+
+    def operator(self):
+        """Consumes a comparison operator made of <, >, = and ! symbols and returns it."""
+        operator = ""
+        while self.peek()[0] == "symbol" and self.peek()[1] in "<>=!":
+            operator += self.peek()[1]
+            self.index += 1
+        return operator or None
+
+
+def _parse_select_item(parser):
+    start = parser.peek()[2]
+    function = parser.peek()[1].lower()
+    if parser.peek()[0] == "word" and function in AGGREGATE_FUNCTIONS and parser.peek(1)[1] == "(":
+        parser.index += 2
+        distinct = parser.accept("distinct") is not None
+        if parser.accept("*"):
+            if function != "count" or distinct:
+                return None
+            column = "*"
+        else:
+            column = parser.column()
+        if column is None or not parser.accept(")"):
+            return None
+    else:
+        function, distinct = None, False
+        column = "*" if parser.accept("*") else parser.column()
+        if column is None:
+            return None
+    name = parser.sql_query[start:parser.peek(-1)[3]]
+    alias = parser.alias()
+    if alias is None and function is None:
+        name = column  # Drivers report a bare column under its unquoted name
+    return {"name": alias or name, "function": function, "column": column, "distinct": distinct}
+
+
+def parse_simple_select(sql_query):
+    """Parses a single-table SELECT with aggregates, simple filters and GROUP BY.
+
+    Understands `SELECT [DISTINCT] items FROM table [WHERE condition [AND ...]] [GROUP BY cols]
+    [ORDER BY refs [ASC|DESC]] [LIMIT n]`, where each item is `*`, a column or COUNT/SUM/AVG/MIN/MAX
+    of a column (COUNT(*) and COUNT(DISTINCT col) included), optionally aliased, and each condition
+    compares a column to literals with =, IN, <, <=, >, >= or BETWEEN. Equality filters are listed
+    under "where" as (column, values), comparisons under "ranges" as (column, operator, value).
+    Returns a dict describing the query, or None for anything else.
+    """
+    parser = _Parser(sql_query)
+    if not parser.accept("select"):
+        return None
+    query = {"distinct": parser.accept("distinct") is not None, "select": [], "where": [], "ranges": [],
+             "group_by": [], "order_by": [], "limit": None}
+    while True:
+        item = _parse_select_item(parser)
+        if item is None:
+            return None
+        query["select"].append(item)
+        if not parser.accept(","):
+            break
+
+    if not parser.accept("from"):
+        return None
+    query["table"] = parser.column()
+    if query["table"] is None:
+        return None
+    parser.alias()
+
+    if parser.accept("where"):
+        while True:
+            column = parser.column()
+            if column is None:
+                value = parser.literal()
+                operator = parser.operator()
+                column = parser.column()  # 'Nike' = brand or 10 < price, read the other way round
+                operator = {"<": ">", ">": "<", "<=": ">=", ">=": "<="}.get(operator, operator)
+            elif parser.accept("in"):
+                if not parser.accept("("):
+                    return None
+                operator, value = "in", [parser.literal()]
+                while parser.accept(","):
+                    value.append(parser.literal())
+                if not parser.accept(")"):
+                    return None
+            elif parser.accept("between"):
+                low = parser.literal()
+                if not parser.accept("and"):
+                    return None
+                operator, value = "between", [low, parser.literal()]
+            else:
+                operator = parser.operator()
+                value = parser.literal()
+
+            values = value if isinstance(value, list) else [value]
+            if column is None or None in values:
+                return None
+            if operator in ("=", "in"):
+                query["where"].append((column, values))
+            elif operator == "between":
+                query["ranges"] += [(column, ">=", values[0]), (column, "<=", values[1])]
+            elif operator in ("<", "<=", ">", ">="):
+                query["ranges"].append((column, operator, value))
+            else:
+                return None
+            if not parser.accept("and"):
+                break
+
+    if parser.accept("group"):
+        if not parser.accept("by"):
+            return None
+        while True:
+            column = parser.column()
+            if column is None:
+                return None
+            query["group_by"].append(column)
+            if not parser.accept(","):
+                break
+
+    if parser.accept("order"):
+        if not parser.accept("by"):
+            return None
+        while True:
+            kind, value = parser.peek()[:2]
+            if kind == "number":
+                parser.index += 1
+                reference = int(value)  # 1-based position in the select list
+            else:
+                start = parser.peek()[2]
+                item = _parse_select_item(parser)
+                if item is None:
+                    return None
+                # An aggregate in ORDER BY refers to the select item written the same way
+                reference = item["name"] if item["function"] is None else parser.sql_query[start:parser.peek(-1)[3]]
+            descending = parser.accept("desc") is not None
+            if not descending:
+                parser.accept("asc")
+            query["order_by"].append((reference, descending))
+            if not parser.accept(","):
+                break
+
+    if parser.accept("limit"):
+        kind, value = parser.peek()[:2]
+        if kind != "number" or "." in value:
+            return None
+        parser.index += 1
+        query["limit"] = int(value)
+
+    parser.accept(";")
+    return query if parser.index == len(parser.tokens) else None
@@ -0,0 +1,121 @@
+"""Measures cold start: import time per module and time per setup step.
+
+    python startup.py                          # imports of sql.py, then the app's setup steps
+    python startup.py --module service --top 20
+
+Imports are timed in a fresh interpreter with -X importtime, so nothing this script has loaded
+skews them. With STARTUP_PROFILE=1 the Streamlit app shows the setup steps its process ran.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def profile_enabled():
+    """Whether STARTUP_PROFILE asks the app to show its startup profile."""
+    return os.environ.get("STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+class StartupProfile:
+    """Wall-clock seconds per setup step; only the first, cold run of each step is kept."""
+
+    def __init__(self):
+        self.steps = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.steps.setdefault(name, time.perf_counter() - start)
+
+    def report(self):
+        with self._lock:
+            return dict(self.steps)
+
+
+_profile = StartupProfile()
+
+
+def get_startup_profile():
+    """Returns the process-wide startup profile."""
+    return _profile
+
+
+def import_times(modules):
+    """Imports modules in a fresh interpreter and returns [(module, depth, self_seconds, cumulative_seconds)]."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        cwd=HERE, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, len(indent) // 2, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return entries
+
+
+def by_package(entries):
+    """Sums self time per top-level package, which is what each dependency costs in total, slowest first."""
+    totals = {}
+    for name, _, self_seconds, _ in entries:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0.0) + self_seconds
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile_setup(profile):
+    """Runs the app's setup steps once in this process, timing each one."""
+    with profile.step("imports"):
+        import sql
+        from metrics import get_metrics
+        from stats import collect_stats
+
+    with profile.step("env_load"):
+        _, db_uri = sql.load_environment_variables()
+    with profile.step("engine_creation"):
+        db = sql.get_db(db_uri)
+        db._engine.connect().close()
+    with profile.step("reflection"):
+        db.get_table_count()
+    with profile.step("metrics"):
+        get_metrics()
+        collect_stats(db._engine)  # What the app's background thread collects first
+    return profile.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="Module to import (repeatable, default sql)")
+    parser.add_argument("--top", type=int, default=15, help="Packages to list")
+    args = parser.parse_args()
+    modules = args.module or ["sql"]
+
+    entries = import_times(modules)
+    total = sum(cumulative for _, depth, _, cumulative in entries if depth == 0)
+    print(f"Importing {', '.join(modules)}: {total * 1000:.0f} ms in a fresh interpreter")
+    for package, seconds in by_package(entries)[:args.top]:
+        print(f"  {package:<40} {seconds * 1000:8.1f} ms")
+
+    print("Setup steps:")
+    for name, seconds in profile_setup(StartupProfile()).items():
+        print(f"  {name:<40} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+
+def _mysql_stats(connection):
+    rows = connection.execute(
+        text(
+            "SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+            "WHERE table_schema = DATABASE() AND TABLE_TYPE = 'BASE TABLE'"
+        )
+    )
+    tables = {
+        name: {"rows": int(row_count or 0), "data_bytes": int(data or 0), "index_bytes": int(index or 0)}
+        for name, row_count, data, index in rows
+    }
+    total = sum(table["data_bytes"] + table["index_bytes"] for table in tables.values())
+    return total, tables
+
+
+def _postgresql_stats(connection):
+    rows = connection.execute(
+        text(
+            "SELECT c.relname, c.reltuples, pg_table_size(c.oid), pg_indexes_size(c.oid) "
+            "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema()"
+        )
+    )
+    tables = {
+        # reltuples is -1 for tables that were never vacuumed or analyzed
+        name: {"rows": max(int(row_count), 0), "data_bytes": int(data), "index_bytes": int(index)}
+        for name, row_count, data, index in rows
+    }
+    total = connection.execute(text("SELECT pg_database_size(current_database())")).scalar()
+    return int(total), tables
+
+
+def _sqlite_stats(connection):
+    page_size = connection.execute(text("PRAGMA page_size")).scalar()
+    total = connection.execute(text("PRAGMA page_count")).scalar() * page_size
+    objects = connection.execute(
+        text("SELECT type, name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')")
+    ).fetchall()
+    tables = {
+        name: {"rows": None, "data_bytes": None, "index_bytes": None}
+        for kind, name, _ in objects if kind == "table" and not name.startswith("sqlite_")
+    }
+
+    try:
+        # dbstat is an optional SQLite extension; without it only the total size is known
+        sizes = dict(connection.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")).fetchall())
+        for table in tables.values():
+            table["data_bytes"] = table["index_bytes"] = 0
+        for kind, name, table_name in objects:
+            if table_name in tables:
+                tables[table_name]["data_bytes" if kind == "table" else "index_bytes"] += sizes.get(name, 0)
+    except Exception:
+        pass
+
+    estimates = {}
+    if connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")).scalar():
+        # The first number of each stat row is ANALYZE's row count for the table
+        for table_name, stat in connection.execute(text("SELECT tbl, stat FROM sqlite_stat1")):
+            estimates[table_name] = int(stat.split()[0])
+    quote = connection.dialect.identifier_preparer.quote
+    for name, table in tables.items():
+        table["rows"] = estimates[name] if name in estimates else connection.execute(
+            text(f"SELECT COUNT(*) FROM {quote(name)}")
+        ).scalar()
+    return total, tables
+
+
+STATS_COLLECTORS = {"mysql": _mysql_stats, "postgresql": _postgresql_stats, "sqlite": _sqlite_stats}
+
+
+def collect_stats(engine):
+    """Reads total size plus per-table row estimates, data size and index size from the catalog.
+
+    Returns {"database_bytes", "index_bytes", "tables", "collected_at", "seconds"}, or None when
+    the dialect is not supported.
+    """
+    collector = STATS_COLLECTORS.get(engine.dialect.name)
+    if collector is None:
+        return None
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        total, tables = collector(connection)
+    return {
+        "database_bytes": total,
+        "index_bytes": sum(table["index_bytes"] or 0 for table in tables.values()),
+        "tables": tables,
+        "collected_at": time.time(),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+class DatabaseStats:
+    """Keeps database statistics fresh from a background thread.
+
+    snapshot() only ever returns what was last collected, so callers such as the dashboard never
+    wait on catalog queries. The thread collects on start and then every interval seconds.
+    """
+
+    def __init__(self, engine, interval=300):
+        self.engine = engine
+        self.interval = interval
+        self.error = None
+        self._snapshot = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._collected = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="database-stats", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def refresh(self):
+        """Collects statistics now and returns them; errors keep the previous snapshot."""
+        try:
+            snapshot = collect_stats(self.engine)
+            self._snapshot, self.error = snapshot, None
+        except Exception as e:
+            print(f"Error collecting database statistics: {e}")
+            self.error = str(e)
+        self._collected.set()
+        return self._snapshot
+
+    def snapshot(self, wait=0):
+        """Returns the latest statistics, waiting up to wait seconds for the first collection; None if none yet."""
+        if wait:
+            self._collected.wait(wait)
+        return self._snapshot
+
+
+_database_stats = {}  # engine URL -> DatabaseStats, so one thread serves every session
+_database_stats_lock = threading.Lock()
+
+
+def get_database_stats(engine):
+    """Returns the shared, started DatabaseStats for engine, refreshed every DB_STATS_INTERVAL seconds."""
+    key = engine.url.render_as_string(hide_password=False)
+    with _database_stats_lock:
+        stats = _database_stats.get(key)
+        if stats is None:
+            stats = DatabaseStats(engine, interval=float(os.environ.get("DB_STATS_INTERVAL", 300)))
+            _database_stats[key] = stats
+        return stats.start()
@@ -1,25 +1,85 @@
 import streamlit as st
 import pandas as pd
 import sql  # Import the backend logic from sql.py
-from sql import CustomSQLDatabase
+from cache import ResponseCache, ResultCache
+from prompt_builder import PromptBuilder
+from examples import ExampleStore, parse_examples
+from metrics import get_metrics
+from guard import UnsafeQueryError, check_read_only, guard_sql, load_guard_settings
+from executor import QueryCancelledError, QueryExecutor
+from aggregates import get_aggregate_cube
+from fastpath import get_slot_filler
+from reuse import SessionResultStore
+from routing import get_router
+from export import EXPORT_FORMATS, available_formats, export_result, read_export, remove_export
+from startup import by_package, get_startup_profile, import_times, profile_enabled
 import time
 from datetime import datetime
-import random
-import re  # Import regular expressions module
 
-# Load API Key, DB URI and create DB object
-try:
-    api_key, db_uri = sql.load_environment_variables()
-    db = sql.get_db(db_uri)  # Create the primary database object
-    prompt = sql.get_prompt()  # Load the prompt
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
+    """Shares one NL->SQL response cache across reruns and sessions."""
+    return ResponseCache.from_env()
+
+
+@st.cache_resource(show_spinner=False)
+def load_resources():
+    """Loads settings and the database object once per process; every rerun and session reuses them."""
+    startup_profile = get_startup_profile()
+    with startup_profile.step("env_load"):
+        api_key, db_uri = sql.load_environment_variables()
+    with startup_profile.step("engine_creation"):
+        db = sql.get_db(db_uri)  # Backed by the shared, pooled engine for db_uri
+    return api_key, db_uri, db
+
+
+@st.cache_resource(show_spinner=False)
+def get_result_cache():
+    """Shares one query result cache across reruns and sessions."""
+    return ResultCache.from_env(load_resources()[2]._engine)
+
+
+@st.cache_resource(show_spinner=False)
+def get_query_executor():
+    """Shares one worker pool for query execution across reruns and sessions."""
+    return QueryExecutor.from_env()
+
 
-    # Initialize CustomSQLDatabase using from_uri
-    csql = CustomSQLDatabase.from_uri(db_uri)
+@st.cache_resource(show_spinner=False)
+def get_example_store():
+    """Shares the few-shot example store, seeded with the hand-written examples, across sessions."""
+    return ExampleStore.from_env(seeds=parse_examples(sql.PROMPT_EXAMPLES))
 
-    # Get dynamic metrics
-    num_tables = csql.get_table_count()
-    database_size = csql.get_database_size()
-    execution_time = csql.get_execution_time("SELECT 1")  # Or a simple query
+
+@st.cache_resource(show_spinner=False)
+def get_prompt_builder():
+    """Shares one schema-aware prompt builder (and its relevance index) across reruns and sessions."""
+    db = load_resources()[2]
+    return PromptBuilder.from_env(db.schema_cache, examples=sql.PROMPT_EXAMPLES, example_store=get_example_store())
+
+
+# Load API Key, DB URI and create DB object
+try:
+    api_key, db_uri, db = load_resources()
+    prompt_builder = get_prompt_builder()  # Builds a prompt with only the relevant tables per question
+    example_store = get_example_store()
+    result_settings = sql.load_result_settings()
+    guard_settings = load_guard_settings()
+
+    # Get dynamic metrics; both come from in-memory caches, so reruns never wait on the catalog
+    startup_profile = get_startup_profile()  # Keeps only the first run of each step, i.e. the cold start
+    with startup_profile.step("reflection"):
+        num_tables = db.get_table_count()
+    with startup_profile.step("metrics"):
+        database_stats = db.stats.snapshot()
+        metrics = get_metrics()  # Process-wide, so the figures cover every session
+
+    response_cache = get_response_cache()
+    result_cache = get_result_cache()
+    if "result_store" not in st.session_state:
+        st.session_state["result_store"] = SessionResultStore.from_env(db._engine, result_cache)
+    result_store = st.session_state["result_store"]  # This session's recent results, for answering follow-ups locally
+    query_executor = get_query_executor()
 
 except ValueError as e:
     st.error(str(e))  # Display error message if loading fails
@@ -246,6 +306,57 @@ with st.sidebar:
     with col2:
         st.markdown(datetime.now().strftime('%H:%M:%S'))
 
+    cache_stats = response_cache.stats()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("Cache Hits")
+    with col2:
+        st.markdown(f"{cache_stats['hits']} / {cache_stats['hits'] + cache_stats['misses']}")
+
+    result_stats = result_cache.stats()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("Result Cache")
+    with col2:
+        st.markdown(f"{result_stats['hits']} hits ({result_stats['bytes_saved'] / (1024 * 1024):.1f} MB saved)")
+
+    session_stats = result_store.stats()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("Session Reuse")
+    with col2:
+        st.markdown(f"{session_stats['hits']} follow-ups answered locally ({session_stats['bytes'] / (1024 * 1024):.1f} MB held)")
+
+    aggregate_cube = get_aggregate_cube(db._engine)
+    if aggregate_cube is not None:
+        aggregate_stats = aggregate_cube.stats()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("Aggregates")
+        with col2:
+            st.markdown(f"{aggregate_stats['hits']} queries answered ({aggregate_stats['cells']} cells)")
+
+    router = get_router(db._engine)
+    if router is not None:
+        for source in router.stats():
+            state = " (down)" if source["down"] else " (lagging)" if source["lag"] is None or source["lag"] > router.max_lag else ""
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown(f"{source['name'].title()} DB")
+            with col2:
+                latency = f", p95 {source['p95_ms']} ms" if source["p95_ms"] is not None else ""
+                st.markdown(f"{source['reads']} reads, {source['in_use']} in use{latency}{state}")
+
+    slot_filler = get_slot_filler(db._engine)
+    if slot_filler is not None:
+        fast_path_stats = slot_filler.stats()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("Fast Path")
+        with col2:
+            st.markdown(f"{fast_path_stats['hits']} / {fast_path_stats['hits'] + fast_path_stats['misses']} "
+                        f"({fast_path_stats['hit_rate']:.0%}) without Gemini")
+
     st.markdown('---')
     st.markdown("[View Documentation](https://docs.streamlit.io/)")
     st.markdown("Developed by: [Varun Paunikar]")
@@ -262,13 +373,111 @@ st.markdown('<p class="pulsating" style="color: #94a3b8;">AI-powered natural lan
 metrics_cols = st.columns(4)
 with metrics_cols[0]:
     st.metric(label="Available Tables", value=num_tables, delta=None)
+stage_stats = metrics.summary()
+sql_stats = stage_stats.get("sql_execution")
 with metrics_cols[1]:
-    st.metric(label="Query Response Time", value=f"{execution_time}s", delta=None)
+    response_time = f"{sql_stats['p50']:.3f}s" if sql_stats else "—"
+    st.metric(label="Query Response Time (p50)", value=response_time, delta=None)
 with metrics_cols[2]:
-    random_success_rate = round(random.uniform(90, 100), 1)
-    st.metric(label="Query Success Rate", value=f"{random_success_rate}%", delta=None)
+    success_rate = f"{sql_stats['success_rate'] * 100:.1f}%" if sql_stats else "—"
+    st.metric(label="Query Success Rate", value=success_rate, delta=None)
 with metrics_cols[3]:
-    st.metric(label="Database Size", value=f"{database_size} MB", delta=None)
+    database_size = f"{database_stats['database_bytes'] / (1024 * 1024):.2f} MB" if database_stats else "Collecting..."
+    st.metric(label="Database Size", value=database_size, delta=None)
+
+with st.expander("Table statistics"):
+    if database_stats:
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "table": name,
+                        "rows": table["rows"],
+                        "data (MB)": None if table["data_bytes"] is None else round(table["data_bytes"] / (1024 * 1024), 2),
+                        "indexes (MB)": None if table["index_bytes"] is None else round(table["index_bytes"] / (1024 * 1024), 2),
+                    }
+                    for name, table in sorted(database_stats["tables"].items())
+                ]
+            )
+        )
+        st.caption(f"Collected at {datetime.fromtimestamp(database_stats['collected_at']).strftime('%H:%M:%S')} in {database_stats['seconds']}s")
+    else:
+        st.markdown("Statistics are still being collected.")
+
+with st.expander("Index advice"):
+    # On demand only: the advisor runs EXPLAIN and counts distinct values for every candidate
+    if st.button("Analyze query history"):
+        from advisor import IndexAdvisor  # Only needed on demand
+
+        try:
+            st.session_state["index_advice"] = IndexAdvisor.from_env(db).recommend()
+        except Exception as e:
+            st.error(f"Error analyzing query history: {e}")
+    advice = st.session_state.get("index_advice")
+    if advice:
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "statement": item["statement"],
+                        "queries": item["queries"],
+                        "executions": item["executions"],
+                        "logged (s)": round(item["logged_seconds"], 2),
+                        "est. saved (s)": round(item["estimated_seconds_saved"], 2),
+                    }
+                    for item in advice
+                ]
+            )
+        )
+        st.caption("Apply with `python advisor.py --apply` against a QUERY_LOG_PATH log.")
+    elif advice is not None:
+        st.markdown("No index recommendations for the queries run so far.")
+
+if profile_enabled():
+    with st.expander("Startup profile"):
+        st.dataframe(
+            pd.DataFrame(
+                [{"step": name, "ms": round(seconds * 1000, 1)} for name, seconds in startup_profile.report().items()]
+            )
+        )
+        # Timed in a fresh interpreter, since this process has long finished importing
+        if st.button("Measure imports"):
+            try:
+                st.session_state["import_times"] = by_package(import_times(["sql"]))
+            except Exception as e:
+                st.error(f"Error measuring imports: {e}")
+        if st.session_state.get("import_times"):
+            st.dataframe(
+                pd.DataFrame(
+                    [{"package": name, "ms": round(seconds * 1000, 1)} for name, seconds in st.session_state["import_times"][:15]]
+                )
+            )
+
+with st.expander("Performance by stage"):
+    if stage_stats:
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "stage": name,
+                        "count": stats["count"],
+                        "errors": stats["errors"],
+                        "p50 (ms)": round(stats["p50"] * 1000, 1),
+                        "p95 (ms)": round(stats["p95"] * 1000, 1),
+                        "p99 (ms)": round(stats["p99"] * 1000, 1),
+                    }
+                    for name, stats in stage_stats.items()
+                ]
+            )
+        )
+        st.download_button(
+            label="Download Prometheus snapshot",
+            data=metrics.to_prometheus(),
+            file_name="metrics.prom",
+            mime="text/plain",
+        )
+    else:
+        st.markdown("No queries have run yet.")
 
 st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
 col1, col2 = st.columns([3, 1])  # Divide main content into columns
@@ -298,101 +507,212 @@ with col2:
 
 st.markdown('</div>', unsafe_allow_html=True)
 
+def change_page(step):
+    """Moves the result view forward or back by one page."""
+    st.session_state["page"] = max(0, st.session_state.get("page", 0) + step)
+
+
+def reset_page():
+    st.session_state["page"] = 0
+
+
+def export_to_file(sql_query, export_format, connection=None):
+    """Streams the whole result into a temporary file in export_format; see export.export_result."""
+    return export_result(
+        db, sql_query, export_format,
+        chunk_size=result_settings["chunk_size"], max_rows=result_settings["max_rows"],
+        cache=result_store, connection=connection,
+    )
+
+
+def keep_export(exported):
+    """Remembers the session's export file, removing the one it replaces."""
+    previous = st.session_state.get("export_path")
+    if previous and previous != exported["path"]:
+        remove_export(previous)
+    st.session_state["export_path"] = exported["path"]
+
+
+def run_in_background(name, key, fn, *args, submit=None, **kwargs):
+    """Returns the session's query handle called name, starting fn on the executor unless it already runs key.
+
+    submit defaults to query_executor.submit; exports pass query_executor.submit_export.
+    """
+    handle = st.session_state.get(name)
+    if handle is None or handle.key != key:
+        if handle is not None:
+            handle.cancel()  # The user moved on, so stop the old query on the server
+        handle = (submit or query_executor.submit)(db._engine, fn, *args, key=key, **kwargs)
+        st.session_state[name] = handle
+    return handle
+
+
+def start_export(sql_query, export_format):
+    """Starts streaming the result into a file; exports only run when the user asks for one."""
+    # A large export can take longer than the interactive query deadline, so it gets its own
+    run_in_background("export_query", (sql_query, export_format), export_to_file, sql_query, export_format,
+                      submit=query_executor.submit_export)
+
+
+def wait_for(handle, status):
+    """Shows status(handle) until the background query finishes, then reruns the page to show its result.
+
+    The check is a fragment that reruns on its own every POLL_INTERVAL seconds, so waiting only
+    re-renders this one line rather than the whole page.
+    """
+    @st.fragment(run_every=POLL_INTERVAL)
+    def show_status():
+        if handle.done():
+            st.rerun()
+        st.info(status(handle))
+
+    show_status()
+
+
+def cancel_queries():
+    """Stops this session's running queries."""
+    for name in ("page_query", "export_query"):
+        handle = st.session_state.get(name)
+        if handle is not None:
+            handle.cancel()
+
+
+def confirm_example():
+    """Stores the current question and its SQL as a verified example for similar questions."""
+    example = st.session_state.pop("example", None)
+    if example is not None:
+        example_store.add(*example)
+        st.session_state["example_saved"] = True
+
+
+POLL_INTERVAL = 0.5  # Seconds between checks on a running background query
+
 # If submit is clicked
 if submit:
     try:
-        with st.spinner("Generating SQL query with Gemini AI..."):
-            time.sleep(1)
-            sql_query = sql.get_gemini_response(question, prompt, api_key)
+        sql_query = sql.route_to_fast_path(db, question)  # Templated questions skip the Gemini round trip
+        if sql_query is None:
+            with st.spinner("Generating SQL query with Gemini AI..."):
+                with metrics.stage("prompt_build"):
+                    # The last question and its SQL let Gemini write a follow-up as a refinement of it
+                    prompt = prompt_builder.build(question, previous=st.session_state.get("previous_query"))
+                sql_query = sql.get_gemini_response(question, prompt, api_key, cache=response_cache)
+        with st.spinner("Checking query..."), metrics.stage("sql_guard"):
+            guarded = guard_sql(db, sql_query, guard_settings)
+        st.session_state["sql_query"] = guarded.sql_query
+        st.session_state["sql_warnings"] = guarded.warnings
+        # The generated statement, before the guard's LIMIT, is what gets stored if the user confirms it
+        st.session_state["example"] = (question, check_read_only(sql_query))
+        st.session_state["previous_query"] = st.session_state["example"]
+        st.session_state.pop("example_saved", None)
+        st.session_state["page"] = 0
+        cancel_queries()
+        st.session_state.pop("page_query", None)
+        st.session_state.pop("export_query", None)
+    except UnsafeQueryError as e:
+        st.session_state.pop("sql_query", None)
+        st.code(sql_query, language="sql")
+        st.error(f"Query blocked: {e}")
+    except Exception as e:
+        st.error(f"An error occurred: {e}")
+
+# Keep showing the last result so page navigation survives reruns
+if "sql_query" in st.session_state:
+    sql_query = st.session_state["sql_query"]
+    try:
         st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
         st.subheader("Generated SQL Query:")
         st.code(sql_query, language="sql")
+        for warning in st.session_state.get("sql_warnings", []):
+            st.warning(warning)
         st.markdown('</div>', unsafe_allow_html=True)
 
-        with st.spinner("Executing query on database..."):
-            time.sleep(0.5)
-            result = sql.execute_sql_and_convert(db, sql_query)
-
         st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
         st.subheader("Query Result:")
 
-        # Convert the result to a DataFrame
-        try:
-            df = pd.DataFrame(result)
-            
-            if not df.empty:  # Check if we have data
-                # Extract columns from SQL query for SELECT statements
-                columns_from_query = []
-                
-                # Look for SELECT pattern in the query
-                select_pattern = re.search(r'SELECT\s+(.*?)\s+FROM', sql_query, re.IGNORECASE)
-                
-                if select_pattern:
-                    select_clause = select_pattern.group(1).strip()
-                    
-                    # Handle SELECT * case
-                    if select_clause == '*':
-                        # Get table name
-                        match = re.search(r'FROM\s+[`"]?(\w+)[`"]?', sql_query, re.IGNORECASE)
-                        table_name = match.group(1) if match else None
-                        
-                        if table_name:
-                            # Get all columns from the table
-                            columns_from_query = csql.get_columns_for_table(table_name)
-                    else:
-                        # Handle COUNT, SUM, etc.
-                        if re.search(r'(count|sum|avg|min|max)\(', select_clause.lower()):
-                            # For aggregated functions, use the function name as column
-                            agg_pattern = re.search(r'(count|sum|avg|min|max)\(\s*(.*?)\s*\)', select_clause, re.IGNORECASE)
-                            if agg_pattern:
-                                func_name = agg_pattern.group(1)
-                                col_name = agg_pattern.group(2)
-                                if col_name == '*':
-                                    columns_from_query = [f"{func_name.upper()}"]
-                                else:
-                                    columns_from_query = [f"{func_name.upper()}_{col_name}"]
-                        else:
-                            # For normal SELECT clauses, split by commas
-                            cols = select_clause.split(',')
-                            columns_from_query = [col.strip().replace('`', '') for col in cols]
-                
-                # Assign column names
-                if columns_from_query and len(columns_from_query) >= len(df.columns):
-                    df.columns = columns_from_query[:len(df.columns)]
+        page_size_options = sorted({50, 100, 500, 1000, result_settings["page_size"]})
+        page_size = st.selectbox(
+            "Rows per page",
+            page_size_options,
+            index=page_size_options.index(result_settings["page_size"]),
+            key="page_size",
+            on_change=reset_page,
+        )
+        page = st.session_state.get("page", 0)
+
+        # Only the visible page is read into memory; the query runs on a worker so the page stays responsive
+        page_query = run_in_background(
+            "page_query", (sql_query, page, page_size),
+            sql.fetch_page, db, sql_query, page, page_size,
+            chunk_size=result_settings["chunk_size"], max_rows=result_settings["max_rows"],
+            cache=result_store,  # Narrower follow-ups are derived from this session's earlier results
+        )
+        if not page_query.wait(0.5):
+            wait_for(page_query, lambda handle: f"Executing query on database... ({handle.elapsed:.0f}s)")
+            st.button("Cancel query", on_click=cancel_queries)
+        else:
+            columns, rows, has_more = page_query.result()
+
+            # Convert the result to a DataFrame using the column names reported by the cursor
+            try:
+                df = sql.rows_to_frame(columns, rows)
+
+                st.dataframe(df)
+                first_row = page * page_size + 1
+                st.markdown(
+                    f"Showing records **{first_row}–{first_row + len(rows) - 1}**{' of more' if has_more else ''} "
+                    f"in **{df.shape[1]}** columns" if rows else f"No records in **{df.shape[1]}** columns"
+                )
+
+                nav_cols = st.columns([1, 1, 4])
+                with nav_cols[0]:
+                    st.button("Previous", on_click=change_page, args=(-1,), disabled=page == 0)
+                with nav_cols[1]:
+                    st.button("Next", on_click=change_page, args=(1,), disabled=not has_more)
+                with nav_cols[2]:
+                    st.markdown(f"Page **{page + 1}**")
+
+                if "example" in st.session_state:
+                    st.button("✅ Result is correct", on_click=confirm_example,
+                              help="Saves this question and query as an example for similar questions")
+                elif st.session_state.get("example_saved"):
+                    st.caption(f"Saved as an example ({len(example_store)} stored).")
+
+                # Add download button; the export streams into a temporary file, never one string in memory,
+                # and only runs once the user asks for it
+                export_format = st.selectbox(
+                    "Export format", available_formats(),
+                    format_func=lambda name: EXPORT_FORMATS[name][0], key="export_format",
+                )
+                label, extension, mime = EXPORT_FORMATS[export_format]
+                export_query = st.session_state.get("export_query")
+                if export_query is not None and export_query.key != (sql_query, export_format):
+                    export_query.cancel()  # The format changed; stop an export nobody will download
+                    export_query = None
+                if export_query is None or export_query.cancelled:
+                    st.button(f"Prepare {label} download", on_click=start_export, args=(sql_query, export_format))
+                elif not export_query.done():
+                    wait_for(export_query, lambda handle: f"Preparing {label} download... ({handle.elapsed:.0f}s)")
                 else:
-                    # If we can't extract columns from query, try using table columns
-                    match = re.search(r'FROM\s+[`"]?(\w+)[`"]?', sql_query, re.IGNORECASE)
-                    table_name = match.group(1) if match else None
-                    
-                    if table_name:
-                        try:
-                            table_columns = csql.get_columns_for_table(table_name)
-                            if table_columns and len(table_columns) >= len(df.columns):
-                                df.columns = table_columns[:len(df.columns)]
-                            else:
-                                df.columns = [f"column_{i+1}" for i in range(len(df.columns))]
-                        except Exception as e:
-                            print(f"Error getting column names: {e}")
-                            df.columns = [f"column_{i+1}" for i in range(len(df.columns))]
-                    else:
-                        df.columns = [f"column_{i+1}" for i in range(len(df.columns))]
-
-            st.dataframe(df)
-
-            # Add download button
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="Download data as CSV",
-                data=csv,
-                file_name="t_shirt_data.csv",
-                mime="text/csv",
-            )
-            st.markdown(f"Found **{len(df)}** records in **{df.shape[1]}** columns")
-        except Exception as e:
-            st.write(result)
-            st.error(f"Error processing data: {e}")
+                    exported = export_query.result()
+                    keep_export(exported)
+                    st.download_button(
+                        label=f"Download data as {label}",
+                        data=lambda path=exported["path"]: read_export(path),  # Read only when clicked
+                        file_name="t_shirt_data" + extension,
+                        mime=mime,
+                    )
+                    row_count = exported["rows"]
+                    capped = " (row cap reached)" if row_count >= result_settings["max_rows"] else ""
+                    st.markdown(f"Found **{row_count}** records{capped} in **{df.shape[1]}** columns")
+                    st.caption(f"{label} export: {exported['bytes'] / (1024 * 1024):.2f} MB in {exported['seconds']:.2f}s")
+            except Exception as e:
+                st.write(rows)
+                st.error(f"Error processing data: {e}")
 
         st.markdown('</div>', unsafe_allow_html=True)
+    except QueryCancelledError:
+        st.warning("Query cancelled.")
     except Exception as e:
         st.error(f"An error occurred: {e}")
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are flat files run from Sql_Integration, so import them the same way
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Sql_Integration"))
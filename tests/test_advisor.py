@@ -0,0 +1,33 @@
+import json
+import sqlite3
+
+import pytest
+
+import sql
+from advisor import IndexAdvisor
+from querylog import QueryLog
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "shop.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE t_shirts (t_shirt_id INTEGER PRIMARY KEY, brand TEXT, price INTEGER)")
+        connection.executemany("INSERT INTO t_shirts (brand, price) VALUES (?, ?)",
+                               [(brand, price) for brand in ("Nike", "Levi", "Adidas") for price in range(10, 60)])
+    return sql.get_db(f"sqlite:///{path}")
+
+
+@pytest.mark.parametrize("sql_query", [
+    "SELECT brand FROM t_shirts WHERE price >= 50",
+    "SELECT brand FROM t_shirts WHERE price <= 15",
+    "SELECT price FROM t_shirts WHERE brand = 'Nike' AND price >= 50",
+])
+def test_multi_character_operators_are_explained(db, sql_query, tmp_path):
+    path = tmp_path / "query_log.jsonl"
+    log = QueryLog(path=str(path))
+    log.record(sql_query, 2.0)
+    assert json.loads(path.read_text())["sample"] == sql_query
+    for query_log in (log, QueryLog.load(path)):
+        recommendations = IndexAdvisor(db, query_log).recommend()
+        assert [recommendation["example"] for recommendation in recommendations] == [sql_query]
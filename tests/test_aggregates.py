@@ -0,0 +1,132 @@
+import random
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import aggregates
+from aggregates import AggregateCube, mysql_average, mysql_fold
+
+BRANDS = ["Van Huesen", "Levi", "Nike", "Adidas"]
+COLORS = ["Red", "Blue", "Black", "White"]
+SIZES = ["XS", "S", "M", "L", "XL"]
+
+QUERIES = [
+    "SELECT SUM(stock_quantity) FROM t_shirts WHERE brand = 'Nike' AND color = 'White' AND size = 'XS'",
+    "SELECT COUNT(*) FROM t_shirts WHERE brand IN ('Levi', 'Adidas')",
+    "SELECT brand, SUM(stock_quantity) FROM t_shirts GROUP BY brand",
+    "SELECT size, COUNT(*), MIN(price), MAX(price) FROM t_shirts WHERE color = 'Red' GROUP BY size ORDER BY size",
+    "SELECT brand, AVG(price) FROM t_shirts GROUP BY brand ORDER BY 2 DESC LIMIT 2",
+    "SELECT DISTINCT size FROM t_shirts WHERE brand = 'Adidas'",
+    "SELECT COUNT(DISTINCT color) FROM t_shirts WHERE size = 'M'",
+    "SELECT SUM(price) FROM t_shirts WHERE brand = 'Puma'",
+    "SELECT COUNT(price), SUM(price) FROM t_shirts WHERE brand = 'Levi'",
+]
+
+
+def insert_rows(connection, rng, first_id, count):
+    connection.executemany(
+        "INSERT INTO t_shirts VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (row_id, rng.choice(BRANDS), rng.choice(COLORS), rng.choice(SIZES),
+             rng.choice([None, rng.randint(7, 50)]), rng.randint(0, 100))
+            for row_id in range(first_id, first_id + count)
+        ],
+    )
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "shop.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE t_shirts (t_shirt_id INTEGER PRIMARY KEY, brand TEXT, color TEXT, size TEXT, "
+            "price INTEGER, stock_quantity INTEGER)"
+        )
+        insert_rows(connection, random.Random(0), 1, 500)
+    return create_engine(f"sqlite:///{path}")
+
+
+def cube_for(engine, **kwargs):
+    return AggregateCube(engine, "t_shirts", ["brand", "color", "size"], ["stock_quantity", "price"], key="t_shirt_id", **kwargs)
+
+
+def from_database(engine, query):
+    with engine.connect() as connection:
+        return [tuple(row) for row in connection.execute(text(query))]
+
+
+def assert_same(engine, cube, query):
+    columns, rows = cube.answer(query)
+    expected = from_database(engine, query)
+    if "ORDER BY" not in query:
+        rows, expected = sorted(rows, key=repr), sorted(expected, key=repr)
+    assert rows == pytest.approx(expected), query
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_cube_answers_match_the_database(engine, query):
+    assert_same(engine, cube_for(engine), query)
+
+
+def test_cube_still_matches_after_an_incremental_update(engine):
+    cube = cube_for(engine, check_interval=0)
+    cube.answer(QUERIES[0])
+    with sqlite3.connect(engine.url.database) as connection:
+        insert_rows(connection, random.Random(1), 501, 100)
+    for query in QUERIES:
+        assert_same(engine, cube, query)
+    assert cube.stats()["incremental_updates"] == 1 and cube.stats()["rebuilds"] == 1
+
+
+def test_cube_checks_the_table_even_when_update_time_has_not_moved(engine, monkeypatch):
+    # MySQL 8 can report the same UPDATE_TIME for up to a day after a write
+    monkeypatch.setattr(aggregates, "get_table_versions", lambda engine: {"t_shirts": ("2026-01-01 10:00:00", None)})
+    cube = cube_for(engine, check_interval=0)
+    cube.answer(QUERIES[0])
+    with sqlite3.connect(engine.url.database) as connection:
+        insert_rows(connection, random.Random(1), 501, 100)
+    assert_same(engine, cube, QUERIES[2])
+    assert cube.stats()["incremental_updates"] == 1
+
+
+def test_cube_orders_text_by_the_mysql_collation(engine):
+    with sqlite3.connect(engine.url.database) as connection:
+        connection.execute("UPDATE t_shirts SET brand = 'adidas' WHERE brand = 'Adidas'")
+    cube = cube_for(engine)
+    cube._fold = mysql_fold  # As on MySQL, where 'adidas' sorts before 'Levi'
+    columns, rows = cube.answer("SELECT brand, COUNT(*) FROM t_shirts GROUP BY brand ORDER BY brand")
+    assert [row[0] for row in rows] == ["adidas", "Levi", "Nike", "Van Huesen"]
+
+
+def test_cube_passes_on_queries_it_cannot_answer(engine):
+    cube = cube_for(engine)
+    assert cube.answer("SELECT * FROM t_shirts WHERE brand = 'Nike'") is None
+    assert cube.answer("SELECT SUM(stock_quantity) FROM t_shirts WHERE price > 20") is None
+
+
+def test_cube_keeps_answering_while_another_thread_refreshes(engine):
+    cube = cube_for(engine, check_interval=0)
+    cube.answer(QUERIES[0])
+    answered = []
+    with cube._lock:  # As if a refresh were running
+        worker = threading.Thread(target=lambda: answered.append(cube.answer(QUERIES[2])))
+        worker.start()
+        worker.join(timeout=5)
+    assert answered and answered[0] is not None
+
+
+def test_mysql_fold_ignores_case_and_accents_but_not_trailing_spaces():
+    assert mysql_fold("Café") == mysql_fold("CAFE")
+    assert mysql_fold("Nike ") != mysql_fold("Nike")
+    assert mysql_fold(20) == 20
+
+
+def test_mysql_average_keeps_the_sum_scale_plus_four():
+    from decimal import Decimal
+
+    assert mysql_average(Decimal("70"), 3) == Decimal("23.3333")
+    assert mysql_average(Decimal("1"), 32) == Decimal("0.0313")  # Half away from zero
+    assert mysql_average(Decimal("10.05"), 3) == Decimal("3.350000")
+    assert mysql_average(7.0, 2) == 3.5
@@ -0,0 +1,115 @@
+import pytest
+from sqlalchemy import create_engine
+
+import cache
+from cache import ResponseCache, ResultCache, normalize_question, question_words
+
+
+def test_normalize_question_folds_case_whitespace_and_trailing_punctuation():
+    assert normalize_question("  How many   Nike T-shirts?  ") == "how many nike t-shirts"
+    assert normalize_question("Show white shirts.") == normalize_question("show WHITE shirts")
+
+
+def test_normalize_question_keeps_operators_and_signs():
+    pairs = [
+        ("products with price > 20", "products with price < 20"),
+        ("stock != 0", "stock = 0"),
+        ("price >= 20", "price > 20"),
+        ("discount of -5", "discount of 5"),
+        ("price above 10.5", "price above 105"),
+    ]
+    for first, second in pairs:
+        assert normalize_question(first) != normalize_question(second)
+
+
+def test_response_cache_keys_differ_for_opposite_comparisons():
+    prompt = ["schema"]
+    assert ResponseCache.make_key("price > 20", prompt, "model") != ResponseCache.make_key("price < 20", prompt, "model")
+    assert ResponseCache.make_key("Price > 20?", prompt, "model") == ResponseCache.make_key("price > 20", prompt, "model")
+
+
+def test_question_words_drops_punctuation_for_matching():
+    assert question_words("Levi's t-shirts, size 10.5?") == ["levi", "s", "t", "shirts", "size", "10.5"]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache.time, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    current = {"t_shirts": ("2026-01-01 10:00:00", None)}
+    monkeypatch.setattr(cache, "get_table_versions", lambda engine: dict(current))
+    return current
+
+
+def test_result_cache_expires_after_ttl_without_versions(clock):
+    results = ResultCache(create_engine("sqlite://"), ttl=60)
+    results.set("SELECT * FROM t_shirts", ["brand"], [("Nike",)])
+    clock.now += 59
+    assert results.get("select *  from t_shirts") == (["brand"], [("Nike",)])
+    clock.now += 2
+    assert results.get("SELECT * FROM t_shirts") is None
+    assert results.stats()["entries"] == 0
+
+
+def test_result_cache_drops_entries_when_a_table_version_changes(clock, versions):
+    results = ResultCache(create_engine("sqlite://"), ttl=60, check_interval=5)
+    results.set("SELECT * FROM t_shirts", ["brand"], [("Nike",)])
+    assert results.get("SELECT * FROM t_shirts") is not None
+    versions["t_shirts"] = ("2026-01-01 10:00:01", None)
+    assert results.get("SELECT * FROM t_shirts") is not None  # Versions are re-read every check_interval
+    clock.now += 5
+    assert results.get("SELECT * FROM t_shirts") is None
+
+
+def test_result_cache_ttl_bounds_entries_whose_versions_still_match(clock, versions):
+    results = ResultCache(create_engine("sqlite://"), ttl=60, check_interval=5)
+    results.set("SELECT * FROM t_shirts", ["brand"], [("Nike",)])
+    clock.now += 61
+    assert results.get("SELECT * FROM t_shirts") is None
+
+
+def test_result_cache_reads_versions_without_holding_its_lock(versions, monkeypatch):
+    results = ResultCache(create_engine("sqlite://"), check_interval=0)
+    locked = []
+
+    def record_lock(engine):
+        locked.append(results._lock.locked())
+        return dict(versions)
+
+    monkeypatch.setattr(cache, "get_table_versions", record_lock)
+    results.set("SELECT * FROM t_shirts", ["brand"], [("Nike",)])
+    assert results.get("SELECT * FROM t_shirts") is not None
+    assert locked == [False, False]
+
+
+@pytest.mark.parametrize("lag, cached", [(0, 1), (5, 0)])
+def test_result_cache_skips_rows_from_a_lagging_replica(tmp_path, monkeypatch, lag, cached):
+    import shutil
+    import sqlite3
+
+    import sql
+
+    primary = tmp_path / "primary.db"
+    with sqlite3.connect(primary) as connection:
+        connection.execute("CREATE TABLE t_shirts (brand TEXT)")
+        connection.execute("INSERT INTO t_shirts VALUES ('Nike')")
+    shutil.copy(primary, tmp_path / "replica.db")
+    monkeypatch.setenv("DATABASE_REPLICAS", f"replica=sqlite:///{tmp_path / 'replica.db'}")
+    monkeypatch.setenv("REPLICA_LAG_QUERY", f"SELECT {lag}")
+    db = sql.get_db(f"sqlite:///{primary}")
+    results = ResultCache(db._engine)
+    assert sql.fetch_result(db, "SELECT brand FROM t_shirts", cache=results) == (["brand"], [("Nike",)])
+    assert results.stats()["entries"] == cached
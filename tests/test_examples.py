@@ -0,0 +1,17 @@
+from examples import ExampleStore
+
+
+def test_examples_with_opposite_comparisons_are_kept_apart():
+    store = ExampleStore()
+    store.add("Products with price > 20", "SELECT * FROM t_shirts WHERE price > 20")
+    store.add("Products with price < 20", "SELECT * FROM t_shirts WHERE price < 20")
+    store.add("products with price < 20?", "SELECT * FROM t_shirts WHERE price < 20 ORDER BY price")
+    assert len(store) == 2
+
+
+def test_examples_reload_from_disk_under_current_keys(tmp_path):
+    path = str(tmp_path / "examples.db")
+    ExampleStore(db_path=path).add("Stock != 0", "SELECT * FROM t_shirts WHERE stock_quantity != 0")
+    reloaded = ExampleStore(db_path=path)
+    assert len(reloaded) == 1
+    assert reloaded.search("stock != 0", k=1)[0][2] == "SELECT * FROM t_shirts WHERE stock_quantity != 0"
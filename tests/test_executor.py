@@ -0,0 +1,30 @@
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+from executor import QueryExecutor
+
+
+def test_deadline_starts_when_a_worker_picks_the_query_up(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}")
+    executor = QueryExecutor(max_workers=1, timeout=0.5)
+    release = threading.Event()
+    blocker = executor.submit(engine, lambda connection: release.wait(5))
+    queued = executor.submit(engine, lambda connection: "done")
+    time.sleep(0.8)  # Longer than the deadline, all of it spent waiting for the busy worker
+    release.set()
+    assert blocker.result(timeout=5) is True
+    assert queued.result(timeout=5) == "done"
+    assert not queued.timed_out
+    executor.shutdown()
+
+
+def test_exports_have_their_own_deadline(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}")
+    executor = QueryExecutor(max_workers=2, timeout=0.2)
+    export = executor.submit_export(engine, lambda connection: time.sleep(0.5) or "exported")
+    assert export.timeout is None
+    assert export.result(timeout=5) == "exported"
+    assert not export.timed_out
+    executor.shutdown()
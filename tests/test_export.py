@@ -0,0 +1,41 @@
+import csv
+import gzip
+import io
+from decimal import Decimal
+
+import pytest
+
+from export import CsvEncoder, ParquetEncoder
+
+
+def test_parquet_keeps_a_fraction_that_first_appears_in_a_later_chunk():
+    pq = pytest.importorskip("pyarrow.parquet")
+    file = io.BytesIO()
+    encoder = ParquetEncoder(file)
+    encoder.write(["t_shirt_id", "price"], [(1, Decimal("20.00")), (2, Decimal("15"))])
+    encoder.write(["t_shirt_id", "price"], [(3, Decimal("19.99")), (4, None)])
+    encoder.close()
+    table = pq.read_table(io.BytesIO(file.getvalue()))
+    assert table.column("price").to_pylist() == [20.0, 15.0, 19.99, None]
+    assert table.column("t_shirt_id").to_pylist() == [1, 2, 3, 4]
+
+
+def test_parquet_fails_rather_than_truncating():
+    pa = pytest.importorskip("pyarrow")
+    encoder = ParquetEncoder(io.BytesIO())
+    encoder.write(["stock_quantity"], [(10,), (20,)])
+    with pytest.raises(pa.ArrowInvalid):
+        encoder.write(["stock_quantity"], [(19.99,)])
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_csv_round_trips_decimals(compress):
+    file = io.BytesIO()
+    encoder = CsvEncoder(file, compress=compress)
+    encoder.write(["brand", "price"], [("Nike", Decimal("20.00"))])
+    encoder.write(["brand", "price"], [("Levi", Decimal("19.99")), ("Adidas", None)])
+    encoder.close()
+    data = gzip.decompress(file.getvalue()) if compress else file.getvalue()
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8"))))
+    assert rows[0] == ["brand", "price"]
+    assert [Decimal(price) if price else None for _, price in rows[1:]] == [Decimal("20.00"), Decimal("19.99"), None]
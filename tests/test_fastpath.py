@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+from fastpath import SlotFiller
+
+
+@pytest.fixture
+def filler(tmp_path):
+    path = tmp_path / "shop.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE t_shirts (t_shirt_id INTEGER PRIMARY KEY, brand TEXT, color TEXT, size TEXT, "
+            "price INTEGER, stock_quantity INTEGER)"
+        )
+        connection.executemany(
+            "INSERT INTO t_shirts (brand, color, size, price, stock_quantity) VALUES (?, ?, ?, ?, ?)",
+            [("Nike", "White", "XS", 20, 10), ("Levi", "Black", "M", 30, 5), ("Adidas", "Red", "L", 25, 7)],
+        )
+    return SlotFiller(create_engine(f"sqlite:///{path}"), "t_shirts", ["brand", "color", "size"], "stock_quantity", "price")
+
+
+def test_templated_question_is_answered_locally(filler):
+    assert filler.answer("How many t-shirts do we have left for Nike in extra small size and white color?") == (
+        """SELECT SUM("stock_quantity") FROM "t_shirts" WHERE "brand" = 'Nike' AND "size" = 'XS' AND "color" = 'White'"""
+    )
+
+
+@pytest.mark.parametrize("question", [
+    "How many t-shirts do we have left for the Puma brand in extra small size and white color?",
+    "How many t-shirts do we have left for the Gucci brand in all of the different sizes?",
+])
+def test_unknown_value_beside_a_column_goes_to_gemini(filler, question):
+    assert filler.match(question) is None
+    assert filler.answer(question) is None
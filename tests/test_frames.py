@@ -0,0 +1,42 @@
+from decimal import Decimal
+
+import numpy as np
+
+from frames import MAX_EXACT_FLOAT, column_array, concatenate
+
+
+def test_whole_decimals_become_int64():
+    array = column_array((Decimal("20.00"), Decimal("-3"), Decimal("15")))
+    assert array.dtype == np.int64
+    assert array.tolist() == [20, -3, 15]
+
+
+def test_decimals_with_a_fraction_become_float64():
+    array = column_array((Decimal("19.99"), None, Decimal("20")))
+    assert array.dtype == np.float64
+    assert array[0] == 19.99 and np.isnan(array[1]) and array[2] == 20
+
+
+def test_wholeness_is_checked_on_the_decimals():
+    values = (Decimal("1.0000000000000001"), Decimal("2"))
+    array = column_array(values)  # float64 would make both whole
+    assert array.dtype == object
+    assert array.tolist() == list(values)
+
+
+def test_decimals_float64_cannot_hold_stay_decimals():
+    values = (Decimal("0.12345678901234567"), Decimal("0.5"))
+    assert column_array(values).tolist() == list(values)
+
+
+def test_large_whole_decimals_stay_exact():
+    big = Decimal(MAX_EXACT_FLOAT + 1)
+    assert column_array((big, Decimal(1))).tolist() == [MAX_EXACT_FLOAT + 1, 1]
+    assert column_array((big, None)).tolist() == [MAX_EXACT_FLOAT + 1, None]
+    assert column_array((Decimal(2 ** 70),)).tolist() == [2 ** 70]
+
+
+def test_chunks_of_one_column_promote_together():
+    joined = concatenate([column_array((Decimal("20"),)), column_array((Decimal("19.99"),))])
+    assert joined.dtype == np.float64
+    assert joined.tolist() == [20.0, 19.99]
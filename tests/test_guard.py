@@ -0,0 +1,81 @@
+import pytest
+
+import guard
+from guard import UnsafeQueryError, _collect_scan_rows, check_read_only, enforce_limit, guard_sql
+
+
+@pytest.mark.parametrize("sql_query, expected", [
+    ("SELECT * FROM t_shirts", "SELECT * FROM t_shirts"),
+    ("```sql\nSELECT brand FROM t_shirts;\n```", "SELECT brand FROM t_shirts"),
+    ("WITH nike AS (SELECT * FROM t_shirts WHERE brand = 'Nike') SELECT * FROM nike",
+     "WITH nike AS (SELECT * FROM t_shirts WHERE brand = 'Nike') SELECT * FROM nike"),
+    ("SELECT * FROM t_shirts WHERE brand = 'drop table'", "SELECT * FROM t_shirts WHERE brand = 'drop table'"),
+])
+def test_check_read_only_accepts_one_select(sql_query, expected):
+    assert check_read_only(sql_query).strip() == expected
+
+
+@pytest.mark.parametrize("sql_query", [
+    "DELETE FROM t_shirts",
+    "SELECT * FROM t_shirts; DROP TABLE t_shirts",
+    "SELECT * INTO OUTFILE '/tmp/x' FROM t_shirts",
+    "SELECT SLEEP(10)",
+    "SELECT * FROM t_shirts FOR UPDATE",
+    "WITH gone AS (DELETE FROM t_shirts RETURNING *) SELECT * FROM gone",
+    "",
+])
+def test_check_read_only_rejects_everything_else(sql_query):
+    with pytest.raises(UnsafeQueryError):
+        check_read_only(sql_query)
+
+
+@pytest.mark.parametrize("statement, expected", [
+    ("SELECT * FROM t_shirts", "SELECT * FROM t_shirts LIMIT 100"),
+    ("SELECT * FROM t_shirts LIMIT 10", "SELECT * FROM t_shirts LIMIT 10"),
+    ("SELECT * FROM t_shirts LIMIT 5000", "SELECT * FROM t_shirts LIMIT 100"),
+    ("SELECT * FROM t_shirts LIMIT 5, 10", "SELECT * FROM t_shirts LIMIT 5, 10"),
+    ("SELECT * FROM t_shirts LIMIT 0, 99999999", "SELECT * FROM t_shirts LIMIT 0, 100"),
+    ("SELECT * FROM t_shirts -- every shirt", "SELECT * FROM t_shirts LIMIT 100 -- every shirt"),
+    ("SELECT * FROM t_shirts\n# every shirt", "SELECT * FROM t_shirts LIMIT 100\n# every shirt"),
+    ("SELECT * FROM (SELECT * FROM t_shirts LIMIT 5000) AS t", "SELECT * FROM (SELECT * FROM t_shirts LIMIT 5000) AS t LIMIT 100"),
+])
+def test_enforce_limit_caps_the_outer_query(statement, expected):
+    assert enforce_limit(statement, 100) == expected
+
+
+def test_seq_scans_count_the_whole_relation():
+    plan = {
+        "Node Type": "Hash Join",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Schema": "public", "Relation Name": "t_shirts", "Plan Rows": 12},
+            {"Node Type": "Index Scan", "Schema": "public", "Relation Name": "discounts", "Plan Rows": 3},
+        ],
+    }
+    assert _collect_scan_rows(plan) == 15
+    assert _collect_scan_rows(plan, {("public", "t_shirts"): 2000000.0}) == 2000003
+    # Never analyzed: reltuples is -1, so the planner's own estimate stands
+    assert _collect_scan_rows(plan, {("public", "t_shirts"): -1.0}) == 15
+
+
+def test_guard_explains_on_the_read_engine(monkeypatch):
+    explained = []
+    monkeypatch.setattr(guard, "estimate_rows_scanned", lambda engine, statement: explained.append(engine) or 10)
+
+    class Database:
+        _engine = "primary"
+        read_engine = "replica"
+
+    result = guard_sql(Database(), "SELECT * FROM t_shirts", {"row_limit": 100, "warn_rows": 5, "max_rows": 50, "explain": True})
+    assert explained == ["replica"]
+    assert result.sql_query == "SELECT * FROM t_shirts LIMIT 100"
+    assert result.estimated_rows == 10 and result.warnings
+
+
+def test_guard_refuses_queries_estimated_over_max_rows(monkeypatch):
+    monkeypatch.setattr(guard, "estimate_rows_scanned", lambda engine, statement: 1000)
+
+    class Database:
+        read_engine = None
+
+    with pytest.raises(UnsafeQueryError):
+        guard_sql(Database(), "SELECT * FROM t_shirts", {"row_limit": 100, "warn_rows": 5, "max_rows": 50, "explain": True})
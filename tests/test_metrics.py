@@ -0,0 +1,20 @@
+import pytest
+
+from metrics import STAGES, Metrics
+
+
+def test_record_accepts_only_known_stages():
+    metrics = Metrics()
+    for name in STAGES:
+        metrics.record(name, 0.01)
+    with pytest.raises(ValueError):
+        metrics.record("sql_exection", 0.01)
+
+
+def test_summary_total_covers_samples_outside_the_window():
+    metrics = Metrics(window=2)
+    for seconds in (1.0, 2.0, 3.0):
+        metrics.record("sql_execution", seconds)
+    stats = metrics.summary()["sql_execution"]
+    assert stats["count"] == 3 and stats["total"] == 6.0
+    assert stats["mean"] == 2.5  # The window holds only the last two
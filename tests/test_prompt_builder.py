@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+from cache import ResponseCache
+from prompt_builder import PromptBuilder
+from schema import SchemaCache
+
+PREVIOUS = ("How many Nike t-shirts are there?", "SELECT COUNT(*) FROM t_shirts WHERE brand = 'Nike'")
+
+
+@pytest.fixture
+def builder(tmp_path):
+    path = tmp_path / "shop.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE t_shirts (t_shirt_id INTEGER PRIMARY KEY, brand TEXT, color TEXT, price INTEGER)")
+    return PromptBuilder(SchemaCache(create_engine(f"sqlite:///{path}")))
+
+
+def test_standalone_question_keeps_the_same_prompt(builder):
+    question = "What is the price of Levi t-shirts?"
+    prompt = builder.build(question, previous=PREVIOUS)
+    assert prompt == builder.build(question)
+    assert ResponseCache.make_key(question, prompt, "model") == ResponseCache.make_key(question, builder.build(question), "model")
+
+
+@pytest.mark.parametrize("question", ["Now only the white ones", "What about Levi?", "Sort those by price"])
+def test_follow_up_gets_the_previous_query(builder, question):
+    assert PREVIOUS[1] in builder.build(question, previous=PREVIOUS)[0]
+
+
+def test_a_schema_swap_during_a_build_keeps_the_prompt_consistent(monkeypatch):
+    import prompt_builder
+
+    def table(column):
+        return {"columns": [{"name": column, "type": "TEXT"}], "primary_key": []}
+
+    class SwappingSchema:
+        engine = create_engine("sqlite://")
+        current = {"t_shirts": table("brand")}
+
+        def snapshot(self):
+            return self.current
+
+    schema = SwappingSchema()
+    builder = PromptBuilder(schema)
+    rank = prompt_builder.SchemaIndex.rank
+
+    def rank_then_swap(index, question):
+        ranked = rank(index, question)
+        if "t_shirts" in schema.current:
+            schema.current = {"hoodies": table("size")}  # Another session's build sees the new schema
+            builder.select_tables(question)
+        return ranked
+
+    monkeypatch.setattr(prompt_builder.SchemaIndex, "rank", rank_then_swap)
+    assert "`t_shirts`(`brand` TEXT)" in builder.build("Which brands are there?")[0]
@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+import sql
+from cache import ResultCache
+from reuse import SessionResultStore
+from sqltext import parse_simple_select
+
+
+@pytest.fixture
+def store():
+    return SessionResultStore(create_engine("sqlite://"))
+
+
+def implies(store, base, query):
+    return store._implies(parse_simple_select(base), parse_simple_select(query))
+
+
+@pytest.mark.parametrize("base, query", [
+    ("SELECT * FROM t_shirts", "SELECT * FROM t_shirts WHERE brand = 'Nike'"),
+    ("SELECT * FROM t_shirts WHERE brand IN ('Nike', 'Levi')", "SELECT * FROM t_shirts WHERE brand = 'Nike'"),
+    ("SELECT * FROM t_shirts WHERE price > 20", "SELECT * FROM t_shirts WHERE price > 30"),
+    ("SELECT * FROM t_shirts WHERE price > 20", "SELECT * FROM t_shirts WHERE price >= 21"),
+    ("SELECT * FROM t_shirts WHERE price >= 20", "SELECT * FROM t_shirts WHERE price > 20"),
+    ("SELECT * FROM t_shirts WHERE price < 20", "SELECT * FROM t_shirts WHERE price = 10"),
+])
+def test_narrower_queries_are_implied(store, base, query):
+    assert implies(store, base, query)
+
+
+@pytest.mark.parametrize("base, query", [
+    ("SELECT * FROM t_shirts WHERE brand = 'Nike'", "SELECT * FROM t_shirts"),
+    ("SELECT * FROM t_shirts WHERE brand = 'Nike'", "SELECT * FROM t_shirts WHERE brand IN ('Nike', 'Levi')"),
+    ("SELECT * FROM t_shirts WHERE price > 20", "SELECT * FROM t_shirts WHERE price < 30"),
+    ("SELECT * FROM t_shirts WHERE price > 20", "SELECT * FROM t_shirts WHERE price >= 20"),
+    ("SELECT * FROM t_shirts WHERE price > 20", "SELECT * FROM t_shirts WHERE price = 20"),
+    ("SELECT * FROM t_shirts WHERE price > 20", "SELECT * FROM t_shirts WHERE price = '30'"),
+    ("SELECT * FROM t_shirts WHERE brand > 'L'", "SELECT * FROM t_shirts WHERE brand > 'M'"),
+])
+def test_wider_or_incomparable_queries_are_not_implied(store, base, query):
+    assert not implies(store, base, query)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "shop.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE t_shirts (t_shirt_id INTEGER PRIMARY KEY, brand TEXT, price INTEGER)")
+        connection.executemany(
+            "INSERT INTO t_shirts (brand, price) VALUES (?, ?)",
+            [(("Nike", "Levi", "Adidas")[index % 3], 10 + index % 40) for index in range(250)],
+        )
+    return sql.get_db(f"sqlite:///{path}")
+
+
+def test_paging_reads_ahead_only_as_far_as_the_shared_cache(db):
+    store = SessionResultStore(db._engine, ResultCache(db._engine, max_entry_rows=50), max_rows=1000)
+    columns, rows, has_more = sql.fetch_page(db, "SELECT * FROM t_shirts", 0, 10, chunk_size=20, cache=store)
+    assert len(rows) == 10 and has_more
+    assert store.stats()["entries"] == 0  # 250 rows is over the shared limit, so page 1 did not read them all
+
+    for _ in sql.stream_result(db, "SELECT * FROM t_shirts", chunk_size=20, cache=store):
+        pass
+    assert store.stats()["entries"] == 1  # A full read keeps it for follow-ups
+    follow_up = "SELECT brand, price FROM t_shirts WHERE brand = 'Nike' AND price > 40 ORDER BY price"
+    columns, rows = store.get(follow_up)
+    assert store.stats()["hits"] == 1
+    assert rows == sql.fetch_result(db, follow_up)[1]
+
+
+def test_averages_are_rounded_like_mysql(store):
+    from aggregates import mysql_fold
+
+    store._dialect, store._fold = "mysql", mysql_fold  # As on a MySQL engine
+    store.set("SELECT * FROM t_shirts", ["brand", "price", "weight"],
+              [("Nike", 10, 0.5), ("Nike", 10, 0.25), ("Nike", 11, 0.5), ("Levi", 1, 0.5)] + [("Levi", 0, 0.5)] * 31)
+    columns, rows = store.get("SELECT brand, AVG(price) FROM t_shirts GROUP BY brand")
+    assert rows == [("Levi", 0.0313), ("Nike", 10.3333)]  # Four more digits than the INT column, half away from zero
+    assert store.get("SELECT brand, AVG(weight) FROM t_shirts GROUP BY brand") is None
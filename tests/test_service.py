@@ -0,0 +1,79 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+import sql
+from service import QueryService
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = tmp_path / "shop.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE t_shirts (t_shirt_id INTEGER PRIMARY KEY, brand TEXT, price INTEGER)")
+        connection.executemany("INSERT INTO t_shirts (brand, price) VALUES (?, ?)", [("Nike", 20), ("Levi", 30)])
+    return QueryService("test-key", sql.get_db(f"sqlite:///{path}"), db_concurrency=1)
+
+
+def test_generation_does_not_hold_a_db_slot(service):
+    async def run():
+        release = asyncio.Event()
+
+        async def slow(question):
+            await release.wait()  # Stands in for a Gemini call, rate limit wait or retry backoff
+            return "SELECT brand FROM t_shirts WHERE price = 20"
+
+        async def fast(question):
+            return "SELECT brand FROM t_shirts WHERE price = 30"
+
+        waiting = asyncio.ensure_future(service.answer("slow", generate=slow))
+        await asyncio.sleep(0.05)
+        answered = await asyncio.wait_for(service.answer("fast", generate=fast), timeout=5)
+        release.set()
+        return answered, await waiting
+
+    answered, waited = asyncio.run(run())
+    assert answered["rows"] == [["Levi"]]
+    assert waited["rows"] == [["Nike"]]
+
+
+def test_prompt_is_built_off_the_event_loop(service, monkeypatch):
+    built_on = []
+    monkeypatch.setattr(service.prompt_builder, "build", lambda question: built_on.append(threading.current_thread()) or ["prompt"])
+    monkeypatch.setattr(sql, "get_gemini_response", lambda question, prompt, api_key, cache=None, model=None: "SELECT 1")
+
+    assert asyncio.run(service.generate_sql("Which brands sell red t-shirts?", fast_path=False)) == "SELECT 1"
+    assert built_on and built_on[0] is not threading.main_thread()
+
+
+def test_batch_spends_rate_limit_tokens_only_on_cache_misses(service, monkeypatch):
+    from batch import BatchRunner
+
+    runner = BatchRunner(service)
+    spent = []
+
+    async def acquire():
+        spent.append(1)
+
+    monkeypatch.setattr(runner.bucket, "acquire", acquire)
+    monkeypatch.setattr(sql, "get_gemini_response", lambda question, prompt, api_key, cache=None, model=None: "SELECT 1")
+    question = "Which brands sell red t-shirts?"
+    assert asyncio.run(runner.generate_sql(question)) == "SELECT 1"
+    assert asyncio.run(runner.generate_sql(question)) == "SELECT 1"
+    assert len(spent) == 1
+    assert service.response_cache.stats()["hits"] == 1 and service.response_cache.stats()["misses"] == 1
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_malformed_content_length_is_a_bad_request(service, length):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(f"POST /query HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}".encode("latin-1"))
+        reader.feed_eof()
+        return await service._handle_request(reader)
+
+    status, _, body = asyncio.run(run())
+    assert status == 400
+    assert "Content-Length" in body
@@ -0,0 +1,56 @@
+import pytest
+
+from sqltext import normalize_sql, parse_simple_select, referenced_tables, split_statements, strip_code_fences
+
+
+def test_split_statements_ignores_semicolons_in_literals_and_comments():
+    assert split_statements("SELECT ';' FROM t_shirts; -- done;\nSELECT 2;") == ["SELECT ';' FROM t_shirts", "-- done;\nSELECT 2"]
+    assert split_statements(" ; ") == []
+
+
+def test_strip_code_fences():
+    assert strip_code_fences("```sql\nSELECT 1\n```") == "SELECT 1"
+    assert strip_code_fences("SELECT 1") == "SELECT 1"
+
+
+def test_normalize_sql_keeps_literals_and_drops_formatting():
+    assert normalize_sql("select *\n  FROM t_shirts -- all of them\n;") == normalize_sql("SELECT * FROM t_shirts")
+    assert normalize_sql("SELECT * FROM t_shirts WHERE brand = 'Nike'") != normalize_sql(
+        "SELECT * FROM t_shirts WHERE brand = 'nike'"
+    )
+    assert normalize_sql("SELECT * FROM t_shirts WHERE price > 20") != normalize_sql(
+        "SELECT * FROM t_shirts WHERE price < 20"
+    )
+
+
+def test_referenced_tables_covers_joins_and_subqueries():
+    assert referenced_tables(
+        "SELECT * FROM shop.t_shirts AS t JOIN discounts d ON t.t_shirt_id = d.t_shirt_id "
+        "WHERE t.brand IN (SELECT brand FROM brands)"
+    ) == {"t_shirts", "discounts", "brands"}
+
+
+def test_parse_simple_select():
+    query = parse_simple_select(
+        "SELECT brand, SUM(stock_quantity) AS total FROM `t_shirts` WHERE color = 'Red' AND size IN ('S', 'M') "
+        "AND price >= 20 GROUP BY brand ORDER BY total DESC LIMIT 5"
+    )
+    assert query["table"] == "t_shirts"
+    assert [(item["name"], item["function"], item["column"]) for item in query["select"]] == [
+        ("brand", None, "brand"), ("total", "sum", "stock_quantity"),
+    ]
+    assert query["where"] == [("color", ["Red"]), ("size", ["S", "M"])]
+    assert query["ranges"] == [("price", ">=", 20)]
+    assert query["group_by"] == ["brand"]
+    assert query["order_by"] == [("total", True)]
+    assert query["limit"] == 5
+
+
+@pytest.mark.parametrize("sql_query", [
+    "SELECT * FROM t_shirts JOIN discounts ON t_shirts.t_shirt_id = discounts.t_shirt_id",
+    "SELECT * FROM t_shirts WHERE brand = 'Nike' OR brand = 'Levi'",
+    "SELECT * FROM t_shirts WHERE brand IN (SELECT brand FROM brands)",
+    "DELETE FROM t_shirts",
+])
+def test_parse_simple_select_declines_other_queries(sql_query):
+    assert parse_simple_select(sql_query) is None